@@ -1,6 +1,13 @@
+import locale
+
 from gui import ShellGUI
 
 def main():
+    try:
+        # the fast ls builtin sorts like the real ls; set once here, before any worker thread starts
+        locale.setlocale(locale.LC_COLLATE, "")
+    except locale.Error:
+        pass
     app = ShellGUI()   # no arguments
     app.mainloop()
 
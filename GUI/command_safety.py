@@ -3,11 +3,19 @@ Command Safety Module for MagicShell
 Provides comprehensive warnings and safety checks for dangerous commands
 """
 
+import os
 import re
+import sys
 import tkinter as tk
 from tkinter import messagebox
 from typing import Tuple, List, Dict
 
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
+
+from pipeline import stages
+
 class CommandSafety:
     """Handles dangerous command detection and warnings"""
     
@@ -123,9 +131,10 @@ class CommandSafety:
         }
         
         # Check for dangerous command categories
+        stage_names = self._stage_commands(command)
         for category, info in self.DANGEROUS_COMMANDS.items():
             for dangerous_cmd in info["commands"]:
-                if self._command_matches(cmd_lower, dangerous_cmd):
+                if self._command_matches(cmd_lower, dangerous_cmd) or dangerous_cmd.lower() in stage_names:
                     analysis["is_dangerous"] = True
                     analysis["categories"].append(category)
                     analysis["warnings"].append({
@@ -190,6 +199,28 @@ class CommandSafety:
                 return True
         return False
     
+    def _stage_commands(self, command: str) -> set:
+        """Names of the programs run by each stage of a pipeline or command list"""
+        names = set()
+        for argv in stages(command):
+            # look through privilege wrappers like "sudo rm", "/limit cpu=5 rm" and "/par -j 4 rm"
+            if argv[0] == "/nocache" and len(argv) > 1:
+                argv = argv[1:]
+            if argv[0] == "/limit":
+                while len(argv) > 1 and (argv[0] == "/limit" or "=" in argv[0]):
+                    argv = argv[1:]
+            if argv[0] == "/par":
+                argv = argv[1:] or argv
+                if argv[0] in ("-j", "--jobs") and len(argv) > 2:
+                    argv = argv[2:]
+                elif argv[0].startswith(("-j", "--jobs=")) and len(argv) > 1:
+                    argv = argv[1:]
+                argv = argv[0].split() + argv[1:] or argv  # a quoted template: '/par "rm {}" ::: *'
+            while len(argv) > 1 and argv[0] in ("sudo", "doas"):
+                argv = argv[1:]
+            names.add(os.path.basename(argv[0]).lower())
+        return names
+    
     def _get_safety_suggestions(self, analysis: Dict) -> List[str]:
         """Generate safety suggestions based on analysis"""
         suggestions = []
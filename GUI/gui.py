@@ -1,19 +1,23 @@
+import atexit
 import os
 import platform
-import stat
-import shutil
-import subprocess
+import queue
+import time
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog
+from tkinter import font as tkfont
 
-from prompt_toolkit.completion import Completer, WordCompleter, PathCompleter, CompleteEvent
+from prompt_toolkit.completion import Completer, CompleteEvent
 from prompt_toolkit.document import Document
-from prompt_toolkit.history import InMemoryHistory
 
 from shell_core import ShellCore  # for executing shell commands (non-AI)
 from color_themes import ColorTheme
 from settings_dialog import SettingsDialog
 from command_safety import CommandSafety
+from output_archive import OutputArchive
+import completion_service
+from latest_worker import LatestWorker
+from suggestion_list import SuggestionList
 
 # --- COLORS & STYLES (Dynamic, managed by ColorTheme) ---
 # These will be updated from the theme manager
@@ -45,65 +49,56 @@ SUGGEST_HL_FG = "#ffffff"
 CWD_FG = "#00ffff"
 OS_INFO_FG = "#00ff80"
 
-SNIPPETS = ["ls -la", "git status", "docker ps", "python3 -m http.server"]
+# --- Output pump ---
+# insert_text() and call_soon() only queue; the Tk main loop drains the queues on a timer.
+OUTPUT_PUMP_INTERVAL_MS = 16      # how often the queue is drained
+OUTPUT_FRAME_BUDGET_MS = 8        # max time spent draining per frame
+OUTPUT_FRAME_MAX_LINES = 20000    # max lines inserted per frame
+_CLEAR_OUTPUT = object()          # queue marker for clear_output()
+
+# --- Scrollback ---
+# Lines beyond the limit are trimmed in bulk and spilled to an on-disk session archive.
+SCROLLBACK_LIMIT = 10000          # lines kept in the output pane
+SCROLLBACK_TRIM_SLACK = 1000      # trim once the limit is exceeded by this many lines
+ARCHIVE_PAGE_LINES = 1000         # lines paged back in when scrolling past the top
+
+# --- Typing ---
+# Completion and safety analysis run on a worker thread once keystrokes pause this long.
+TYPING_DEBOUNCE_MS = 40
+
+# --- Speculative execution ---
+SPECULATE_PAUSE_MS = 300          # typing pause after which a read-only command is started early
+
+# --- History ---
+# The History button shows the newest page; pressing it again pages further back.
+HISTORY_PAGE = 50                 # entries shown per press
 
 # --- Prompt Toolkit Completer ---
+MAX_COMPLETIONS = 50              # suggestions computed per keystroke
+
 class PTCompleter(Completer):
-    def __init__(self, commands=None, history_lines=None):
-        self.commands = sorted(set(commands or []))
-        self.word_completer = WordCompleter(self.commands, ignore_case=True, sentence=True)
-        self.path_completer = PathCompleter(expanduser=True)
-        self.history = InMemoryHistory()
-        if history_lines:
-            for h in history_lines:
-                self.history.append_string(h)
-
-    def update_commands(self, commands):
-        self.commands = sorted(set(commands))
-        self.word_completer = WordCompleter(self.commands, ignore_case=True, sentence=True)
+    def __init__(self, service, get_cwd=os.getcwd, get_history_file=None):
+        # commands, history lines, paths and flags all come from the completion service
+        self.service = service  # completion_service.CompletionService, or a client of a shared one
+        self.get_cwd = get_cwd
+        self.get_history_file = get_history_file  # the history whose frecency ranks the lines
 
     def get_completions(self, document, complete_event):
-        text = document.text_before_cursor
-        last = text.split()[-1] if text.split() else ""
-        if last.startswith(("/", "./", "../", "~")) or ("/" in last and not last.isspace()):
-            yield from self.path_completer.get_completions(document, complete_event)
-        else:
-            yield from self.word_completer.get_completions(document, complete_event)
+        history_file = self.get_history_file() if self.get_history_file else None
+        suggestions = self.service.complete(document.text_before_cursor, self.get_cwd(), history_file,
+                                            limit=MAX_COMPLETIONS)
+        yield from completion_service.to_completions(suggestions)
 
 
-def build_dynamic_commands(history_lines=None, include_compgen=True):
-    cmds = set()
-    for pdir in os.environ.get("PATH", "").split(os.pathsep):
-        try:
-            for name in os.listdir(pdir):
-                full = os.path.join(pdir, name)
-                try:
-                    mode = os.stat(full).st_mode
-                    if stat.S_ISREG(mode) and os.access(full, os.X_OK):
-                        cmds.add(name)
-                except Exception:
-                    continue
-        except Exception:
-            continue
-    if include_compgen and shutil.which("bash"):
-        try:
-            out = subprocess.check_output(["bash", "-lc", "compgen -c"], stderr=subprocess.DEVNULL, text=True)
-            for l in out.splitlines():
-                if l.strip():
-                    cmds.add(l.strip())
-        except Exception:
-            pass
-    cmds.update(SNIPPETS)
-    if history_lines:
-        for h in history_lines:
-            h = h.strip()
-            if not h:
-                continue
-            cmds.add(h)
-            t = h.split()[0]
-            if t:
-                cmds.add(t)
-    return sorted(cmds)
+def _matched_positions(completion, offset):
+    """Line positions of the characters a completion's display highlights as matched"""
+    positions, i = [], offset
+    for fragment in completion.display:
+        style, chunk = fragment[0], fragment[1]
+        if "fuzzymatch.inside" in style:
+            positions.extend(range(i, i + len(chunk)))
+        i += len(chunk)
+    return positions
 
 
 # --- Main GUI ---
@@ -127,8 +122,33 @@ class ShellGUI(tk.Tk):
         
         # Store references to widgets for theme updates
         self.themed_widgets = []
+
+        # Output queue, filled from any thread and drained by _pump_output
+        self._output_queue = queue.Queue()
+        self.output_frame_budget_ms = OUTPUT_FRAME_BUDGET_MS
+        self.output_frame_max_lines = OUTPUT_FRAME_MAX_LINES
+        # Tk calls queued by other threads, which must not touch Tk themselves; also drained by _pump_output
+        self._call_queue = queue.Queue()
+
+        # Scrollback limit and archive of evicted lines (created on first eviction)
+        self.scrollback_limit = SCROLLBACK_LIMIT
+        self._archive = None
+        atexit.register(self._close_archive)  # one closer for whichever archive is current at exit
+        self._archive_cursor = 0      # archived bytes before this offset are not in the pane
+        self._paged_in_lines = 0      # lines at the top of the pane paged in from the archive
+        self._paging_in = False
+
+        self._speculate_after = None  # pending after() id of the next speculative start
+        self._history_page = None     # (search text, id of the oldest entry shown) of the last History press
+
+        # completion and safety analysis of the typed text, off the Tk thread
+        self.typing_worker = LatestWorker("magicshell-typing")
+        self._typing_generation = 0   # bumped on every keystroke; older results are dropped
+        self._typing_after = None     # pending after() id of the next analysis
+        self._shown_suggestions = []
         
         self._build_ui()
+        self.after(OUTPUT_PUMP_INTERVAL_MS, self._pump_output)
 
     def _load_theme_colors(self):
         """Load current theme colors into instance variables"""
@@ -307,9 +327,10 @@ class ShellGUI(tk.Tk):
         self.themed_widgets.append(("safety_indicator", self.safety_indicator, "bg"))
 
         # Suggestion box
-        self.suggestion_box = tk.Listbox(self, height=8, font=("Consolas", 12), bd=1, relief="solid",
-                                         bg=self.colors["SUGGEST_BG"], fg=self.colors["SUGGEST_FG"],
-                                         selectbackground=self.colors["SUGGEST_HL_BG"], selectforeground=self.colors["SUGGEST_HL_FG"])
+        self.suggestion_box = SuggestionList(self, height=8, font=("Consolas", 12), bd=1, relief="solid",
+                                             bg=self.colors["SUGGEST_BG"], fg=self.colors["SUGGEST_FG"],
+                                             selectbackground=self.colors["SUGGEST_HL_BG"], selectforeground=self.colors["SUGGEST_HL_FG"],
+                                             matchforeground=self.colors["SUGGEST_HL_FG"])
         self.suggestion_box.bind("<<ListboxSelect>>", self._on_suggestion_click)
         self.suggestion_box.bind("<FocusOut>", lambda e: self.after(120, self._hide_suggestions))
         self.suggestion_box_visible = False
@@ -321,15 +342,18 @@ class ShellGUI(tk.Tk):
                                                      bg=self.colors["OUT_BG"], fg=self.colors["FG"], insertbackground="#ffffff",
                                                      font=OUTPUT_FONT, relief="solid", bd=2)
         self.output_text.pack(fill=tk.BOTH, expand=True, padx=12, pady=(6, 12))
+        self.output_text.configure(yscrollcommand=self._on_output_scroll)
+        # pty jobs follow the size of the output pane
+        self._output_font = tkfont.Font(font=OUTPUT_FONT)
+        self.output_text.bind("<Configure>", self._on_output_resize)
         self.themed_widgets.append(("output_text", self.output_text, "bg"))
         self.themed_widgets.append(("output_text", self.output_text, "fg"))
         
         self._setup_tags()
         self.insert_text(f"Current directory: {self.core.cwd}", "success")
 
-        hist_lines = self._load_history()
-        cmd_list = build_dynamic_commands(history_lines=hist_lines, include_compgen=(platform.system() != "Windows"))
-        self.pt_completer = PTCompleter(commands=cmd_list, history_lines=hist_lines)
+        self.pt_completer = PTCompleter(self.core.completions, get_cwd=lambda: self.core.cwd,
+                                        get_history_file=lambda: self.core.history.path)
         self.bind_all("<Button-1>", self._global_click, add="+")
 
     # Tag setup
@@ -341,19 +365,155 @@ class ShellGUI(tk.Tk):
         self.output_text.tag_config("error", foreground="#ff6b6b", font=("Consolas", 13, "bold"))
 
     # Utilities
-    def insert_text(self, text, tag=None):
-        self.output_text.configure(state=tk.NORMAL)
-        if tag:
-            self.output_text.insert(tk.END, text + "\n", tag)
-        else:
-            self.output_text.insert(tk.END, text + "\n")
-        self.output_text.see(tk.END)
-        self.output_text.configure(state=tk.DISABLED)
+    def insert_text(self, text, tag=None, end="\n"):
+        """Queue text for the output pane. Safe to call from any thread."""
+        self._output_queue.put((text + end, tag))
 
     def clear_output(self):
+        """Queue a clear so it stays ordered with pending output."""
+        self._output_queue.put((_CLEAR_OUTPUT, None))
+
+    def call_soon(self, fn, *args):
+        """Queue fn(*args) to run on the Tk thread. Safe to call from any thread."""
+        self._call_queue.put((fn, args))
+
+    def _pump_output(self):
+        """Run queued calls, then drain queued output within the frame budget, one insert per frame"""
+        try:
+            while True:
+                try:
+                    fn, args = self._call_queue.get_nowait()
+                except queue.Empty:
+                    break
+                fn(*args)
+
+            deadline = time.monotonic() + self.output_frame_budget_ms / 1000.0
+            runs = []  # [tag, [texts]] with consecutive same-tag texts merged
+            cleared = False
+            count = 0
+            try:
+                while count < self.output_frame_max_lines:
+                    text, tag = self._output_queue.get_nowait()
+                    count += 1
+                    if text is _CLEAR_OUTPUT:
+                        runs = []
+                        cleared = True
+                    elif runs and runs[-1][0] == tag:
+                        runs[-1][1].append(text)
+                    else:
+                        runs.append((tag, [text]))
+                    if count % 256 == 0 and time.monotonic() >= deadline:
+                        break
+            except queue.Empty:
+                pass
+
+            if cleared or runs:
+                self.output_text.configure(state=tk.NORMAL)
+                if cleared:
+                    self.output_text.delete("1.0", tk.END)
+                    # cleared output is discarded, not paged back in
+                    self._close_archive()
+                    self._paged_in_lines = 0
+                    self._archive_cursor = 0
+                if runs:
+                    self.output_text.insert(tk.END, *self._insert_args(runs))
+                    self._trim_scrollback()
+                    self.output_text.see(tk.END)
+                self.output_text.configure(state=tk.DISABLED)
+        finally:
+            # a failing call or insert must not stop the pump for the rest of the session
+            self.after(OUTPUT_PUMP_INTERVAL_MS, self._pump_output)
+
+    @staticmethod
+    def _insert_args(runs):
+        """Flatten [(tag, [texts])] runs into Text.insert chars/tags arguments"""
+        args = []
+        for tag, texts in runs:
+            args.append("".join(texts))
+            args.append(tag or ())
+        return args
+
+    # Scrollback
+    def _trim_scrollback(self):
+        """Move the oldest lines to the session archive once the pane is over its limit"""
+        lines = int(self.output_text.index("end-1c").split(".")[0]) - 1
+        evict = lines - self.scrollback_limit
+        if evict < SCROLLBACK_TRIM_SLACK:
+            return
+        if self._paged_in_lines and self.output_text.yview()[1] < 1.0 and lines < 2 * self.scrollback_limit + self._paged_in_lines:
+            return  # the user is reading paged-in history; trim once they scroll back down
+
+        if self._archive is None:
+            self._archive = OutputArchive()
+
+        # paged-in lines are already archived, only move the cursor past them
+        already = min(evict, self._paged_in_lines)
+        if already:
+            self._archive_cursor = self._archive.skip_lines(self._archive_cursor, already)
+            self._paged_in_lines -= already
+        if evict > already:
+            self._archive_cursor = self._archive.append(self._dump_lines(f"{already + 1}.0", f"{evict + 1}.0"))
+        self.output_text.delete("1.0", f"{evict + 1}.0")
+
+    def _close_archive(self):
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+    def _dump_lines(self, start, end):
+        """Return the (tag, text) lines between two indices"""
+        lines, current = [], []
+        line_tag = None
+        tags = [t for t in self.output_text.tag_names(start) if t != "sel"]
+        for key, value, _ in self.output_text.dump(start, end, text=True, tag=True):
+            if key == "tagon" and value != "sel" and value not in tags:
+                tags.append(value)
+            elif key == "tagoff" and value in tags:
+                tags.remove(value)
+            elif key == "text":
+                for i, part in enumerate(value.split("\n")):
+                    if i:
+                        lines.append((line_tag, "".join(current)))
+                        current, line_tag = [], None
+                    if part:
+                        if not current:
+                            line_tag = tags[0] if tags else None
+                        current.append(part)
+        return lines
+
+    def _on_output_resize(self, event):
+        cols = max(20, event.width // max(1, self._output_font.measure("0")))
+        rows = max(5, event.height // max(1, self._output_font.metrics("linespace")))
+        self.core.set_terminal_size(rows, cols)
+
+    def _on_output_scroll(self, first, last):
+        self.output_text.vbar.set(first, last)
+        if float(first) <= 0.0 and self._archive_cursor > 0 and not self._paging_in:
+            self._paging_in = True
+            self.after_idle(self._page_in_archive)
+
+    def _page_in_archive(self):
+        """Insert the newest archived lines above the oldest line in the pane"""
+        self._paging_in = False
+        if self._archive is None or self._archive_cursor <= 0:
+            return
+        lines, start = self._archive.read_page(self._archive_cursor, ARCHIVE_PAGE_LINES)
+        if not lines:
+            return
+        self._archive_cursor = start
+        self._paged_in_lines += len(lines)
+
+        runs = []
+        for tag, text in lines:
+            if runs and runs[-1][0] == tag:
+                runs[-1][1].append(text + "\n")
+            else:
+                runs.append((tag, [text + "\n"]))
         self.output_text.configure(state=tk.NORMAL)
-        self.output_text.delete("1.0", tk.END)
+        self.output_text.insert("1.0", *self._insert_args(runs))
         self.output_text.configure(state=tk.DISABLED)
+        # keep the line the user was looking at in place
+        self.output_text.yview(f"{len(lines) + 1}.0")
 
     def set_cwd(self):
         new_dir = self.cwd_var.get().strip()
@@ -372,6 +532,12 @@ class ShellGUI(tk.Tk):
 
     # Command execution
     def run_command(self):
+        # while an interactive job runs in the foreground, the entry feeds its terminal
+        if self.core.foreground_accepts_input():
+            self.core.send_input(self.cmd_var.get() + "\n")
+            self.cmd_var.set("")
+            return
+
         cmd = self.cmd_var.get().strip()
         if not cmd:
             return
@@ -416,10 +582,21 @@ class ShellGUI(tk.Tk):
         self.insert_text("Docker status: placeholder", "stdout")
 
     def _show_history(self):
-        hist = self._load_history()
-        self.insert_text("Command History:", "success")
-        for i, c in enumerate(hist[-50:], start=1):
-            self.insert_text(f"{i}. {c}", "stdout")
+        """Show the newest history entries containing the typed text; pressed again, the next older page"""
+        query = self.cmd_var.get().strip() or None
+        older = self._history_page is not None and self._history_page[0] == query
+        before = self._history_page[1] if older else None
+        page = self.core.history.search(query, limit=HISTORY_PAGE, before=before)
+        if not page:
+            self._history_page = None
+            self.insert_text("No older history." if older else "No history.", "success")
+            return
+        self._history_page = (query, page[-1].id)
+        title = "Older history" if older else "Command History"
+        self.insert_text(f"{title}{f' matching {query!r}' if query else ''}:", "success")
+        for entry in reversed(page):
+            stats = f"  ⏱ {entry.duration:.2f}s" if entry.duration is not None else ""
+            self.insert_text(f"{entry.id}. {entry.command}{stats}", "stdout")
 
     def _chat_with_AI(self):
         self.insert_text("Chat with AI", "success")
@@ -427,25 +604,68 @@ class ShellGUI(tk.Tk):
     # Suggestions
     def _on_cmd_type(self, event=None):
         text = self.cmd_var.get()
-        
-        # Update safety indicator
-        self._update_safety_indicator(text)
-        
+        self._typing_generation += 1
+
+        # drop a speculative run for older text, and start one once typing pauses
+        self.core.discard_speculation(text)
+        if self._speculate_after is not None:
+            self.after_cancel(self._speculate_after)
+        self._speculate_after = self.after(SPECULATE_PAUSE_MS, self._speculate)
+
+        # coalesce keystrokes; the analysis itself runs on the typing worker
+        if self._typing_after is not None:
+            self.after_cancel(self._typing_after)
+            self._typing_after = None
         if not text:
+            self._update_safety_indicator(text)
             self._hide_suggestions()
             return
+        self._typing_after = self.after(TYPING_DEBOUNCE_MS, self._submit_typed, text, self._typing_generation)
+
+    def _submit_typed(self, text, generation):
+        self._typing_after = None
+        self.typing_worker.submit(generation, lambda: self._analyze_typed(text, generation), self._post_typed)
+
+    def _analyze_typed(self, text, generation):
+        # typing worker thread: completions and safety analysis of one version of the text
+        if generation != self._typing_generation:
+            return None  # superseded while it waited
+        try:
+            safety = self.safety_checker.analyze_command(text)
+        except Exception as e:
+            safety = e
         try:
             doc = Document(text, cursor_position=len(text))
-            ce = CompleteEvent()
-            completions = list(self.pt_completer.get_completions(doc, ce))
+            completions = list(self.pt_completer.get_completions(doc, CompleteEvent()))
         except Exception:
             completions = []
-        suggestions = [comp.text for comp in completions[:50]]
+        # suggestions are whole lines (the text with the completed part replaced) and the characters to highlight
+        lines = []
+        for comp in completions[:MAX_COMPLETIONS]:
+            head = text[:len(text) + comp.start_position]
+            lines.append((head + comp.text, _matched_positions(comp, len(head))))
+        return text, lines, safety
+
+    def _post_typed(self, generation, result):
+        # typing worker thread: hand the result to the Tk thread unless it is already stale
+        if isinstance(result, tuple) and generation == self._typing_generation:
+            self.call_soon(self._apply_typed, generation, result)
+
+    def _apply_typed(self, generation, result):
+        if generation != self._typing_generation:
+            return  # the text changed while the result was on its way
+        text, suggestions, safety = result
+        self._update_safety_indicator(text, safety)
         if suggestions:
             self._show_suggestions(suggestions)
         else:
             self._hide_suggestions()
 
+    def _speculate(self):
+        self._speculate_after = None
+        if not self.core.foreground_accepts_input():
+            self.core.speculate(self.cmd_var.get())
+
     def _show_suggestions(self, suggestions):
         self.update_idletasks()
         entry_root_x = self.cmd_entry.winfo_rootx()
@@ -459,9 +679,12 @@ class ShellGUI(tk.Tk):
         self.suggestion_box.place(x=rel_x, y=rel_y, width=entry_width)
         self.suggestion_box.lift()
         self.suggestion_box_visible = True
+        if suggestions[:12] == self._shown_suggestions:
+            return  # the list already shows these
+        self._shown_suggestions = suggestions[:12]
         self.suggestion_box.delete(0, tk.END)
-        for s in suggestions[:12]:
-            self.suggestion_box.insert(tk.END, s)
+        for line, positions in self._shown_suggestions:
+            self.suggestion_box.insert(tk.END, line, positions)
 
     def _hide_suggestions(self):
         if self.suggestion_box_visible:
@@ -490,23 +713,11 @@ class ShellGUI(tk.Tk):
             return
         self.after(80, self._hide_suggestions)
 
-    # History management
-    def _history_file(self):
-        return os.path.join(self.core.cwd, ".magicshell_history")
-
+    # History management (the store itself is written by ShellCore.run_command)
     def _append_history(self, cmd):
-        try:
-            with open(self._history_file(), "a", encoding="utf-8") as f:
-                f.write(cmd.replace("\n", " ") + "\n")
-        except Exception:
-            pass
-
-    def _load_history(self):
-        try:
-            with open(self._history_file(), "r", encoding="utf-8") as f:
-                return [l.strip() for l in f.readlines() if l.strip()]
-        except Exception:
-            return []
+        self._history_page = None  # the next History press starts from the newest entry again
+        # ranking the line and indexing its flags touch files and the fuzzy index, so not on the Tk thread
+        self.core.executor.submit_call(self.core.completions.record, cmd, self.core.history.path)
     
     def _apply_theme_callback(self):
         """Callback function to apply new theme to GUI"""
@@ -570,7 +781,8 @@ class ShellGUI(tk.Tk):
             try:
                 self.suggestion_box.configure(
                     selectbackground=self.colors["SUGGEST_HL_BG"],
-                    selectforeground=self.colors["SUGGEST_HL_FG"]
+                    selectforeground=self.colors["SUGGEST_HL_FG"],
+                    matchforeground=self.colors["SUGGEST_HL_FG"]
                 )
             except:
                 pass
@@ -593,15 +805,20 @@ class ShellGUI(tk.Tk):
         except Exception as e:
             self.insert_text(f"❌ Error applying theme: {str(e)}", "error")
     
-    def _update_safety_indicator(self, command: str):
-        """Update the safety indicator based on command analysis"""
+    def _update_safety_indicator(self, command: str, result=None):
+        """
+        Update the safety indicator based on command analysis. `result` is an
+        analyze_command() result computed elsewhere, or the exception it raised.
+        """
         try:
             if not command or not command.strip():
                 # Safe - empty command
                 self.safety_indicator.configure(text="✅", fg="#28a745")
                 return
+            if isinstance(result, Exception):
+                raise result
             
-            is_dangerous, analysis = self.safety_checker.analyze_command(command)
+            is_dangerous, analysis = result if result is not None else self.safety_checker.analyze_command(command)
             
             if not is_dangerous:
                 # Safe command
@@ -0,0 +1,40 @@
+# latest_worker.py
+"""
+A background thread that only runs the newest request.
+
+submit() replaces any request that has not started yet, so a burst of
+keystrokes costs one run of the analysis instead of one per key. Every request
+carries a generation number that is handed back with its result, so the caller
+can ignore results that went stale while they were computed.
+"""
+import threading
+
+
+class LatestWorker:
+    def __init__(self, name="magicshell-worker"):
+        self._cond = threading.Condition()
+        self._pending = None  # (generation, fn, done) of the request waiting to run
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, generation, fn, done):
+        """Run fn() on the worker, then call done(generation, result) there; an exception is the result"""
+        with self._cond:
+            self._pending = (generation, fn, done)
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+                generation, fn, done = self._pending
+                self._pending = None
+            try:
+                result = fn()
+            except Exception as e:
+                result = e
+            try:
+                done(generation, result)
+            except Exception:
+                pass
@@ -0,0 +1,100 @@
+# output_archive.py
+"""
+Session output archive for MagicShell GUI
+Lines evicted from the output pane are appended here and can be paged back in
+"""
+
+import mmap
+import os
+import time
+from typing import Iterable, List, Optional, Tuple
+
+
+class OutputArchive:
+    """Append-only on-disk store of (tag, text) output lines, read through mmap"""
+
+    def __init__(self, path: str = None, archive_dir: str = None, keep: bool = False):
+        """Open (or create) an archive file. It is removed on close() unless keep is set."""
+        if path is None:
+            if archive_dir is None:
+                archive_dir = os.path.expanduser("~/.magicshell/sessions")
+            os.makedirs(archive_dir, exist_ok=True)
+            name = f"session-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.log"
+            path = os.path.join(archive_dir, name)
+
+        self.path = path
+        self.keep = keep
+        self._file = open(path, "ab")
+        self._map = None
+
+    @property
+    def size(self) -> int:
+        """Current size of the archive in bytes"""
+        return self._file.tell()
+
+    def append(self, lines: Iterable[Tuple[Optional[str], str]]) -> int:
+        """Append (tag, text) lines; returns the new end offset"""
+        data = "".join(f"{tag or ''}\t{text}\n" for tag, text in lines)
+        self._file.write(data.encode("utf-8", errors="replace"))
+        self._file.flush()
+        return self.size
+
+    def read_page(self, end: int, max_lines: int) -> Tuple[List[Tuple[Optional[str], str]], int]:
+        """
+        Read up to max_lines lines that end at byte offset `end`, walking backwards.
+        Returns (lines oldest first, start offset of the first returned line).
+        """
+        mm = self._mapped(end)
+        if mm is None or end <= 0:
+            return [], 0
+        start = end
+        for _ in range(max_lines):
+            if start <= 0:
+                break
+            start = mm.rfind(b"\n", 0, start - 1) + 1
+        return self._parse(mm[start:end]), start
+
+    def skip_lines(self, offset: int, count: int) -> int:
+        """Return the offset just past `count` lines starting at `offset`"""
+        mm = self._mapped(self.size)
+        if mm is None:
+            return offset
+        for _ in range(count):
+            nl = mm.find(b"\n", offset)
+            if nl < 0:
+                return len(mm)
+            offset = nl + 1
+        return offset
+
+    def close(self):
+        """Close the archive and remove the file unless it should be kept"""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if not self._file.closed:
+            self._file.close()
+        if not self.keep:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def _mapped(self, needed: int):
+        # remap only when the file has grown past what is already mapped
+        if self._map is None or len(self._map) < needed:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            if self.size == 0:
+                return None
+            with open(self.path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    @staticmethod
+    def _parse(data: bytes) -> List[Tuple[Optional[str], str]]:
+        lines = []
+        for raw in data.decode("utf-8", errors="replace").split("\n")[:-1]:
+            tag, _, text = raw.partition("\t")
+            lines.append((tag or None, text))
+        return lines
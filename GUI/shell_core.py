@@ -1,16 +1,137 @@
 # shell_core.py
+import concurrent.futures
+import itertools
 import os
-import subprocess
+import re
 import threading
 import shutil
 import signal
+import sys
+import time
+from collections import deque
+
+# shared modules (config, exec_core, shell_session) live in the project root
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
+
+import config
+import limits
+import completion_service
+import history_store
+import parallel
+import result_cache
+from exec_core import CommandResult, OutputChunk, ResourceUsage, get_core
+from shell_session import PersistentShell, set_winsize
+from speculation import Speculator
+
+MAX_JOBS = 8              # cap on concurrently running jobs
+JOB_OUTPUT_TAIL = 2000    # lines each job keeps for replay on `fg`
+
+# interactive programs that always get a pseudo-terminal
+TTY_PROGRAMS = {
+    "python", "python3", "ipython", "node", "irb", "bc", "sqlite3", "psql", "mysql", "ghci", "lua",
+}
+
+# terminal escape sequences (CSI, OSC and two-byte escapes) stripped from pty output
+_ANSI_ESCAPE = re.compile(r"\x1b\[[0-?]*[ -/]*[@-~]|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)|\x1b[@-Z\\-_]")
+
+# bash builtins that only make sense when commands share a persistent session
+SESSION_BUILTINS = {
+    "export", "unset", "alias", "unalias", "source", ".", "set", "shopt", "declare",
+    "typeset", "readonly", "local", "function", "hash", "type", "umask", "ulimit",
+    "history", "pushd", "popd", "dirs", "eval", "true", "false", "test", "[",
+}
+
+
+def _clean_tty_line(line):
+    # drop escape sequences and keep what a terminal would show after carriage returns
+    return _ANSI_ESCAPE.sub("", line.rstrip()).rsplit("\r", 1)[-1]
+
+
+class Job:
+    """A command started by ShellCore, foreground or background"""
+
+    def __init__(self, job_id, command, background=False):
+        self.id = job_id
+        self.command = command
+        self.background = background
+        self.handle = None   # exec_core.CommandHandle of the running command
+        self.session = None  # set when the job runs in the persistent shell
+        self.use_pty = False
+        self.started = time.monotonic()
+        self.limits = None   # limits.ResourceLimits the job runs under
+        self.fanout = None   # parallel.FanOut when the job is a /par line
+        self.cache = None    # result_cache.ResultCache the job may be answered from
+        self.speculation = None  # speculation.Speculation the job takes over, if it was started early
+        self.history_entry = None   # future of the job's history_store entry id, finished with its exit code
+        self.partial = {}    # unfinished output line per stream
+        self.status = "Running"
+        self.output = deque(maxlen=JOB_OUTPUT_TAIL)  # recent (text, tag) lines
+        self.emitted = 0     # lines the job has printed
+        self.shown = 0       # of those, lines already in the output pane
+
+    @property
+    def pty_fd(self):
+        return self.handle.pty_fd if self.handle is not None else None
+
+    @property
+    def accepts_input(self):
+        return self.pty_fd is not None or (self.session is not None and self.session.busy)
+
+    def write_input(self, text):
+        if self.pty_fd is not None:
+            self.handle.write_input(text)
+        elif self.session is not None:
+            self.session.send_input(text)
+
+    def send_signal(self, sig):
+        if self.fanout is not None:
+            return self.fanout.send_signal(sig)
+        if self.session is not None:
+            return self.session.signal_foreground(sig)
+        if self.handle is None:
+            return False
+        return self.handle.send_signal(sig)
+
 
 class ShellCore:
-    def __init__(self, gui):
+    def __init__(self, gui, persistent=None):
         self.gui = gui
         self.cwd = os.getcwd()
-        self.proc = None
+        self.jobs = {}  # job id -> Job
+        self._job_ids = itertools.count(1)  # ids are never reused, so %n can't hit a newer job
         self.lock = threading.Lock()
+        self.max_jobs = MAX_JOBS
+        self.executor = get_core()  # shared asyncio execution core
+        # a fan-out blocks a thread until its items finish, and its builtin items need threads of the core's
+        # pool, so fan-outs get threads of their own: one per job that can run
+        self.fanout_pool = concurrent.futures.ThreadPoolExecutor(self.max_jobs, thread_name_prefix="magicshell-fanout")
+        if persistent is None:
+            persistent = config.PERSISTENT_SHELL
+        # optional long-lived bash session for foreground commands
+        self.session = PersistentShell(self.cwd) if persistent and PersistentShell.available() else None
+        self.use_pty = config.PTY_MODE and hasattr(os, "openpty")
+        self.fast_builtins = config.FAST_BUILTINS  # simple ls/cat/wc/... lines run in-process
+        self.limits = limits.from_config(config)  # default timeout and rlimits per command
+        self.result_cache = result_cache.from_config(config)  # saved output of read-only commands
+        # read-only commands started while the user pauses typing
+        self.speculator = Speculator(self.executor, config.SPECULATIVE_COMMANDS) if config.SPECULATIVE_EXECUTION else None
+        self.history = history_store.from_config(config)  # every command line, shared with the CLI
+        # commands, history ranking, paths and flags for completion; background work runs on the worker pool
+        self.completions = completion_service.from_config(config, submit=self.executor.submit_call,
+                                                          history_file=self.history.path)
+        # rows are written by one thread of their own, in the order the lines were typed and off the Tk thread
+        self.history_writer = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="magicshell-history")
+        self.import_history(self.cwd)
+        self.term_size = (24, 80)  # rows, cols of the output pane
+
+    # history
+    def import_history(self, directory):
+        """Move the .magicshell_history an older version left in a directory into the store, on the writer"""
+        legacy = os.path.join(directory, history_store.LEGACY_FILE)
+        if os.path.exists(legacy):
+            self.history_writer.submit(self.history.import_file, legacy)
 
     # directory
     def set_cwd(self, path):
@@ -26,9 +147,11 @@ class ShellCore:
         if not parts:
             return False, "Empty command"
         cmd = parts[0]
-        builtins = ["cd", "echo", "pwd", "clear", "exit"]
+        builtins = ["cd", "echo", "pwd", "clear", "exit", "jobs", "fg", "bg"]
         if cmd in builtins:
             return True, "builtin"
+        if self.session is not None and (cmd in SESSION_BUILTINS or "=" in cmd or "(" in cmd):
+            return True, "session"
         if shutil.which(cmd) is not None:
             return True, "external"
         return False, f"'{cmd}' not found in PATH"
@@ -38,6 +161,16 @@ class ShellCore:
         command = command.strip()
         if not command:
             return
+        line = command  # recorded in the history if it starts a job
+        bypass, command = result_cache.split_bypass(command)
+        try:
+            job_limits, command = limits.split_prefix(command, self.limits)
+        except ValueError as e:
+            self.gui.insert_text(f"Invalid command: {e}", "error")
+            return
+        if parallel.is_fanout(command):
+            self._handle_fanout(command, job_limits, line)
+            return
 
         valid, msg = self.validate_command(command)
         if not valid:
@@ -57,9 +190,20 @@ class ShellCore:
             except Exception:
                 pass
             return
+        if parts[0] == "jobs":
+            self._handle_jobs()
+            return
+        if parts[0] in ("fg", "bg"):
+            self._handle_fg_bg(parts)
+            return
+        if parts[0] == "kill" and any(p.startswith("%") for p in parts[1:]):
+            self._handle_kill(parts)
+            return
 
-        t = threading.Thread(target=self._execute_command, args=(command,), daemon=True)
-        t.start()
+        background = command.endswith("&") and not command.endswith("&&")
+        if background:
+            command = command[:-1].rstrip()
+        self.start_job(command, background, job_limits, use_cache=not bypass, history_line=line)
 
     def _handle_cd(self, parts):
         if len(parts) == 1:
@@ -69,6 +213,7 @@ class ShellCore:
         new_path = os.path.abspath(os.path.join(self.cwd, new_dir))
         if os.path.isdir(new_path):
             self.cwd = new_path
+            self.import_history(new_path)
             try:
                 self.gui.cwd_var.set(self.cwd)
             except Exception:
@@ -77,51 +222,304 @@ class ShellCore:
         else:
             self.gui.insert_text("Directory not found", "error")
 
-    def _execute_command(self, command):
+    def _handle_fanout(self, command, job_limits, history_line=None):
+        background = command.endswith("&") and not command.endswith("&&")
+        if background:
+            command = command[:-1].rstrip()
         try:
-            with self.lock:
-                # start process in its own process group so we can kill group
-                self.proc = subprocess.Popen(
-                    command,
-                    shell=True,
-                    cwd=self.cwd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    preexec_fn=os.setsid if hasattr(os, "setsid") else None
-                )
-
-            # stream stdout
-            for line in iter(self.proc.stdout.readline, ""):
-                if line:
-                    self.gui.insert_text(line.rstrip(), "stdout")
-            # stream stderr
-            for line in iter(self.proc.stderr.readline, ""):
-                if line:
-                    self.gui.insert_text(line.rstrip(), "stderr")
-
-            self.proc.wait()
-            rc = self.proc.returncode
-            if rc == 0:
-                self.gui.insert_text("Command finished successfully.", "success")
+            fanout = parallel.parse(command, self.cwd)
+        except ValueError as e:
+            self.gui.insert_text(f"Invalid command: {e}", "error")
+            return
+        self.start_job(command, background, job_limits, fanout=fanout, history_line=history_line)
+
+    # speculation
+    def speculate(self, text):
+        """Start an allow-listed read-only command before Enter is pressed (Tk thread)"""
+        # session and pty runs would not match what a speculative run prints
+        if self.speculator is None or self.session is not None or self.use_pty:
+            return
+        self.speculator.start(
+            text, self.cwd,
+            builtins=self.fast_builtins,
+            timeout=self.limits.timeout,
+            rlimits=self.limits.rlimits(),
+            cache=self.result_cache,
+        )
+
+    def discard_speculation(self, text=None):
+        """Drop a speculative run that no longer matches the typed text"""
+        if self.speculator is not None:
+            self.speculator.discard(keep=text)
+
+    # jobs
+    def start_job(self, command, background=False, job_limits=None, fanout=None, use_cache=True, history_line=None):
+        with self.lock:
+            running = [j for j in self.jobs.values() if j.status != "Done"]
+            if len(running) >= self.max_jobs:
+                self.gui.insert_text(f"Too many jobs running (limit {self.max_jobs})", "error")
+                return None
+            job = Job(next(self._job_ids), command, background)
+            job.limits = job_limits or self.limits
+            job.fanout = fanout
+            job.cache = self.result_cache if use_cache else None
+            if history_line is not None:
+                job.history_entry = self.history_writer.submit(self.history.add, history_line, self.cwd)
+            if not background:
+                self._background_foreground_job()
+                # a fan-out's items run as ordinary commands, without a pty or the session
+                job.use_pty = fanout is None and hasattr(os, "openpty") and (self.use_pty or command.split()[0] in TTY_PROGRAMS)
+                # the session runs one command at a time; fall back to a fresh shell if it is busy.
+                # Its bash can't take rlimits for one command, so those get a fresh shell too.
+                if (fanout is None and not job.use_pty and self.session is not None and not self.session.busy
+                        and not job.limits.rlimits()):
+                    job.session = self.session
+                # a read-only command may already have run while the user paused typing
+                if (self.speculator is not None and fanout is None and not job.use_pty and job.session is None
+                        and use_cache and job.limits is self.limits):
+                    job.speculation = self.speculator.take(command, self.cwd)
+            self.jobs[job.id] = job
+        if background:
+            self.gui.insert_text(f"[{job.id}] {command}", "success")
+        self._launch(job)
+        return job
+
+    def foreground_job(self):
+        with self.lock:
+            for job in self.jobs.values():
+                if not job.background:
+                    return job
+        return None
+
+    def _background_foreground_job(self):
+        # only one job owns the output pane; caller holds self.lock
+        for job in self.jobs.values():
+            if not job.background:
+                job.background = True
+                self.gui.insert_text(f"[{job.id}] moved to background: {job.command}", "stderr")
+
+    def _find_job(self, spec):
+        """Resolve a job spec (%n, n or empty for the most recent job)"""
+        with self.lock:
+            if not spec:
+                return self.jobs[max(self.jobs)] if self.jobs else None
+            try:
+                return self.jobs.get(int(spec.lstrip("%")))
+            except ValueError:
+                return None
+
+    def _handle_jobs(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        if not jobs:
+            self.gui.insert_text("No jobs.", "stdout")
+        for job in jobs:
+            where = "" if job.background else " (foreground)"
+            self.gui.insert_text(f"[{job.id}] {job.status:<8} {job.command}{where}", "stdout")
+
+    def _handle_fg_bg(self, parts):
+        job = self._find_job(parts[1] if len(parts) > 1 else "")
+        if job is None:
+            self.gui.insert_text(f"{parts[0]}: no such job", "error")
+            return
+        if job.status == "Stopped":
+            job.send_signal(signal.SIGCONT)
+            job.status = "Running"
+        with self.lock:
+            if parts[0] == "bg":
+                job.background = True
+                self.gui.insert_text(f"[{job.id}] {job.command} &", "success")
+                return
+            self._background_foreground_job()
+            job.background = False
+            # replay what the job printed while it was in the background, as far as the tail reaches
+            self.gui.insert_text(f"[{job.id}] {job.command}", "command")
+            unseen = min(job.emitted - job.shown, len(job.output))
+            for text, tag in list(job.output)[len(job.output) - unseen:]:
+                self.gui.insert_text(text, tag)
+            job.shown = job.emitted
+
+    def _handle_kill(self, parts):
+        sig = signal.SIGTERM
+        for arg in parts[1:]:
+            if arg.startswith("-"):
+                name = arg[1:].upper()
+                try:
+                    sig = signal.Signals(int(name)) if name.isdigit() else signal.Signals[name if name.startswith("SIG") else "SIG" + name]
+                except (KeyError, ValueError):
+                    self.gui.insert_text(f"kill: unknown signal {arg}", "error")
+                    return
+                continue
+            job = self._find_job(arg)
+            if job is None or not job.send_signal(sig):
+                self.gui.insert_text(f"kill: {arg}: no such job", "error")
+                continue
+            if sig in (signal.SIGSTOP, signal.SIGTSTP):
+                job.status = "Stopped"
+            elif sig == signal.SIGCONT:
+                job.status = "Running"
+
+    def foreground_accepts_input(self):
+        job = self.foreground_job()
+        return job is not None and job.accepts_input
+
+    def send_input(self, text):
+        """Forward typed input to the foreground job's terminal"""
+        job = self.foreground_job()
+        if job is None or not job.accepts_input:
+            return False
+        try:
+            job.write_input(text)
+        except OSError:
+            return False
+        return True
+
+    def set_terminal_size(self, rows, cols):
+        """Propagate the output pane size to running pty jobs and the session"""
+        if (rows, cols) == self.term_size:
+            return
+        self.term_size = (rows, cols)
+        with self.lock:
+            fds = [j.pty_fd for j in self.jobs.values() if j.pty_fd is not None]
+        for fd in fds:
+            try:
+                set_winsize(fd, rows, cols)
+            except OSError:
+                pass
+        if self.session is not None:
+            try:
+                self.session.resize(rows, cols)
+            except OSError:
+                pass
+
+    def _emit(self, job, text, tag, end="\n"):
+        # route a line to the pane if the job owns it, always keep it in the job tail
+        with self.lock:
+            job.output.append((text, tag))
+            job.emitted += 1
+            if not job.background:
+                job.shown = job.emitted
+                if end == "\n":
+                    self.gui.insert_text(text, tag)
+                else:
+                    self.gui.insert_text(text, tag, end=end)
+
+    def _launch(self, job):
+        if job.fanout is not None:
+            future = self.fanout_pool.submit(self._run_fanout, job)
+            future.add_done_callback(lambda f: self._job_done(job, f))
+            return
+        if job.speculation is not None:
+            # started while the user paused typing: show what it printed so far, then stream the rest
+            job.handle = job.speculation.handle
+            job.speculation.adopt(lambda chunk: self._on_output(job, chunk))
+            job.handle.future.add_done_callback(lambda f: self._job_done(job, f))
+            return
+        if job.session is not None:
+            future = self.executor.submit_call(self._run_in_session, job)
+            future.add_done_callback(lambda f: self._job_done(job, f))
+            return
+        env = dict(os.environ, TERM="dumb", PAGER="cat", GIT_PAGER="cat") if job.use_pty else None
+        job.handle = self.executor.submit(
+            job.command,
+            cwd=self.cwd,
+            env=env,
+            on_output=lambda chunk: self._on_output(job, chunk),
+            pty_size=self.term_size if job.use_pty else None,
+            builtins=self.fast_builtins,
+            timeout=job.limits.timeout,
+            rlimits=job.limits.rlimits(),
+            cache=job.cache,
+        )
+        job.handle.future.add_done_callback(lambda f: self._job_done(job, f))
+
+    def _run_in_session(self, job):
+        # runs on the execution core's worker pool
+        _, rc, timed_out = job.session.run(
+            job.command,
+            on_output=lambda text: self._on_output(job, OutputChunk("stdout", text, time.monotonic())),
+            cwd=self.cwd,
+            timeout=job.limits.timeout,
+        )
+        if job.session.cwd != self.cwd:
+            self._sync_cwd(job.session.cwd)
+        # the session's bash is long-lived, so only the wall time is per command
+        return CommandResult(rc, timed_out=timed_out, usage=ResourceUsage(time.monotonic() - job.started))
+
+    def _run_fanout(self, job):
+        # runs on fanout_pool while the items run on the execution core
+        return job.fanout.run(
+            self.executor,
+            lambda stream, line: self._emit(job, line, stream),
+            cwd=self.cwd,
+            timeout=job.limits.timeout,
+            rlimits=job.limits.rlimits(),
+            builtins=self.fast_builtins,
+        )
+
+    def _on_output(self, job, chunk):
+        # split streamed text into lines; job.partial holds the unfinished line per stream
+        lines = (job.partial.get(chunk.stream, "") + chunk.text).split("\n")
+        rest = lines.pop()
+        for line in lines:
+            self._emit(job, _clean_tty_line(line) if job.use_pty else line.rstrip(), chunk.stream)
+        if job.use_pty and rest and "\r" not in rest and "\x1b" not in rest:
+            # show prompts right away; the rest of the line is appended when it arrives
+            self._emit(job, rest, chunk.stream, end="")
+            rest = ""
+        job.partial[chunk.stream] = rest
+
+    def _job_done(self, job, future):
+        try:
+            result = future.result()
+            rc = result.returncode
+            for stream, rest in job.partial.items():
+                if rest:
+                    self._emit(job, _clean_tty_line(rest) if job.use_pty else rest.rstrip(), stream)
+
+            note = limits.limit_message(result, job.limits)
+            if note:
+                self.gui.insert_text(note, "error")
+            usage = f"  ⏱ {'cached, ' if result.cached else ''}{result.usage.summary()}"
+            if job.background:
+                status = "Done" if rc == 0 else f"Exit {rc}"
+                self.gui.insert_text(f"[{job.id}] {status:<8} {job.command}{usage}", "success" if rc == 0 else "error")
+            elif rc == 0:
+                self.gui.insert_text(f"Command finished successfully.{usage}", "success")
             else:
-                self.gui.insert_text(f"Command exited with code {rc}", "error")
+                self.gui.insert_text(f"Command exited with code {rc}{usage}", "error")
+            if job.history_entry is not None:
+                self.history_writer.submit(self._finish_history, job.history_entry, rc, result.usage)
 
         except Exception as e:
             self.gui.insert_text(f"Execution error: {e}", "error")
         finally:
             with self.lock:
-                self.proc = None
+                job.status = "Done"
+                self.jobs.pop(job.id, None)
+
+    def _finish_history(self, history_entry, rc, usage):
+        # runs on the history writer, which ran the entry's add() before it
+        self.history.finish(history_entry.result(), rc, usage)
+
+    def _sync_cwd(self, path):
+        # called off the Tk thread when a session command changed directory; the label is set on the Tk thread
+        if os.path.isdir(path):
+            self.cwd = path
+            try:
+                self.gui.call_soon(self.gui.cwd_var.set, path)
+            except Exception:
+                pass
 
     def stop_running(self):
-        with self.lock:
-            if self.proc and self.proc.poll() is None:
-                try:
-                    os.killpg(os.getpgid(self.proc.pid), signal.SIGTERM)
-                except Exception:
-                    try:
-                        self.proc.terminate()
-                    except Exception:
-                        pass
-                return True
-        return False
+        """Terminate the foreground job, or the most recent job if none is in the foreground"""
+        job = self.foreground_job() or self._find_job("")
+        if job is None:
+            return False
+        if job.fanout is not None:
+            return job.fanout.cancel()
+        if job.session is not None:
+            # an interactive bash ignores SIGTERM, so session jobs get Ctrl-C instead
+            return job.send_signal(signal.SIGINT)
+        # SIGTERM to the job's process group, then SIGKILL if it outlives KILL_GRACE
+        return job.handle is not None and job.handle.cancel()
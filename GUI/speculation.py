@@ -0,0 +1,125 @@
+# speculation.py
+"""
+Speculative pre-execution of read-only commands.
+
+While the user pauses typing, a command on the allow-list (SPECULATIVE_COMMANDS
+in config.py) is started in the background and its output is held in a buffer.
+If Enter is pressed for the same text in the same directory, the job adopts the
+running (or finished) command: the buffered output appears at once and the rest
+streams in as usual. Changing the text cancels the speculative run, and a
+finished run is only kept for SPECULATION_TTL seconds.
+"""
+import os
+import sys
+import threading
+import time
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
+
+from pipeline import split
+
+SPECULATION_TTL = 5.0                 # seconds a finished speculative run stays usable
+SPECULATION_MAX_CHARS = 1024 * 1024   # runs printing more than this are abandoned
+
+
+class Speculation:
+    """One speculative run: its handle and the output nobody has consumed yet"""
+
+    def __init__(self, command, cwd):
+        self.command = command
+        self.cwd = cwd
+        self.handle = None      # exec_core.CommandHandle
+        self.finished = None    # time.monotonic() when the command finished
+        self.overflowed = False
+        self._chunks = []
+        self._size = 0
+        self._sink = None
+        self._lock = threading.Lock()
+
+    def on_output(self, chunk):
+        # loop thread: buffer until a job adopts the run, then pass straight through
+        with self._lock:
+            sink = self._sink
+            if sink is None:
+                if self.overflowed:
+                    return
+                self._chunks.append(chunk)
+                self._size += len(chunk.text)
+                if self._size > SPECULATION_MAX_CHARS:
+                    self.overflowed = True
+                    self._chunks = []
+                    self.handle.cancel()
+                return
+        sink(chunk)
+
+    def adopt(self, sink):
+        """Replay the buffered output to sink(chunk) and send it everything that follows"""
+        with self._lock:
+            for chunk in self._chunks:
+                sink(chunk)
+            self._chunks = []
+            self._sink = sink
+
+    def fresh(self):
+        return not self.overflowed and (self.finished is None or time.monotonic() - self.finished < SPECULATION_TTL)
+
+    def _mark_finished(self, future):
+        self.finished = time.monotonic()
+
+
+class Speculator:
+    """Keeps at most one speculative run, for the text currently typed"""
+
+    def __init__(self, core, commands):
+        self.core = core  # exec_core.ExecutionCore
+        self.commands = [tuple(command.split()) for command in commands]
+        self.current = None
+        self._lock = threading.Lock()
+
+    def allowed(self, command):
+        """True for a single allow-listed command without pipes or redirections"""
+        sequence = split(command)
+        if not sequence or len(sequence) != 1 or len(sequence[0][1]) != 1:
+            return False
+        stage = sequence[0][1][0]
+        return not stage.redirects and any(tuple(stage.argv[:len(prefix)]) == prefix for prefix in self.commands)
+
+    def start(self, command, cwd, **options):
+        """Start `command` in cwd unless it is already running or held; options go to core.submit()"""
+        command = command.strip()
+        with self._lock:
+            current = self.current
+            if current is not None and (current.command, current.cwd) == (command, cwd) and current.fresh():
+                return current
+        self.discard()
+        if not self.allowed(command):
+            return None
+        speculation = Speculation(command, cwd)
+        with speculation._lock:  # no output is buffered before the handle is set
+            speculation.handle = self.core.submit(command, cwd=cwd, on_output=speculation.on_output, **options)
+        speculation.handle.future.add_done_callback(speculation._mark_finished)
+        with self._lock:
+            self.current = speculation
+        return speculation
+
+    def discard(self, keep=None):
+        """Cancel the speculative run, unless it is for the text `keep`"""
+        with self._lock:
+            current = self.current
+            if current is None or (keep is not None and current.command == keep.strip()):
+                return
+            self.current = None
+        current.handle.cancel()
+
+    def take(self, command, cwd):
+        """Hand over the run for command in cwd if there is a fresh one; any other run is discarded"""
+        with self._lock:
+            current, self.current = self.current, None
+        if current is None:
+            return None
+        if (current.command, current.cwd) == (command.strip(), cwd) and current.fresh():
+            return current
+        current.handle.cancel()
+        return None
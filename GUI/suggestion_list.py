@@ -0,0 +1,74 @@
+# suggestion_list.py
+"""
+Suggestion list for the MagicShell GUI.
+
+A tk.Listbox cannot style part of a line, so this is a read-only tk.Text with
+the part of the Listbox interface the GUI uses (insert, delete, get, size,
+curselection and <<ListboxSelect>>) plus highlighting of the characters a
+fuzzy match hit.
+"""
+import tkinter as tk
+
+
+class SuggestionList(tk.Text):
+    def __init__(self, master, selectbackground="#333333", selectforeground="#ffffff",
+                 matchforeground="#ffffff", font=("Consolas", 12), **kwargs):
+        super().__init__(master, wrap="none", cursor="arrow", font=font, **kwargs)
+        self._items = []
+        self._selected = None
+        self.tag_configure("selected", background=selectbackground, foreground=selectforeground)
+        self.tag_configure("match", foreground=matchforeground, font=(font[0], font[1], "bold"), underline=True)
+        self.tag_raise("match")
+        self.bind("<Button-1>", self._on_click)
+        super().configure(state="disabled")
+
+    def configure(self, cnf=None, **kwargs):
+        # selection and match colors live on tags, everything else on the widget
+        tags = {"selectbackground": ("selected", "background"), "selectforeground": ("selected", "foreground"),
+                "matchforeground": ("match", "foreground")}
+        for option, (tag, tag_option) in tags.items():
+            if option in kwargs:
+                self.tag_configure(tag, **{tag_option: kwargs.pop(option)})
+        if cnf or kwargs:
+            return super().configure(cnf, **kwargs)
+
+    config = configure
+
+    def size(self):
+        return len(self._items)
+
+    def get(self, index):
+        return self._items[index]
+
+    def curselection(self):
+        return () if self._selected is None else (self._selected,)
+
+    def insert(self, index, text, positions=()):
+        """Append a line (index must be tk.END); positions are the characters to highlight"""
+        super().configure(state="normal")
+        line = len(self._items) + 1
+        if self._items:
+            super().insert(tk.END, "\n")
+        super().insert(tk.END, text)
+        for pos in positions:
+            if 0 <= pos < len(text):
+                self.tag_add("match", f"{line}.{pos}")
+        super().configure(state="disabled")
+        self._items.append(text)
+
+    def delete(self, first, last=None):
+        """Remove every line (the GUI only ever clears the list)"""
+        super().configure(state="normal")
+        super().delete("1.0", tk.END)
+        super().configure(state="disabled")
+        self._items = []
+        self._selected = None
+
+    def _on_click(self, event):
+        line = int(self.index(f"@{event.x},{event.y}").split(".")[0]) - 1
+        if 0 <= line < len(self._items):
+            self.tag_remove("selected", "1.0", tk.END)
+            self.tag_add("selected", f"{line + 1}.0", f"{line + 1}.end")
+            self._selected = line
+            self.event_generate("<<ListboxSelect>>")
+        return "break"
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Test script for the MagicShell typing worker
+"""
+
+import sys
+import os
+import threading
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from latest_worker import LatestWorker
+
+def test_latest_worker():
+    """Test that bursts are coalesced and results carry their generation"""
+    print("⌨️ Testing MagicShell Typing Worker")
+    print("=" * 40)
+
+    worker = LatestWorker("test-typing")
+    results = []
+    finished = threading.Event()
+
+    def done(generation, result):
+        results.append((generation, result))
+        if generation == 19:
+            finished.set()
+
+    def analyze(text):
+        time.sleep(0.02)
+        return text.upper()
+
+    for generation in range(20):
+        text = "git status"[:generation % 10 + 1]
+        worker.submit(generation, lambda text=text: analyze(text), done)
+    assert finished.wait(5)
+    assert results[-1] == (19, "GIT STATUS") and len(results) < 20
+    print(f"✅ 20 keystrokes analyzed {len(results)} time(s), newest last")
+
+    failed = threading.Event()
+    worker.submit(20, lambda: 1 / 0, lambda generation, result: failed.set() if isinstance(result, ZeroDivisionError) else None)
+    assert failed.wait(5)
+    print("✅ Exceptions are handed back as the result")
+
+if __name__ == "__main__":
+    test_latest_worker()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Test script for the MagicShell output scrollback archive
+"""
+
+import sys
+import os
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from output_archive import OutputArchive
+
+def test_output_archive():
+    """Test appending, paging back and skipping archived lines"""
+    print("🗄️ Testing MagicShell Output Archive")
+    print("=" * 40)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = OutputArchive(archive_dir=tmp)
+        lines = [("stdout" if i % 2 else None, f"line {i}") for i in range(100)]
+        end = archive.append(lines[:60])
+        end = archive.append(lines[60:])
+        print(f"✅ Archived {len(lines)} lines ({end} bytes) in {archive.path}")
+
+        page, start = archive.read_page(end, 30)
+        assert page == lines[70:], page[:3]
+        page, start = archive.read_page(start, 100)
+        assert page == lines[:70]
+        assert start == 0
+        print("✅ Pages read back newest first, oldest lines last")
+
+        offset = archive.skip_lines(0, 10)
+        page, _ = archive.read_page(offset, 1)
+        assert page == [lines[9]]
+        print("✅ Skipping forward lands on line boundaries")
+
+        assert archive.read_page(0, 10) == ([], 0)
+        archive.close()
+        assert not os.path.exists(archive.path)
+        print("✅ Archive removed on close")
+
+if __name__ == "__main__":
+    test_output_archive()
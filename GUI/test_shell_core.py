@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Test script for the MagicShell GUI job table and pty mode
+"""
+
+import sys
+import os
+import contextlib
+import tempfile
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+import config
+import shell_core
+from shell_core import ShellCore
+import command_index
+import flag_index
+
+class FakeGUI:
+    """Records what ShellCore writes to the output pane"""
+
+    def __init__(self):
+        self.lines = []
+        self.calls = []  # what call_soon() queued for the Tk thread
+        self.cwd_var = self
+
+    def insert_text(self, text, tag="stdout", end="\n"):
+        self.lines.append((text, tag))
+
+    def call_soon(self, fn, *args):
+        self.calls.append((fn, args))
+
+    def set(self, value):
+        raise AssertionError("cwd_var set off the Tk thread")
+
+    def clear_output(self):
+        self.lines.clear()
+
+    def quit(self):
+        pass
+
+@contextlib.contextmanager
+def temp_state():
+    """A temp dir that holds the history, its frecency journal, the command index and the flags"""
+    saved = config.HISTORY_DB, command_index.INDEX_FILE, flag_index.INDEX_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = os.path.realpath(tmp)
+        config.HISTORY_DB = os.path.join(tmp, "history.db")
+        command_index.INDEX_FILE = os.path.join(tmp, "command_index.json")
+        flag_index.INDEX_DIR = os.path.join(tmp, "flags")
+        try:
+            yield tmp
+        finally:
+            config.HISTORY_DB, command_index.INDEX_FILE, flag_index.INDEX_DIR = saved
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+def test_job_table():
+    """Test job ids, kill %n, what fg replays and the history entry of a job"""
+    print("🧮 Testing MagicShell Job Table")
+    print("=" * 40)
+
+    with temp_state():
+        gui = FakeGUI()
+        core = ShellCore(gui, persistent=False)
+        core.use_pty = False
+        try:
+            second = core.start_job("sleep 30", background=True)
+            last = core.start_job("sleep 30", background=True)
+            assert (second.id, last.id) == (1, 2)
+            wait_until(lambda: last.handle.pid is not None)
+            core.run_command("kill %2")
+            wait_until(lambda: 2 not in core.jobs)
+            newer = core.start_job("sleep 30", background=True)
+            assert newer.id == 3 and sorted(core.jobs) == [1, 3]
+            gui.lines.clear()
+            core.run_command("kill %2")
+            assert gui.lines == [("kill: %2: no such job", "error")] and sorted(core.jobs) == [1, 3]
+            print("✅ Job ids are never reused, so kill %n can't hit a newer job")
+
+            core._emit(second, "while in the background", "stdout")
+            gui.lines.clear()
+            core.run_command("fg %1")
+            assert gui.lines == [("[1] sleep 30", "command"), ("while in the background", "stdout")]
+            core._emit(second, "while in the foreground", "stdout")
+            core.run_command("bg %1")
+            core._emit(second, "in the background again", "stdout")
+            gui.lines.clear()
+            core.run_command("fg %1")
+            assert gui.lines[1:] == [("in the background again", "stdout")]
+            core.run_command("bg %1")
+            for i in range(shell_core.JOB_OUTPUT_TAIL + 5):
+                core._emit(second, f"line {i}", "stdout")
+            gui.lines.clear()
+            core.run_command("fg %1")
+            assert len(gui.lines) == 1 + shell_core.JOB_OUTPUT_TAIL and gui.lines[1] == ("line 5", "stdout")
+            print("✅ fg replays only the lines not shown yet")
+
+            core.run_command("sh -c 'exit 3'")
+            wait_until(lambda: [e.exit_code for e in core.history.recent(1)] == [3])
+            entry = core.history.recent(1)[0]
+            assert (entry.command, entry.exit_code, entry.cwd) == ("sh -c 'exit 3'", 3, core.cwd)
+            assert entry.duration > 0 and entry.user_cpu is not None
+            for i in range(5):
+                core.run_command(f"echo {i} &")
+            core.run_command("no-such-program-here")
+            wait_until(lambda: len(core.jobs) == 2)
+            core.history_writer.submit(lambda: None).result(timeout=5)
+            assert [e.command for e in core.history.recent(100)] == [f"echo {i} &" for i in range(4, -1, -1)] + \
+                ["sh -c 'exit 3'"]
+            print("✅ Job lines, and only those, recorded in typed order with their exit code")
+        finally:
+            for job in list(core.jobs.values()):
+                job.handle.cancel()
+            wait_until(lambda: not core.jobs)
+            core.history_writer.shutdown()
+            core.history.close()
+
+def test_session_cwd():
+    """Test that a directory change in the persistent session reaches the GUI through its call queue"""
+    print("📂 Testing MagicShell Session Directory")
+    print("=" * 40)
+
+    from shell_session import PersistentShell
+    if not PersistentShell.available() or not hasattr(os, "openpty"):
+        print("⚠️ No bash or pty here, skipped")
+        return
+
+    with temp_state() as tmp:
+        gui = FakeGUI()
+        core = ShellCore(gui, persistent=True)
+        core.use_pty = False
+        try:
+            job = core.start_job(f"pushd {tmp}")
+            assert job.session is not None
+            wait_until(lambda: not core.jobs)
+            assert core.cwd == tmp and gui.calls == [(gui.set, (tmp,))]
+            print("✅ The new directory is queued for the Tk thread")
+        finally:
+            core.session.close()
+            core.history_writer.shutdown()
+            core.history.close()
+
+def test_pty_mode():
+    """Test that PTY_MODE runs commands on a terminal of the pane's size, and resizes it"""
+    print("🖥️ Testing MagicShell PTY Mode")
+    print("=" * 40)
+
+    if not hasattr(os, "openpty"):
+        print("⚠️ No pty here, skipped")
+        return
+
+    pty_mode = config.PTY_MODE
+    with temp_state():
+        config.PTY_MODE = True
+        gui = FakeGUI()
+        core = ShellCore(gui, persistent=False)
+        try:
+            assert core.use_pty
+            core.set_terminal_size(33, 101)
+            job = core.start_job("stty size; tty")
+            wait_until(lambda: not core.jobs)
+            assert job.use_pty
+            lines = [text for text, tag in gui.lines if tag == "stdout"]
+            assert lines[0] == "33 101" and lines[1].startswith("/dev/"), lines
+            print("✅ Commands see a terminal of the configured size")
+
+            gui.lines.clear()
+            job = core.start_job("read line; stty size")
+            wait_until(lambda: job.pty_fd is not None)
+            core.set_terminal_size(40, 120)
+            assert core.send_input("go\n")
+            wait_until(lambda: not core.jobs)
+            assert "40 120" in [text for text, tag in gui.lines if tag == "stdout"]
+            print("✅ Resizing the pane resizes the running job's terminal")
+        finally:
+            core.history_writer.shutdown()
+            core.history.close()
+            config.PTY_MODE = pty_mode
+
+if __name__ == "__main__":
+    test_job_table()
+    test_session_cwd()
+    test_pty_mode()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Test script for MagicShell speculative pre-execution
+"""
+
+import sys
+import os
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from speculation import Speculator
+from exec_core import get_core
+
+def test_speculation():
+    """Test allow-listing, adoption and discarding of speculative runs"""
+    print("🔮 Testing MagicShell Speculative Execution")
+    print("=" * 40)
+
+    speculator = Speculator(get_core(), ["git status", "echo", "sleep"])
+    for command in ["git push", "echo a | cat", "echo a > f", "rm -rf x", "git"]:
+        assert not speculator.allowed(command), command
+        assert speculator.start(command, "/") is None
+    assert speculator.allowed("git status -s") and speculator.allowed("echo hi")
+    print("✅ Only single allow-listed commands run early")
+
+    speculation = speculator.start("echo early", "/")
+    assert speculator.start("echo early ", "/") is speculation  # already running
+    speculation.handle.result(timeout=5)
+    assert speculator.take("echo early", "/tmp") is None  # another directory
+    speculation = speculator.start("echo early", "/")
+    speculation.handle.result(timeout=5)
+    taken = speculator.take("echo early", "/")
+    assert taken is speculation and speculator.current is None
+    seen = []
+    taken.adopt(lambda chunk: seen.append(chunk.text))
+    assert seen == ["early\n"]
+    print("✅ Enter adopts the finished run and replays its output")
+
+    speculation = speculator.start("sleep 5", "/")
+    speculator.discard(keep="sleep 5")
+    assert speculator.current is speculation
+    start = time.monotonic()
+    speculator.discard(keep="sleep 50")
+    assert speculation.handle.result(timeout=5).cancelled and time.monotonic() - start < 3
+    print("✅ Changing the text cancels the speculative run")
+
+if __name__ == "__main__":
+    test_speculation()
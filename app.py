@@ -1,38 +1,34 @@
+import locale
 import os
 import platform
 import sys
 from prompt_toolkit import PromptSession
-from prompt_toolkit.completion import Completer, Completion, PathCompleter, WordCompleter
+from prompt_toolkit.completion import Completer
 from prompt_toolkit.history import InMemoryHistory
 from prompt_toolkit.styles import Style
+import completion_service
+import config
+import history_store
+import limits
+import result_cache
 from shell_commands import ShellCommandExecutor
 from ai_integration import AIIntegration
 
 os.environ["GRPC_VERBOSITY"] = "ERROR"  # Suppress GRPC-related warnings
 
-# Define built-in commands for autocomplete
-COMMANDS = [
-    "cd", "ls", "pwd", "mkdir", "rm", "clear", "exit"
-]
-
 class ShellCompleter(Completer):
     """
     ShellCompleter is responsible for providing command and file path completions.
     """
-    def __init__(self):
-        # Initialize command and path completers
-        self.cmd_completer = WordCompleter(COMMANDS, ignore_case=True)
-        self.path_completer = PathCompleter(expanduser=True)
+    def __init__(self, service, get_cwd=os.getcwd, history_file=None):
+        self.service = service  # completion_service.CompletionService, or a client of a shared one
+        self.get_cwd = get_cwd
+        self.history_file = history_file  # the history whose frecency ranks the lines
     
     # Get completeion based on the user input
     def get_completions(self, document, complete_event):
-        text_before_cursor = document.text_before_cursor.lstrip()
-        if " " not in text_before_cursor:
-            # Command completion
-            yield from self.cmd_completer.get_completions(document, complete_event)
-        else:
-            # Path completion
-            yield from self.path_completer.get_completions(document, complete_event)
+        suggestions = self.service.complete(document.text_before_cursor, self.get_cwd(), self.history_file)
+        yield from completion_service.to_completions(suggestions)
 
 # Clear Terminal screen based on os
 def clear_screen():
@@ -45,6 +41,12 @@ def print_banner(current_path):
     print("=" * 40)
     print(f"Current Directory: {current_path}\n")
 
+# Print what the last system command used, below its output
+def print_usage(executor):
+    if executor.last_usage is not None:
+        cached = "cached, " if executor.last_cached else ""
+        print(f"⏱ {cached}{executor.last_usage.summary()}")
+
 # Custom prompt format to display
 def make_prompt(path):
     return [
@@ -57,7 +59,9 @@ def make_prompt(path):
 def run_shell():
 
     clear_screen()  # Clear the screen when starting
-    executor = ShellCommandExecutor()  # Initialize the command executor
+    executor = ShellCommandExecutor(persistent=config.PERSISTENT_SHELL, fast_builtins=config.FAST_BUILTINS,
+                                    limits=limits.from_config(config),
+                                    cache=result_cache.from_config(config))  # Initialize the command executor
     ai_integration = AIIntegration()  # Initialize AI integration
     print_banner(executor.current_dir)  # Print the banner with the current directory
 
@@ -68,10 +72,14 @@ def run_shell():
         "arrow": "ansiyellow bold",
     })
 
+    history = history_store.from_config(config)  # every command line, shared with the GUI
+    # commands, history ranking, paths and flags; the ranking of the history is built in the background
+    completions = completion_service.from_config(config, history_file=history.path)
+
     # Initialize the prompt session with history, completer, and style
     session = PromptSession(
         history=InMemoryHistory(),
-        completer=ShellCompleter(),
+        completer=ShellCompleter(completions, get_cwd=lambda: executor.current_dir, history_file=history.path),
         style=style
     )
 
@@ -88,17 +96,24 @@ def run_shell():
 
                 print(f"AI Suggested Command: {ai_command}")  # Display AI's suggestion
                 if ai_command.strip():
-                    output = executor.execute(ai_command)  # Execute the suggested AI command
-                    if output.strip():
+                    output = executor.execute(ai_command, stream=sys.stdout)  # Execute the suggested AI command
+                    if output.strip() and not executor.last_streamed:
                         print(output)  # Print the command output
+                    print_usage(executor)
                 else:
                     print("AI could not generate a valid command.")  # AI failed to generate a command
             else: 
-                output = executor.execute(command)  # Execute the normal shell command
+                # recorded before it runs, and given its exit code and resource usage once it finished
+                entry = history.add(command, executor.current_dir) if command.strip() else None
+                output = executor.execute(command, stream=sys.stdout)  # Execute the normal shell command, streaming its output
                 if output == "EXIT":
                     break  # Exit if the command is "exit"
-                elif output.strip():
-                    print(output)  # Print the output if any
+                elif output.strip() and not executor.last_streamed:
+                    print(output)  # Print the output if any (streamed output is already on screen)
+                if entry is not None:
+                    history.finish(entry, executor.last_returncode, executor.last_usage)
+                completions.record(command, history.path)
+                print_usage(executor)
 
         except KeyboardInterrupt:
             continue  # Allow to continue if Ctrl+C is pressed
@@ -110,4 +125,9 @@ def run_shell():
     print(f"{os.getcwd()} >", end=" ")
 
 if __name__ == "__main__":
+    try:
+        # the fast ls builtin sorts like the real ls; set once here, before any worker thread starts
+        locale.setlocale(locale.LC_COLLATE, "")
+    except locale.Error:
+        pass
     run_shell()  # Start the shell when this script is executed directly
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Benchmark fuzzy search over a history-sized candidate list, one search per keystroke.
+
+Usage: python bench_fuzzy.py [candidates]
+Exits with status 1 when the slowest keystroke is over the budget.
+"""
+
+import sys
+import os
+import random
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fuzzy import FuzzyIndex
+
+BUDGET_MS = 16  # one frame at 60 Hz
+QUERIES = ["gst", "git status", "dkrps", "docker compose up", "lsla", "kubectl get pods -n", "pytest -q", "zzzz"]
+
+def make_candidates(n, seed=1):
+    """Command lines that look like a long shell history"""
+    rng = random.Random(seed)
+    programs = ["git", "ls", "cd", "docker", "kubectl", "python", "pytest", "grep", "find", "make", "npm", "ssh"]
+    words = ["status", "commit", "-m", "log", "--oneline", "build", "run", "get", "pods", "-la", "src", "tests",
+             "compose", "up", "-d", "install", "origin", "main", "deploy", "*.py", "-rn", "TODO", "/var/log"]
+    lines = set()
+    while len(lines) < n:
+        lines.add(" ".join([rng.choice(programs)] + rng.sample(words, rng.randint(1, 5))))
+    return sorted(lines)
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    candidates = make_candidates(n)
+    start = time.perf_counter()
+    index = FuzzyIndex(candidates)
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"⏱️ Fuzzy search over {n} candidates (index built in {build_ms:.1f} ms)")
+    print("=" * 60)
+    print(f"{'query':<24}{'keys':>6}{'mean ms':>10}{'max ms':>10}{'hits':>8}")
+    worst = 0.0
+    for query in QUERIES:
+        times = []
+        for end in range(1, len(query) + 1):
+            start = time.perf_counter()
+            matches = index.search(query[:end], limit=50)
+            times.append((time.perf_counter() - start) * 1000)
+        worst = max(worst, max(times))
+        print(f"{query:<24}{len(times):>6}{sum(times) / len(times):10.2f}{max(times):10.2f}{len(matches):>8}")
+    verdict = "within" if worst <= BUDGET_MS else "OVER"
+    print(f"slowest keystroke {worst:.2f} ms, {verdict} the {BUDGET_MS} ms budget")
+    return 0 if worst <= BUDGET_MS else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Benchmark native pipeline execution against running the line through /bin/sh.
+
+Usage: python bench_pipeline.py [runs]
+"""
+
+import sys
+import os
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from exec_core import get_core
+
+COMMANDS = [
+    "uname -a",
+    "cat /etc/hostname",
+    "echo hello | tr a-z A-Z",
+    "printf 'b\\na\\nb\\n' | sort | uniq -c",
+    "ls -la | sort | head -5 > /dev/null",
+]
+
+def time_command(core, command, runs):
+    """Average wall time of one command in milliseconds"""
+    core.run(command)  # warm up
+    start = time.perf_counter()
+    for _ in range(runs):
+        core.run(command)
+    return (time.perf_counter() - start) * 1000 / runs
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    core = get_core()
+    print(f"⏱️ Native pipelines vs /bin/sh ({runs} runs each)")
+    print("=" * 60)
+    print(f"{'command':<40}{'sh ms':>8}{'native':>8}{'speedup':>10}")
+    for command in COMMANDS:
+        core.native_pipelines = False
+        shell_ms = time_command(core, command, runs)
+        core.native_pipelines = True
+        native_ms = time_command(core, command, runs)
+        print(f"{command:<40}{shell_ms:8.2f}{native_ms:8.2f}{shell_ms / native_ms:9.2f}x")
+
+if __name__ == "__main__":
+    main()
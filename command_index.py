@@ -0,0 +1,136 @@
+"""
+Persistent index of the commands that can be run.
+
+Listing every PATH directory and asking a login bash for `compgen -c` can
+take seconds, so the result is saved in ~/.magicshell/command_index.json
+together with the mtime of each directory. load() returns the saved commands
+at once; refresh() rescans only the directories whose mtime changed, asks bash
+again and saves the index if anything differs. refresh() blocks, so run it off
+the UI thread.
+"""
+import json
+import os
+import shutil
+import subprocess
+import threading
+
+INDEX_FILE = os.path.join(os.path.expanduser("~"), ".magicshell", "command_index.json")
+INDEX_VERSION = 1
+COMPGEN_TIMEOUT = 10  # seconds a slow login profile gets before compgen is skipped
+
+
+def path_dirs():
+    """The PATH directories in order, without duplicates"""
+    seen = []
+    for directory in os.environ.get("PATH", "").split(os.pathsep):
+        if directory and directory not in seen:
+            seen.append(directory)
+    return seen
+
+
+def scan_directory(directory):
+    """Names of the executable files in one directory"""
+    names = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                # is_file() uses the dirent type; stat() is only called for candidates and cached on the entry
+                if entry.is_file() and entry.stat().st_mode & 0o111:
+                    names.append(entry.name)
+            except OSError:
+                continue
+    return sorted(names)
+
+
+def _compgen():
+    """Every name bash can run (builtins, aliases, functions and PATH commands), or None"""
+    try:
+        out = subprocess.run(["bash", "-lc", "compgen -c"], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL, text=True, timeout=COMPGEN_TIMEOUT).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return sorted({line.strip() for line in out.splitlines() if line.strip()})
+
+
+class CommandIndex:
+    def __init__(self, path=None, include_compgen=True):
+        self.path = path or INDEX_FILE
+        self.include_compgen = include_compgen
+        self.dirs = {}      # directory -> (mtime_ns, [command names])
+        self.compgen = []   # output of `compgen -c`
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Read the saved index and return its commands (empty before the first refresh)"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return []
+        if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+            return []
+        with self._lock:
+            self.dirs = {d: (entry["mtime_ns"], entry["commands"]) for d, entry in data.get("dirs", {}).items()}
+            self.compgen = data.get("compgen", []) if self.include_compgen else []
+        return self.commands()
+
+    def commands(self):
+        """Every indexed command on the current PATH, sorted"""
+        with self._lock:
+            names = set(self.compgen)
+            for directory in path_dirs():
+                if directory in self.dirs:
+                    names.update(self.dirs[directory][1])
+        return sorted(names)
+
+    def refresh(self):
+        """
+        Rescan the PATH directories whose mtime changed and rerun compgen;
+        returns (commands, changed) and saves the index when it changed.
+        """
+        with self._lock:
+            old_dirs, old_compgen = dict(self.dirs), self.compgen
+        dirs = {}
+        for directory in path_dirs():
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            cached = old_dirs.get(directory)
+            if cached is not None and cached[0] == mtime:
+                dirs[directory] = cached
+                continue
+            try:
+                dirs[directory] = (mtime, scan_directory(directory))
+            except OSError:
+                continue
+        compgen = old_compgen
+        if self.include_compgen and shutil.which("bash"):
+            compgen = _compgen()
+            if compgen is None:
+                compgen = old_compgen
+        changed = dirs != old_dirs or compgen != old_compgen
+        with self._lock:
+            self.dirs, self.compgen = dirs, compgen
+        if changed:
+            self.save()
+        return self.commands(), changed
+
+    def save(self):
+        with self._lock:
+            data = {
+                "version": INDEX_VERSION,
+                "dirs": {d: {"mtime_ns": mtime, "commands": names} for d, (mtime, names) in self.dirs.items()},
+                "compgen": self.compgen,
+            }
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
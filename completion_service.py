@@ -0,0 +1,382 @@
+"""
+One completion service for the CLI and the GUI.
+
+CompletionService owns everything completion needs: the index of runnable
+commands (command_index), the frecency ranking of each history file, the
+fuzzy matcher, the directory listing cache for paths and the flag index.
+ShellCompleter in app.py and PTCompleter in the GUI only turn its
+suggestions into prompt_toolkit completions.
+
+Each shell window can hold a service of its own, or all of them can share one
+warm service in a separate long-lived process:
+
+    python completion_service.py [--socket PATH]
+
+serves it on a Unix socket (~/.magicshell/completion.sock by default) with
+one JSON request and one JSON reply per line. With COMPLETION_SERVICE =
+"shared" in config.py a window connects to that socket, starting the server
+when none is running, and falls back to a local service when it cannot. The
+server completes commands from its own PATH.
+"""
+import concurrent.futures
+import json
+import os
+import platform
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from prompt_toolkit.completion import Completion
+
+from command_index import CommandIndex
+import flag_index
+from flag_index import FlagIndex
+from frecency import Frecency, frecency_path
+from fuzzy import FuzzyIndex, fragments
+import history_store
+import path_cache
+from prefix_index import PrefixIndex
+
+SOCKET_PATH = os.path.join(os.path.expanduser("~"), ".magicshell", "completion.sock")
+MAX_COMPLETIONS = 50
+MAX_RANKINGS = 16             # history files whose frecency model is kept loaded
+SEED_LINES = 20000            # most recent history lines a new frecency model is seeded from
+REFRESH_INTERVAL = 300        # seconds before a warm() rescans the command index again
+CLIENT_TIMEOUT = 0.5          # seconds a window waits for the shared service
+SERVER_START_TIMEOUT = 3.0    # seconds to wait for a started server to listen
+SNIPPETS = ["ls -la", "git status", "docker ps", "python3 -m http.server"]
+PATH_PREFIXES = ("/", "./", "../", "~")
+
+# text replaces start_position characters before the cursor; positions are the matched characters of text
+Suggestion = namedtuple("Suggestion", ["text", "start_position", "positions", "meta"])
+
+
+def from_config(config, submit=None, history_file=None):
+    """The completion service configured in config.py, warmed for history_file; `submit` runs background work"""
+    if getattr(config, "COMPLETION_SERVICE", "local") == "shared":
+        client = CompletionClient.connect(start=True, history_file=history_file)
+        if client is not None:
+            return client
+    service = service_from_config(config, submit)
+    service.warm(history_file)
+    return service
+
+
+def service_from_config(config, submit=None):
+    """A CompletionService of this process with the path and flag settings of config.py"""
+    return CompletionService(directory_cache=path_cache.from_config(config),
+                             flag_index=flag_index.from_config(config, submit), submit=submit)
+
+
+def to_completions(suggestions):
+    """prompt_toolkit Completions of suggestions, with the matched characters styled"""
+    for s in suggestions:
+        yield Completion(s.text, start_position=s.start_position, display=fragments(s.text, s.positions),
+                         display_meta=s.meta or "")
+
+
+class CompletionService:
+    """Completions of command lines; safe to use from any thread"""
+
+    def __init__(self, command_index=None, directory_cache=None, flag_index=None, submit=None):
+        # runs fn(*args) on a worker; the default is a small pool of its own
+        self._submit = submit or concurrent.futures.ThreadPoolExecutor(2, thread_name_prefix="magicshell-completion").submit
+        self.command_index = command_index or CommandIndex(include_compgen=(platform.system() != "Windows"))
+        self.path_cache = directory_cache or path_cache.DirectoryCache()
+        self.flags = flag_index or FlagIndex(submit=self._submit)
+        self.index = PrefixIndex(SNIPPETS)   # commands, snippets and every history line seen
+        self.fuzzy = FuzzyIndex(SNIPPETS)
+        # history lines, which go before snippets and commands in fuzzy order: best ranked first as of the last
+        # batch, and those run since then, last run last, which fuzzy search scores first while they are fresh
+        self._lines = []
+        self._fresh = []
+        self._commands = []
+        self._rankings = OrderedDict()       # history file -> Frecency
+        self._loading = set()                # history files whose Frecency is being built on a worker
+        self._lock = threading.Lock()
+        self._refreshed = None               # time of the last command index refresh
+
+    def warm(self, history_file=None):
+        """
+        Load the saved command index and rescan it in the background, at most every REFRESH_INTERVAL.
+        The ranking of history_file is built in the background too, so no keystroke waits for it.
+        """
+        if history_file:
+            self._ranking_soon(history_file)
+        with self._lock:
+            if self._refreshed is not None and time.time() - self._refreshed < REFRESH_INTERVAL:
+                return
+            first = self._refreshed is None
+            self._refreshed = time.time()
+        if first:
+            self._set_commands(self.command_index.load())
+        self._submit(self._refresh)
+
+    def _refresh(self):
+        commands, changed = self.command_index.refresh()
+        if changed or not self._commands:
+            self._set_commands(commands)
+
+    def _set_commands(self, commands):
+        with self._lock:
+            self._commands = list(commands)
+            self._lines, self._fresh = self._fresh[::-1] + self._lines, []
+            self.index = PrefixIndex(self._commands + SNIPPETS + self._lines)
+            self.fuzzy.update(self._lines + SNIPPETS + self._commands)
+
+    def ranking(self, history_file):
+        """The frecency model of a history file or HistoryStore database, seeded from its last lines on first use"""
+        with self._lock:
+            model = self._rankings.get(history_file)
+            if model is not None:
+                self._rankings.move_to_end(history_file)
+                return model
+        model = Frecency(frecency_path(history_file))
+        if not len(model):
+            history = history_store.read_commands(history_file, limit=SEED_LINES)
+            if history:
+                model.seed(history)
+        with self._lock:
+            model = self._rankings.setdefault(history_file, model)
+            while len(self._rankings) > MAX_RANKINGS:
+                self._rankings.popitem(last=False)
+        with self._lock:
+            new = [line for line in model.rank(list(model.entries)) if self.index.add(line)]
+            # one batch: every history line in frecency order, ahead of snippets and commands
+            self._lines = model.rank(self._fresh[::-1] + self._lines + new)
+            self._fresh = []
+            self.fuzzy.promote(self._lines)
+        return model
+
+    def _ranking_soon(self, history_file):
+        """The frecency model of a history file if it is built; otherwise it is built on a worker and None returned"""
+        with self._lock:
+            model = self._rankings.get(history_file)
+            if model is not None or history_file in self._loading:
+                return model
+            self._loading.add(history_file)
+        self._submit(self._build_ranking, history_file)
+        with self._lock:
+            return self._rankings.get(history_file)
+
+    def _build_ranking(self, history_file):
+        try:
+            self.ranking(history_file)
+        finally:
+            with self._lock:
+                self._loading.discard(history_file)
+
+    def record(self, command, history_file=None):
+        """Note that a command line was run: rank it, make it completable and index its program's flags"""
+        command = command.strip()
+        if not command:
+            return
+        if history_file:
+            self.ranking(history_file).visit(command)
+        with self._lock:
+            for line in dict.fromkeys([command, command.split()[0]]):
+                if self.index.add(line):
+                    self._fresh.append(line)
+                    self.fuzzy.add(line)
+        self.flags.learn(command)
+
+    def complete(self, text, cwd, history_file=None, limit=MAX_COMPLETIONS):
+        """Suggestions for the text before the cursor, best first"""
+        words = text.split()
+        last = words[-1] if words and not text[-1].isspace() else ""
+        if last.startswith("-") and len(words) > 1:
+            return [Suggestion(flag, -len(last), list(range(len(last))), description)
+                    for flag, description in self.flags.complete(words[0], last)[:limit]]
+        if last.startswith(PATH_PREFIXES) or "/" in last:
+            return self._paths(last, cwd, limit)
+        suggestions = self._lines_for(text, history_file, limit)
+        if len(words) > 1 and len(suggestions) < limit:
+            # an argument: files in the directory too
+            suggestions += self._paths(last, cwd, limit - len(suggestions))
+        return suggestions
+
+    def _lines_for(self, text, history_file, limit):
+        # whole lines: most used recent ones, then the index by prefix, then fuzzy matches; until the ranking is
+        # built the lines come without it
+        model = self._ranking_soon(history_file) if history_file and text else None
+        ranked = model.search(text, limit=limit) if model is not None else []
+        with self._lock:
+            index, fuzzy = self.index, self.fuzzy
+        shown = ranked + [e for e in index.search(text, limit=limit) if e not in ranked]
+        suggestions = [Suggestion(e, -len(text), list(range(len(text))), None) for e in shown[:limit]]
+        if len(suggestions) < limit and text.strip():
+            seen = set(shown)
+            for match in fuzzy.search(text, limit=limit):
+                if match.text not in seen and len(suggestions) < limit:
+                    seen.add(match.text)
+                    suggestions.append(Suggestion(match.text, -len(text), match.positions, None))
+        return suggestions
+
+    def _paths(self, word, cwd, limit):
+        head, prefix = os.path.split(word)
+        directory = os.path.join(cwd, os.path.expanduser(head) if head else "")
+        return [Suggestion(name, -len(prefix), list(range(len(prefix))), None)
+                for name in self.path_cache.complete(directory, prefix, limit=limit)]
+
+
+class CompletionClient:
+    """The CompletionService of a server process, with the same methods; errors give no suggestions"""
+
+    def __init__(self, path, sock):
+        self.path = path
+        self._sock = sock
+        self._reader = sock.makefile("r", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    @classmethod
+    def connect(cls, path=SOCKET_PATH, start=False, history_file=None):
+        """A client of the server at path, starting one first if asked, warmed for history_file; None without one"""
+        if not hasattr(socket, "AF_UNIX"):
+            return None
+        client = cls._try_connect(path)
+        if client is None and start:
+            try:
+                subprocess.Popen([sys.executable, os.path.abspath(__file__), "--socket", path],
+                                 stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                 start_new_session=True)
+            except OSError:
+                return None
+            deadline = time.time() + SERVER_START_TIMEOUT
+            while client is None and time.time() < deadline:
+                time.sleep(0.05)
+                client = cls._try_connect(path)
+        if client is not None:
+            client.warm(history_file)
+        return client
+
+    @classmethod
+    def _try_connect(cls, path):
+        sock = cls._open(path)
+        return None if sock is None else cls(path, sock)
+
+    @staticmethod
+    def _open(path):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(CLIENT_TIMEOUT)
+        try:
+            sock.connect(path)
+        except OSError:
+            sock.close()
+            return None
+        return sock
+
+    def _call(self, request):
+        with self._lock:
+            if self._sock is None:
+                # the last call failed; a restarted server gets a new connection
+                self._sock = self._open(self.path)
+                if self._sock is None:
+                    return None
+                self._reader = self._sock.makefile("r", encoding="utf-8")
+            try:
+                self._sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+                reply = self._reader.readline()
+            except OSError:
+                reply = ""
+            if not reply:
+                # a late reply would answer the next request, so the connection is dropped
+                self.close()
+                return None
+        try:
+            return json.loads(reply)
+        except ValueError:
+            return None
+
+    def warm(self, history_file=None):
+        self._call({"op": "warm", "history_file": history_file})
+
+    def record(self, command, history_file=None):
+        self._call({"op": "record", "command": command, "history_file": history_file})
+
+    def complete(self, text, cwd, history_file=None, limit=MAX_COMPLETIONS):
+        reply = self._call({"op": "complete", "text": text, "cwd": cwd, "history_file": history_file, "limit": limit})
+        if not reply:
+            return []
+        return [Suggestion(*item) for item in reply.get("suggestions", [])]
+
+    def close(self):
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        service = self.server.service
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                op = request.get("op")
+                if op == "complete":
+                    suggestions = service.complete(request["text"], request["cwd"], request.get("history_file"),
+                                                   request.get("limit", MAX_COMPLETIONS))
+                    reply = {"suggestions": [list(s) for s in suggestions]}
+                elif op == "record":
+                    service.record(request["command"], request.get("history_file"))
+                    reply = {"ok": True}
+                elif op == "warm":
+                    service.warm(request.get("history_file"))
+                    reply = {"ok": True}
+                else:
+                    reply = {"error": f"unknown op {op!r}"}
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                reply = {"error": str(e)}
+            self.wfile.write((json.dumps(reply) + "\n").encode("utf-8"))
+
+
+class CompletionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path=SOCKET_PATH, service=None):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if os.path.exists(path):
+            sock = CompletionClient._open(path)
+            if sock is not None:
+                sock.close()
+                raise OSError(f"a completion server is already listening on {path}")
+            os.remove(path)  # left over from a server that died
+        self.service = service or CompletionService()
+        old_umask = os.umask(0o077)  # only this user may connect
+        try:
+            super().__init__(path, _Handler)
+        finally:
+            os.umask(old_umask)
+        self.service.warm()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    path = argv[argv.index("--socket") + 1] if "--socket" in argv else SOCKET_PATH
+    import config  # the windows' settings; only the server process needs them
+    try:
+        server = CompletionServer(path, service=service_from_config(config))
+    except OSError as e:
+        print(f"completion server: {e}", file=sys.stderr)
+        return 1
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
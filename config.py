@@ -7,3 +7,67 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 USE_PROXY = True
 PROXY_URL = "http://172.31.100.27:3128  "
+
+# Run commands in one long-lived bash session (keeps exports, aliases, functions)
+PERSISTENT_SHELL = False
+
+# GUI: run every foreground command on a pseudo-terminal (REPLs always do)
+PTY_MODE = False
+
+# Run simple ls/cat/head/wc/mkdir/touch/echo lines inside MagicShell instead of
+# starting the real programs (anything they can't handle still runs normally)
+FAST_BUILTINS = True
+
+# Default limits for every command, None for unlimited. One command can override
+# them with a prefix: /limit timeout=30 cpu=10 mem=512M files=256 <command>
+COMMAND_TIMEOUT = None            # wall-clock seconds, then SIGTERM and SIGKILL
+COMMAND_CPU_LIMIT = None          # CPU seconds
+COMMAND_MEMORY_LIMIT = None       # address space, e.g. "2G"
+COMMAND_OPEN_FILES_LIMIT = None   # open file descriptors
+
+# Reuse the output of read-only commands while nothing they look at has changed.
+# Each command maps to what is checked: "entries" (its paths and their directory
+# entries), "tree" (everything below its paths) or "repo" (the git work tree).
+# Prefix a command with /nocache to run it anyway.
+RESULT_CACHE = False
+RESULT_CACHE_COMMANDS = {
+    "ls": "entries",
+    "wc": "entries",
+    "du": "tree",
+    "tree": "tree",
+    "git status": "repo",
+    "git diff": "repo",
+    "git log": "repo",
+    "git branch": "repo",
+}
+
+# GUI: start allow-listed read-only commands while the user pauses typing, so
+# their output is ready the moment Enter is pressed. Off by default: commands
+# then run without Enter, and even read-only ones have side effects (git status
+# takes .git/index.lock, docker ps talks to the daemon)
+SPECULATIVE_EXECUTION = False
+SPECULATIVE_COMMANDS = [
+    "ls", "git status", "git diff", "git log", "git branch",
+    "docker ps", "docker images",
+]
+
+# Path completion reuses directory listings until the directory changes. Reading
+# one directory stops after this many names; on Linux inotify drops a listing as
+# soon as an entry is added or removed.
+PATH_COMPLETION_MAX_ENTRIES = 50000
+PATH_COMPLETION_INOTIFY = True
+
+# Completion: "local" keeps the command index, history ranking and caches in each
+# window; "shared" uses one warm completion server over a Unix socket, started on
+# demand (python completion_service.py)
+COMPLETION_SERVICE = "local"
+
+# Command history of the CLI and every GUI window: one SQLite database with the
+# directory, exit code and wall time of each command, searchable by substring
+HISTORY_DB = "~/.magicshell/history.db"
+
+# Flag completion reads each program's man page. `program --help` runs the
+# program again, so it is only used for the well-known programs in
+# flag_index.HELP_COMMANDS; True allows it for any program except scripts given
+# by path or installed under your home directory
+FLAG_COMPLETION_RUN_HELP = False
@@ -0,0 +1,744 @@
+"""
+Asynchronous execution core shared by the MagicShell CLI and GUI.
+
+A single asyncio event loop, running on one background thread, owns every
+child process. Commands can be submitted from any thread. Their output is
+streamed to a callback in arrival order as OutputChunks, and completion is
+reported through a handle that can be waited on, signalled or cancelled.
+No thread is started per command. On POSIX every child is reaped with
+os.wait4(), so each CommandResult carries the wall time, CPU time and peak RSS
+of the command in a ResourceUsage.
+
+Command lines in the subset understood by pipeline.parse() are run natively:
+each stage is exec'd directly and the stages are connected with OS pipes, so
+no /bin/sh process is started. Anything else goes through the shell. With
+builtins=True, lines made only of the commands in fast_builtins run inside
+this process.
+"""
+import asyncio
+import codecs
+import locale
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import fast_builtins
+from pipeline import SimpleCommand, parse
+from shell_session import set_controlling_tty, set_winsize
+
+READ_SIZE = 64 * 1024
+KILL_GRACE = 2.0  # seconds between SIGTERM and SIGKILL when stopping a command
+CHILD_POLL_INTERVAL = 0.05  # longest wait, in seconds, between checks for exited children where there is no pidfd
+
+# signals that pause or resume a command rather than end it
+_JOB_CONTROL = {getattr(signal, name) for name in ("SIGSTOP", "SIGTSTP", "SIGCONT") if hasattr(signal, name)}
+
+# A piece of process output: which pipe it came from, the decoded text and
+# the time.monotonic() value at which it was read
+OutputChunk = namedtuple("OutputChunk", ["stream", "text", "timestamp"])
+
+
+def _make_decoder():
+    return codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors="replace")
+
+
+class ResourceUsage:
+    """
+    What a finished command used: wall and CPU time in seconds and peak resident
+    set size in KiB. CPU and RSS are None when they could not be measured.
+    """
+
+    def __init__(self, wall, user=None, system=None, max_rss=None):
+        self.wall = wall
+        self.user = user
+        self.system = system
+        self.max_rss = max_rss
+
+    @classmethod
+    def of_children(cls, wall, procs):
+        """Sum the usage of reaped _NativeProcesses"""
+        procs = [proc for proc in procs if proc.rusage is not None]
+        if not procs:
+            return cls(wall)
+        peaks = [proc.max_rss for proc in procs if proc.max_rss is not None]
+        return cls(
+            wall,
+            user=sum(proc.rusage.ru_utime for proc in procs),
+            system=sum(proc.rusage.ru_stime for proc in procs),
+            max_rss=max(peaks) if peaks else None,
+        )
+
+    @classmethod
+    def combined(cls, wall, usages):
+        """Add up the CPU time of several commands that ran within `wall` seconds"""
+        timed = [usage for usage in usages if usage is not None and usage.user is not None]
+        if not timed:
+            return cls(wall)
+        peaks = [usage.max_rss for usage in timed if usage.max_rss is not None]
+        return cls(
+            wall,
+            user=sum(usage.user for usage in timed),
+            system=sum(usage.system for usage in timed),
+            max_rss=max(peaks) if peaks else None,
+        )
+
+    def summary(self):
+        parts = [f"{self.wall:.2f}s wall"]
+        if self.user is not None:
+            parts.append(f"{self.user:.2f}s user, {self.system:.2f}s sys")
+        if self.max_rss:
+            parts.append(f"{self.max_rss / 1024:.1f} MiB max RSS")
+        return ", ".join(parts)
+
+    def __repr__(self):
+        return f"ResourceUsage({self.summary()})"
+
+
+class CommandResult:
+    """Outcome of a finished command"""
+
+    def __init__(self, returncode, timed_out=False, cancelled=False, usage=None, cached=False):
+        self.returncode = returncode
+        self.timed_out = timed_out
+        self.cancelled = cancelled
+        self.usage = usage      # ResourceUsage of the command
+        self.cached = cached    # the output was replayed from a result_cache.ResultCache
+
+    def __repr__(self):
+        return f"CommandResult(returncode={self.returncode}, timed_out={self.timed_out}, cancelled={self.cancelled})"
+
+
+class CommandHandle:
+    """A submitted command; safe to use from any thread"""
+
+    def __init__(self, core, command):
+        self.core = core
+        self.command = command
+        self.pid = None         # process (group leader) of the running command
+        self.pids = []          # every stage of a native pipeline, each its own group when detached
+        self.pgid = None        # process group of the running pipeline when not detached
+        self.tty = None         # terminal fd handed to that group while it runs, when not detached
+        self.stop = None        # threading.Event stopping the line while fast builtins run it in-process
+        self.pty_fd = None      # pty master while a pty command runs
+        self.rlimits = []       # (resource, (soft, hard)) pairs set in every child
+        self.detached = True    # runs in its own session/process group
+        self.future = None      # concurrent.futures.Future of the CommandResult
+        self._procs = []        # every process started for the command, for accounting
+        self._cancel_pending = False  # cancel() came before the command started
+        self._task = None       # asyncio task, only touched on the loop thread
+
+    def result(self, timeout=None):
+        """Block until the command finishes and return its CommandResult"""
+        return self.future.result(timeout)
+
+    def done(self):
+        return self.future.done()
+
+    def send_signal(self, sig):
+        """Signal the command's process group(s); returns False if it is not running"""
+        if self.done():
+            return False
+        if self.stop is not None:
+            # in-process builtins can't be paused, but anything that would end a process stops them
+            if sig in _JOB_CONTROL:
+                return False
+            self.stop.set()
+            return True
+        if self.pid is None:
+            return False
+        kill = os.killpg if (self.detached or self.pgid is not None) and hasattr(os, "killpg") else os.kill
+        sent = False
+        # last stage first, so a reader can't see EOF and exit cleanly before its own signal arrives
+        targets = [self.pgid] if self.pgid is not None else reversed(self.pids or [self.pid])
+        for pid in targets:
+            try:
+                kill(pid, sig)
+                sent = True
+            except OSError:
+                pass
+        return sent
+
+    def cancel(self):
+        """Stop the command: SIGTERM, then SIGKILL after KILL_GRACE"""
+        if self.done():
+            return False
+        self.core.loop.call_soon_threadsafe(self._cancel_task)
+        return True
+
+    def write_input(self, text):
+        """Write to the command's terminal (pty commands only)"""
+        if self.pty_fd is not None:
+            os.write(self.pty_fd, text.encode())
+
+    def _cancel_task(self):
+        if self._task is None:
+            self._cancel_pending = True
+        elif not self._task.done():
+            self._task.cancel()
+
+
+class ExecutionCore:
+    def __init__(self):
+        self.native_pipelines = os.name == "posix"  # run simple lines without /bin/sh
+        self.loop = asyncio.new_event_loop()
+        self._children = _ChildWatcher.create(self.loop)  # None where children are watched with a pidfd
+        self._thread = threading.Thread(target=self._run_loop, name="magicshell-exec", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    # submission (any thread)
+    def submit(self, command, cwd=None, env=None, on_output=None, timeout=None,
+               detach=True, pty_size=None, builtins=False, rlimits=None, cache=None):
+        """
+        Start a shell command and return its CommandHandle.
+
+        on_output(chunk) is called on the loop thread for every OutputChunk.
+        With pty_size=(rows, cols) the command runs on a pseudo-terminal and
+        all of its output arrives as "stdout". detach=True starts every stage in
+        a session of its own; detach=False runs each pipeline in a process group
+        of its own that is handed the caller's terminal while it runs, as a
+        shell does, so Ctrl-C reaches the command and not the caller. Either
+        way a timeout or cancel() signals whole process groups, so nothing the
+        command started is left running.
+        builtins=True lets fast_builtins run the line in-process when it can.
+        rlimits, a list of (resource, (soft, hard)) as made by
+        limits.ResourceLimits.rlimits(), is applied with setrlimit() in each child.
+        On timeout the command gets SIGTERM, then SIGKILL after KILL_GRACE.
+        cache, a result_cache.ResultCache, answers allow-listed read-only
+        commands from earlier runs while the files they look at are unchanged.
+        """
+        handle = CommandHandle(self, command)
+        handle.detached = detach or pty_size is not None
+        handle.tty = None if handle.detached else _foreground_tty()
+        handle.rlimits = rlimits or []
+        # builtins run inside this process, where rlimits can't apply; a timeout stops them like a process
+        use_builtins = builtins and pty_size is None and env is None and not handle.rlimits
+        # output under limits or on a terminal may differ from a plain run's
+        use_cache = cache if pty_size is None and not handle.rlimits else None
+        handle.future = asyncio.run_coroutine_threadsafe(
+            self._start(handle, cwd, env, on_output, timeout, pty_size, use_builtins, use_cache), self.loop
+        )
+        return handle
+
+    def run(self, command, **kwargs):
+        """Run a command and block until it finishes; returns its CommandResult"""
+        handle = self.submit(command, **kwargs)
+        try:
+            return handle.result()
+        except KeyboardInterrupt:
+            handle.cancel()
+            handle.result()
+            raise
+
+    def submit_call(self, fn, *args):
+        """Run a blocking callable on the loop's worker pool; returns a concurrent Future"""
+        return asyncio.run_coroutine_threadsafe(self._call(fn, *args), self.loop)
+
+    async def _call(self, fn, *args):
+        return await self.loop.run_in_executor(None, fn, *args)
+
+    # loop thread
+    async def _start(self, handle, cwd, env, on_output, timeout, pty_size, builtins, cache):
+        handle._task = asyncio.current_task()
+        started = time.monotonic()
+        if handle._cancel_pending:
+            return CommandResult(-signal.SIGTERM, cancelled=True, usage=ResourceUsage(0.0))
+        lookup = None
+        if cache is not None:
+            # fingerprinting stats files, so it runs on the worker pool
+            lookup = await self.loop.run_in_executor(None, cache.prepare, handle.command, cwd or os.getcwd(), env)
+            entry = cache.get(lookup) if lookup is not None else None
+            if entry is not None:
+                return self._replay(entry, on_output, started)
+            if lookup is not None:
+                on_output, chunks = _recording(on_output)
+        prepare = fast_builtins.compile_line(handle.command, cwd or os.getcwd()) if builtins else None
+        # the builtins look at the files they name, which may be slow, so they are prepared on the worker pool
+        run = await self.loop.run_in_executor(None, prepare) if prepare is not None else None
+        if run is not None:
+            result = await self._execute_builtins(handle, run, on_output, timeout, started)
+        else:
+            result = await self._execute(handle, cwd, env, on_output, timeout, pty_size)
+            result.usage = ResourceUsage.of_children(time.monotonic() - started, handle._procs)
+        if lookup is not None and result.returncode == 0 and not (result.timed_out or result.cancelled):
+            cache.put(lookup, chunks, result.returncode)
+        return result
+
+    @staticmethod
+    def _replay(entry, on_output, started):
+        if on_output is not None:
+            for stream, text in entry.chunks:
+                on_output(OutputChunk(stream, text, time.monotonic()))
+        return CommandResult(entry.returncode, usage=ResourceUsage(time.monotonic() - started), cached=True)
+
+    async def _execute(self, handle, cwd, env, on_output, timeout, pty_size):
+        emit = on_output or (lambda chunk: None)
+        if pty_size is None and os.name == "posix":
+            plan = parse(handle.command) if self.native_pipelines else None
+            # anything the parser doesn't handle becomes a single /bin/sh stage
+            plan = plan or [(None, [_shell_command(handle.command)])]
+            return await self._execute_native(handle, plan, cwd, env, emit, timeout)
+        if pty_size is not None:
+            proc, readers = await self._spawn_pty(handle, cwd, env, emit, pty_size)
+        else:
+            proc = await asyncio.create_subprocess_shell(
+                handle.command, cwd=cwd, env=env,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                start_new_session=handle.detached,
+            )
+            handle.pid = proc.pid
+            readers = [
+                self._pump(proc.stdout, "stdout", emit),
+                self._pump(proc.stderr, "stderr", emit),
+            ]
+
+        timed_out = cancelled = False
+        try:
+            await asyncio.wait_for(asyncio.gather(*readers, proc.wait()), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            await self._terminate(handle, [proc])
+        except asyncio.CancelledError:
+            cancelled = True
+            await self._terminate(handle, [proc])
+        finally:
+            if handle.pty_fd is not None:
+                self.loop.remove_reader(handle.pty_fd)
+                os.close(handle.pty_fd)
+                handle.pty_fd = None
+        return CommandResult(proc.returncode, timed_out=timed_out, cancelled=cancelled)
+
+    async def _pump(self, stream, name, emit):
+        decoder = _make_decoder()
+        while True:
+            data = await stream.read(READ_SIZE)
+            text = decoder.decode(data, final=not data)
+            if text:
+                emit(OutputChunk(name, text, time.monotonic()))
+            if not data:
+                return
+
+    async def _read_fd(self, fd, name, emit):
+        """Emit OutputChunks read from a non-blocking fd until EOF"""
+        decoder = _make_decoder()
+        eof = self.loop.create_future()
+
+        def on_readable():
+            try:
+                data = os.read(fd, READ_SIZE)
+            except BlockingIOError:
+                return
+            except OSError:
+                data = b""  # EIO: every slave end of a pty is closed
+            text = decoder.decode(data, final=not data)
+            if text:
+                emit(OutputChunk(name, text, time.monotonic()))
+            if not data and not eof.done():
+                eof.set_result(None)
+
+        self.loop.add_reader(fd, on_readable)
+        try:
+            await eof
+        finally:
+            self.loop.remove_reader(fd)
+
+    async def _spawn_pty(self, handle, cwd, env, emit, pty_size):
+        import pty
+
+        master, slave = pty.openpty()
+        set_winsize(master, *pty_size)
+        try:
+            popen = subprocess.Popen(
+                handle.command, shell=True, cwd=cwd, env=env,
+                stdin=slave, stdout=slave, stderr=slave,
+                start_new_session=True, preexec_fn=_child_setup(handle.rlimits, set_controlling_tty),
+            )
+        except BaseException:
+            os.close(master)
+            raise
+        finally:
+            os.close(slave)
+        os.set_blocking(master, False)
+        proc = _NativeProcess(self.loop, popen, self._children)
+        handle.pid = proc.pid
+        handle._procs.append(proc)
+        handle.pty_fd = master
+
+        return proc, [self._read_fd(master, "stdout", emit)]
+
+    async def _execute_builtins(self, handle, run, on_output, timeout, started):
+        # builtins run on the worker pool and hand their output back to the loop thread. They only touch
+        # regular files and directories, so they always finish; a timeout, cancel() or signal sets their
+        # stop event and they give up at their next block of work
+        emit = on_output or (lambda chunk: None)
+        handle.stop = stop = threading.Event()
+        decoders = {"stdout": _make_decoder(), "stderr": _make_decoder()}
+
+        def write(stream, data):
+            text = decoders[stream].decode(data)
+            if text:
+                self.loop.call_soon_threadsafe(emit, OutputChunk(stream, text, time.monotonic()))
+
+        def run_stoppable():
+            try:
+                return run(write, stop)
+            except fast_builtins.Stopped:
+                return -signal.SIGTERM
+
+        def run_timed():
+            # CPU time of the worker thread; memory is shared with MagicShell itself
+            if not hasattr(resource, "RUSAGE_THREAD"):
+                return run_stoppable(), None, None
+            before = resource.getrusage(resource.RUSAGE_THREAD)
+            returncode = run_stoppable()
+            after = resource.getrusage(resource.RUSAGE_THREAD)
+            return returncode, after.ru_utime - before.ru_utime, after.ru_stime - before.ru_stime
+
+        work = self.loop.run_in_executor(None, run_timed)
+        timed_out = cancelled = False
+        try:
+            returncode, user, system = await asyncio.wait_for(asyncio.shield(work), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+        except asyncio.CancelledError:
+            cancelled = True
+        if timed_out or cancelled:
+            stop.set()
+            returncode, user, system = await work
+        return CommandResult(returncode, timed_out=timed_out, cancelled=cancelled,
+                             usage=ResourceUsage(time.monotonic() - started, user, system))
+
+    # native pipelines
+    async def _execute_native(self, handle, plan, cwd, env, emit, timeout):
+        running = []  # processes of the pipeline currently executing
+        status = [0]
+        timed_out = cancelled = False
+        try:
+            await asyncio.wait_for(self._run_sequence(handle, plan, cwd, env, emit, running, status), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            await self._terminate(handle, running)
+        except asyncio.CancelledError:
+            cancelled = True
+            await self._terminate(handle, running)
+        if running and running[-1].returncode is not None:
+            status[0] = running[-1].returncode
+        return CommandResult(status[0], timed_out=timed_out, cancelled=cancelled)
+
+    async def _run_sequence(self, handle, plan, cwd, env, emit, running, status):
+        for connector, stages in plan:
+            if connector == "&&" and status[0] != 0 or connector == "||" and status[0] == 0:
+                continue
+            status[0] = await self._run_pipeline(handle, stages, cwd, env, emit, running)
+
+    async def _run_pipeline(self, handle, stages, cwd, env, emit, running):
+        """Start every stage connected by OS pipes; returns the last stage's exit code"""
+        running.clear()
+        handle.pid, handle.pids, handle.pgid = None, [], None
+        err_r, err_w = os.pipe()  # one stderr shared by every stage, as in a shell
+        out_r, out_w = os.pipe()
+        failed = None  # exit code of the last stage if it could not be started
+        pipe_in = None  # the first stage inherits our stdin, like the shell path
+        try:
+            for i, stage in enumerate(stages):
+                last = i == len(stages) - 1
+                next_in, pipe_out = (None, out_w) if last else os.pipe()
+                stdin, stdout = pipe_in, pipe_out
+                failed, opened = None, []
+                try:
+                    for redirect in stage.redirects:
+                        fd = self._open_redirect(redirect, cwd)
+                        opened.append(fd)
+                        if redirect.op == "<":
+                            stdin = fd
+                        else:
+                            stdout = fd
+                except OSError as e:
+                    failed = self._report_error(emit, redirect.target, e, 1)
+                try:
+                    if failed is None:
+                        proc = subprocess.Popen(
+                            stage.argv, executable=stage.path, cwd=cwd, env=env,
+                            stdin=stdin, stdout=stdout, stderr=err_w,
+                            start_new_session=handle.detached,
+                            preexec_fn=_child_setup(handle.rlimits, None if handle.detached else
+                                                    _job_setup(handle.pgid or 0, handle.tty)),
+                        )
+                        if not handle.detached and handle.pgid is None:
+                            handle.pgid = proc.pid  # the first stage leads the pipeline's group
+                        running.append(_NativeProcess(self.loop, proc, self._children))
+                        self._track_stage(handle, running[-1])
+                except OSError as e:
+                    failed = self._report_error(emit, stage.argv[0], e, 127 if isinstance(e, FileNotFoundError) else 126)
+                finally:
+                    # the children hold their own copies now
+                    for fd in opened + [pipe_in, None if last else pipe_out]:
+                        if fd is not None:
+                            os.close(fd)
+                pipe_in = next_in
+        finally:
+            os.close(out_w)
+            os.close(err_w)
+
+        try:
+            for fd in (err_r, out_r):
+                os.set_blocking(fd, False)
+            await asyncio.gather(
+                self._read_fd(err_r, "stderr", emit), self._read_fd(out_r, "stdout", emit),
+                *(proc.wait() for proc in running),
+            )
+        finally:
+            os.close(err_r)
+            os.close(out_r)
+            if handle.tty is not None and handle.pgid is not None:
+                _set_foreground(handle.tty, os.getpgrp())  # take the terminal back
+        return failed if failed is not None else running[-1].returncode
+
+    @staticmethod
+    def _report_error(emit, name, error, status):
+        emit(OutputChunk("stderr", f"magicshell: {name}: {error.strerror}\n", time.monotonic()))
+        return status
+
+    @staticmethod
+    def _track_stage(handle, proc):
+        if handle.pid is None:
+            handle.pid = proc.pid
+        handle.pids.append(proc.pid)
+        handle._procs.append(proc)
+
+    @staticmethod
+    def _open_redirect(redirect, cwd):
+        path = os.path.join(cwd or os.getcwd(), redirect.target)
+        if redirect.op == "<":
+            flags = os.O_RDONLY
+        elif redirect.op == ">>":
+            flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        else:
+            flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+        return os.open(path, flags, 0o666)
+
+    async def _terminate(self, handle, procs):
+        procs = [proc for proc in procs if proc.returncode is None]
+        if not procs:
+            return
+        handle.send_signal(signal.SIGTERM)
+        waiters = asyncio.gather(*(proc.wait() for proc in procs))
+        try:
+            await asyncio.wait_for(asyncio.shield(waiters), KILL_GRACE)
+        except asyncio.TimeoutError:
+            handle.send_signal(signal.SIGKILL if hasattr(signal, "SIGKILL") else signal.SIGTERM)
+            await waiters
+
+
+def _recording(on_output):
+    """Wrap an output callback so that the (stream, text) of every chunk is also kept"""
+    chunks = []
+
+    def record(chunk):
+        chunks.append((chunk.stream, chunk.text))
+        if on_output is not None:
+            on_output(chunk)
+
+    return record, chunks
+
+
+def _child_setup(rlimits, setup=None):
+    """preexec_fn applying rlimits after `setup`; None when there is nothing to do, so Popen can use vfork"""
+    if not rlimits and setup is None:
+        return None
+
+    def preexec():
+        if setup is not None:
+            setup()
+        for res, limit in rlimits:
+            resource.setrlimit(res, limit)
+
+    return preexec
+
+
+def _foreground_tty():
+    """fd 0 when it is a terminal whose foreground group is ours, so a command can be handed it; else None"""
+    try:
+        if os.isatty(0) and os.tcgetpgrp(0) == os.getpgrp():
+            return 0
+    except (AttributeError, OSError):
+        pass
+    return None
+
+
+def _set_foreground(fd, pgid):
+    # only a member of the foreground group may call tcsetpgrp() unless SIGTTOU is blocked
+    old = signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTTOU})
+    try:
+        os.tcsetpgrp(fd, pgid)
+    except OSError:
+        pass
+    finally:
+        signal.pthread_sigmask(signal.SIG_SETMASK, old)
+
+
+def _job_setup(pgid, tty):
+    """Child setup joining process group pgid (0: a new one led by the child), in the foreground of tty"""
+    def setup():
+        try:
+            os.setpgid(0, pgid)
+        except OSError:  # the group is gone already: lead a new one
+            os.setpgid(0, 0)
+        if tty is not None:
+            if pgid == 0:
+                _set_foreground(tty, os.getpgrp())
+            # the CLI has no job control to resume a stopped command, so Ctrl-Z is ignored
+            signal.signal(signal.SIGTSTP, signal.SIG_IGN)
+    return setup
+
+
+def _shell_command(command):
+    return SimpleCommand(["/bin/sh", "-c", command], [], path="/bin/sh")
+
+
+class _NativeProcess:
+    """
+    A Popen child with the wait()/returncode interface of an asyncio Process.
+    Its exit is watched with a pidfd on the event loop where available, and by
+    a _ChildWatcher elsewhere, which avoids the watcher thread asyncio starts
+    per child. It is reaped with os.wait4() so its resource usage is kept in
+    `rusage`.
+    """
+
+    def __init__(self, loop, popen, watcher=None):
+        self.popen = popen
+        self.pid = popen.pid
+        self.rusage = None
+        self.max_rss = None  # KiB, when it can be told apart from ours
+        # A child's ru_maxrss includes the peak RSS of the memory it was forked
+        # with, which is MagicShell's own; only a larger value is the command's.
+        self._launcher_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+        self._exited = loop.create_future()
+        if watcher is not None:
+            watcher.add(self)
+            return
+        try:
+            pidfd = os.pidfd_open(popen.pid)
+        except (AttributeError, OSError):
+            self._exited = loop.run_in_executor(None, self._reap)  # Windows: no pidfd and no SIGCHLD
+            return
+
+        def on_exit():
+            loop.remove_reader(pidfd)
+            os.close(pidfd)
+            self._exited.set_result(self._reap())
+
+        loop.add_reader(pidfd, on_exit)
+
+    def _reap(self, options=0):
+        # the exit code, or None when options has WNOHANG and the child is still running
+        if not hasattr(os, "wait4"):
+            return self.popen.wait()
+        try:
+            pid, status, rusage = os.wait4(self.pid, options)
+        except ChildProcessError:
+            return self.popen.wait()
+        if pid == 0:
+            return None
+        self.rusage = rusage
+        if self.rusage.ru_maxrss > self._launcher_rss:
+            # KiB on Linux, bytes on macOS
+            self.max_rss = self.rusage.ru_maxrss // (1024 if sys.platform == "darwin" else 1)
+        self.popen.returncode = os.waitstatus_to_exitcode(status)
+        return self.popen.returncode
+
+    @property
+    def returncode(self):
+        return self.popen.returncode
+
+    async def wait(self):
+        return await asyncio.shield(self._exited)
+
+
+class _ChildWatcher:
+    """
+    Reaps the _NativeProcess children of a loop where there is no pidfd
+    (macOS): one SIGCHLD handler checks them all with os.wait4(WNOHANG) on the
+    loop. A Python signal handler runs only once the main thread runs Python
+    code again, which it does not while it waits for a command (the CLI), so
+    they are also checked after 1 ms, then at doubling intervals up to
+    CHILD_POLL_INTERVAL, while any is running.
+    """
+
+    @classmethod
+    def create(cls, loop):
+        """A _ChildWatcher, or None where pidfds work or there is no SIGCHLD"""
+        if not hasattr(signal, "SIGCHLD") or not hasattr(os, "wait4"):
+            return None
+        try:
+            os.close(os.pidfd_open(os.getpid()))
+            return None
+        except (AttributeError, OSError):
+            return cls(loop)
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._children = {}  # pid -> _NativeProcess, touched only on the loop
+        self._polling = None  # the TimerHandle of the next check
+        self._delay = 0.001
+        try:
+            # only the main thread may set a handler; elsewhere the children are only polled
+            previous = signal.getsignal(signal.SIGCHLD)
+
+            def on_sigchld(signum, frame):
+                loop.call_soon_threadsafe(self.poll)
+                if callable(previous):
+                    previous(signum, frame)
+
+            signal.signal(signal.SIGCHLD, on_sigchld)
+        except ValueError:
+            pass
+
+    def add(self, process):
+        """Watch a child (on the loop); it may have exited already"""
+        self._children[process.pid] = process
+        self._delay = 0.001
+        if self._polling is not None:
+            self._polling.cancel()
+            self._polling = None
+        self.poll()
+
+    def poll(self):
+        for pid, process in list(self._children.items()):
+            returncode = process._reap(os.WNOHANG)
+            if returncode is not None:
+                del self._children[pid]
+                if not process._exited.done():
+                    process._exited.set_result(returncode)
+        if self._children and self._polling is None:
+            self._polling = self._loop.call_later(self._delay, self._poll_again)
+
+    def _poll_again(self):
+        self._polling = None
+        self._delay = min(self._delay * 2, CHILD_POLL_INTERVAL)
+        self.poll()
+
+
+_core = None
+_core_lock = threading.Lock()
+
+
+def get_core():
+    """Return the process-wide ExecutionCore, starting it on first use"""
+    global _core
+    with _core_lock:
+        if _core is None:
+            _core = ExecutionCore()
+        return _core
@@ -0,0 +1,434 @@
+"""
+In-process fast path for common small commands.
+
+ls, cat, head, wc, mkdir, touch and echo are run inside MagicShell for the
+option subsets listed on each function, saving the fork and exec of the real
+binary. compile_line() returns None for anything else. It only parses the
+line; the files it names are looked at by the prepare() it returns, which
+runs on a worker, not the event loop. prepare() returns None whenever an
+argument would make the real program print an error, or a file read is also
+the output (`cat f > f`), so that the binary runs and produces its exact
+messages and exit status. Output matches GNU coreutils
+when stdout is not a terminal. A running builtin checks its stop event between
+blocks of work, so it can be cancelled or timed out like a process.
+"""
+import locale
+import os
+import stat
+
+from pipeline import split
+
+READ_SIZE = 64 * 1024
+CHECK_EVERY = 1024  # directory entries read between checks of the stop event
+_READS_FILES = {"cat", "head", "wc"}  # builtins whose operands are files they read
+
+
+class _Unsupported(Exception):
+    """The command line uses options or arguments the fast path does not handle"""
+
+
+class Stopped(Exception):
+    """A running builtin saw its stop event set"""
+
+
+def compile_line(line, cwd):
+    """
+    Return prepare() for a line made only of fast builtins, or None if it must
+    run as real processes. Only the line is parsed here, so it is cheap enough
+    for the event loop. prepare() checks the files the line names, so it
+    belongs on a worker; it returns a callable run(write, stop=None) -> exit
+    status, or None if the real programs must run after all.
+    write(stream, data) receives bytes for "stdout" or "stderr". Once stop, a
+    threading.Event, is set, run raises Stopped at its next check.
+    """
+    sequence = split(line)
+    if not sequence:
+        return None
+    stages = []
+    for connector, pipeline in sequence:
+        if len(pipeline) != 1:
+            return None
+        stage = pipeline[0]
+        builtin = _BUILTINS.get(stage.argv[0])
+        if builtin is None or any(r.op == "<" for r in stage.redirects):
+            return None
+        stages.append((connector, builtin, stage))
+
+    def prepare():
+        steps = []
+        try:
+            for connector, builtin, stage in stages:
+                if stage.argv[0] in _READS_FILES:
+                    _check_not_output(stage.argv[1:], stage.redirects, cwd)
+                steps.append((connector, builtin(stage.argv[1:], cwd), stage.redirects))
+        except _Unsupported:
+            return None
+
+        def run(write, stop=None):
+            status = 0
+            for connector, runner, redirects in steps:
+                if connector == "&&" and status != 0 or connector == "||" and status == 0:
+                    continue
+                status = _run_step(runner, redirects, cwd, write, stop)
+            return status
+
+        return run
+
+    return prepare
+
+
+def _check_not_output(args, redirects, cwd):
+    """Leave `cat f > f` to the real program, which refuses it instead of emptying f"""
+    outputs = []
+    for redirect in redirects:
+        try:
+            outputs.append(os.stat(os.path.join(cwd, redirect.target)))
+        except OSError:
+            pass  # created by the redirection, so no operand can be it
+    for arg in args if outputs else ():
+        try:
+            st = os.stat(os.path.join(cwd, arg))
+        except OSError:
+            continue
+        if any(os.path.samestat(st, out) for out in outputs):
+            raise _Unsupported(arg)
+
+
+def _run_step(runner, redirects, cwd, write, stop):
+    out = _Output(write, stop)
+    out.check()
+    try:
+        for redirect in redirects:
+            flags = os.O_WRONLY | os.O_CREAT | (os.O_APPEND if redirect.op == ">>" else os.O_TRUNC)
+            try:
+                fd = os.open(os.path.join(cwd, redirect.target), flags, 0o666)
+            except OSError as e:
+                write("stderr", f"magicshell: {redirect.target}: {e.strerror}\n".encode())
+                return 1
+            out.redirect(fd)
+        return runner(out, lambda text: write("stderr", text.encode()))
+    finally:
+        out.close()
+
+
+class _Output:
+    """stdout of a builtin: the write callback, or a file after a redirection"""
+
+    def __init__(self, write, stop=None):
+        self._write = write
+        self._stop = stop
+        self.fd = None
+
+    def check(self):
+        """Raise Stopped once the builtin should stop"""
+        if self._stop is not None and self._stop.is_set():
+            raise Stopped()
+
+    def redirect(self, fd):
+        if self.fd is not None:
+            os.close(self.fd)
+        self.fd = fd
+
+    def write(self, data):
+        self.check()
+        if self.fd is None:
+            if data:
+                self._write("stdout", data)
+            return
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view):]
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def _parse_flags(args, allowed):
+    """Split leading single-letter flags from operands; unknown flags are unsupported"""
+    flags = set()
+    for i, arg in enumerate(args):
+        if arg == "--":
+            return flags, args[i + 1:]
+        if not arg.startswith("-") or arg == "-":
+            return flags, args[i:]
+        if arg.startswith("--") or not set(arg[1:]) <= set(allowed):
+            raise _Unsupported(arg)
+        flags.update(arg[1:])
+    return flags, []
+
+
+def _regular_files(paths, cwd):
+    """Absolute paths of readable regular files; anything else goes to the real binary"""
+    resolved = []
+    for path in paths:
+        if path == "-":
+            raise _Unsupported("stdin")
+        full = os.path.join(cwd, path)
+        try:
+            if not stat.S_ISREG(os.stat(full).st_mode) or not os.access(full, os.R_OK):
+                raise _Unsupported(path)
+        except OSError:
+            raise _Unsupported(path)
+        resolved.append(full)
+    return resolved
+
+
+def _byte_key(name):
+    return name.encode(errors="surrogateescape")
+
+
+def _collate_key():
+    """
+    The sort key of ls, which uses strcoll() in the user's locale: byte order
+    for C and POSIX, strxfrm() when this process already collates in the
+    user's locale (the entry points set it at startup), else None. The locale
+    is only queried here; setting it would change it for every thread.
+    """
+    wanted = os.environ.get("LC_ALL") or os.environ.get("LC_COLLATE") or os.environ.get("LANG") or "C"
+    if wanted in ("C", "POSIX") or wanted.startswith("C."):
+        return _byte_key
+    if locale.normalize(locale.setlocale(locale.LC_COLLATE)) == locale.normalize(wanted):
+        return locale.strxfrm
+    return None
+
+
+def _ls(args, cwd):
+    """ls [-a] [-A] [-1] [path...]"""
+    flags, paths = _parse_flags(args, "aA1")
+    paths = paths or ["."]
+    key = _collate_key()
+    if key is None:
+        raise _Unsupported("locale")  # the real ls sorts in a locale this process does not have
+    files, dirs = [], []
+    for path in paths:
+        full = os.path.join(cwd, path)
+        try:
+            is_dir = stat.S_ISDIR(os.stat(full).st_mode)
+        except OSError:
+            raise _Unsupported(path)
+        if is_dir and not os.access(full, os.R_OK | os.X_OK):
+            raise _Unsupported(path)
+        (dirs if is_dir else files).append((path, full))
+
+    def run(out, err):
+        lines = sorted((path for path, _ in files), key=key)
+        for i, (path, full) in enumerate(sorted(dirs, key=lambda d: key(d[0]))):
+            if lines or i:
+                lines.append("")
+            if len(paths) > 1:
+                lines.append(f"{path}:")
+            names = []
+            with os.scandir(full) as entries:
+                for n, entry in enumerate(entries):
+                    if not n % CHECK_EVERY:
+                        out.check()
+                    if "a" in flags or "A" in flags or not entry.name.startswith("."):
+                        names.append(entry.name)
+            if "a" in flags:
+                names += [".", ".."]
+            lines.extend(sorted(names, key=key))
+        if lines:
+            out.write(("\n".join(lines) + "\n").encode(errors="surrogateescape"))
+        return 0
+
+    return run
+
+
+def _cat(args, cwd):
+    """cat file... (regular files, no options)"""
+    flags, paths = _parse_flags(args, "")
+    if not paths:
+        raise _Unsupported("stdin")
+    files = _regular_files(paths, cwd)
+
+    def run(out, err):
+        for full in files:
+            with open(full, "rb") as f:
+                if out.fd is not None and _send_file(f.fileno(), out.fd, out.check):
+                    continue
+                for block in iter(lambda: f.read(READ_SIZE), b""):
+                    out.write(block)
+        return 0
+
+    return run
+
+
+def _send_file(in_fd, out_fd, check):
+    """Copy a whole file between descriptors in the kernel; False if sendfile can't be used"""
+    offset = 0
+    try:
+        while True:
+            check()
+            sent = os.sendfile(out_fd, in_fd, offset, READ_SIZE * 16)
+            if not sent:
+                return True
+            offset += sent
+    except (AttributeError, OSError):
+        if offset:
+            raise
+        return False
+
+
+def _head(args, cwd):
+    """head [-n N | -N] file..."""
+    count = 10
+    if args and args[0].startswith("-") and args[0][1:].isdigit():
+        count, args = int(args[0][1:]), args[1:]
+    elif args and args[0] == "-n" and len(args) > 1 and args[1].isdigit():
+        count, args = int(args[1]), args[2:]
+    elif args and args[0].startswith("-n") and args[0][2:].isdigit():
+        count, args = int(args[0][2:]), args[1:]
+    flags, paths = _parse_flags(args, "")
+    if not paths:
+        raise _Unsupported("stdin")
+    files = _regular_files(paths, cwd)
+
+    def run(out, err):
+        for i, (path, full) in enumerate(zip(paths, files)):
+            if len(paths) > 1:
+                header = ("\n" if i else "") + f"==> {path} <==\n"
+                out.write(header.encode(errors="surrogateescape"))
+            with open(full, "rb") as f:
+                for _ in range(count):
+                    line = f.readline()
+                    if not line:
+                        break
+                    out.write(line)
+        return 0
+
+    return run
+
+
+def _wc(args, cwd):
+    """wc [-l] [-w] [-c] file..."""
+    flags, paths = _parse_flags(args, "lwc")
+    if not paths:
+        raise _Unsupported("stdin")
+    files = _regular_files(paths, cwd)
+    fields = [f for f in "lwc" if f in flags] or ["l", "w", "c"]
+
+    def run(out, err):
+        rows = []
+        for path, full in zip(paths, files):
+            counts = {"l": 0, "w": 0, "c": 0}
+            in_word = False
+            with open(full, "rb") as f:
+                for block in iter(lambda: f.read(READ_SIZE), b""):
+                    out.check()
+                    counts["l"] += block.count(b"\n")
+                    counts["c"] += len(block)
+                    if "w" in fields:
+                        words = len(block.split())
+                        if in_word and not block[:1].isspace():
+                            words -= 1  # the word continues from the previous block
+                        counts["w"] += words
+                        in_word = not block[-1:].isspace()
+            rows.append((counts, path))
+        if len(rows) > 1:
+            rows.append(({f: sum(c[f] for c, _ in rows) for f in "lwc"}, "total"))
+        # GNU wc pads to the width of the total byte count, unless it prints a single number
+        if len(files) == 1 and len(fields) == 1:
+            width = 1
+        else:
+            width = len(str(sum(os.path.getsize(full) for full in files)))
+        lines = [" ".join(f"{counts[f]:{width}d}" for f in fields) + f" {path}" for counts, path in rows]
+        out.write(("\n".join(lines) + "\n").encode(errors="surrogateescape"))
+        return 0
+
+    return run
+
+
+def _mkdir(args, cwd):
+    """mkdir [-p] dir..."""
+    flags, paths = _parse_flags(args, "p")
+    if not paths:
+        raise _Unsupported("operand")
+    targets = []
+    for path in paths:
+        full = os.path.normpath(os.path.join(cwd, path))
+        if "p" in flags:
+            if os.path.isdir(full):
+                continue
+            parent = full
+            while not os.path.exists(parent):
+                parent = os.path.dirname(parent)
+            if not os.path.isdir(parent) or not os.access(parent, os.W_OK | os.X_OK):
+                raise _Unsupported(path)
+        elif os.path.lexists(full) or not os.access(os.path.dirname(full), os.W_OK | os.X_OK):
+            raise _Unsupported(path)
+        targets.append((path, full))
+
+    def run(out, err):
+        status = 0
+        for path, full in targets:
+            out.check()
+            try:
+                if "p" in flags:
+                    os.makedirs(full, exist_ok=True)
+                else:
+                    os.mkdir(full)
+            except OSError as e:
+                err(f"mkdir: cannot create directory '{path}': {e.strerror}\n")
+                status = 1
+        return status
+
+    return run
+
+
+def _touch(args, cwd):
+    """touch file... (no options)"""
+    flags, paths = _parse_flags(args, "")
+    if not paths:
+        raise _Unsupported("operand")
+    targets = []
+    for path in paths:
+        full = os.path.join(cwd, path)
+        if os.path.exists(full):
+            if not os.access(full, os.W_OK):
+                raise _Unsupported(path)
+        elif not os.access(os.path.dirname(full), os.W_OK | os.X_OK):
+            raise _Unsupported(path)
+        targets.append((path, full))
+
+    def run(out, err):
+        status = 0
+        for path, full in targets:
+            out.check()
+            try:
+                os.close(os.open(full, os.O_WRONLY | os.O_CREAT | os.O_NONBLOCK | os.O_NOCTTY, 0o666))
+                os.utime(full)
+            except OSError as e:
+                err(f"touch: cannot touch '{path}': {e.strerror}\n")
+                status = 1
+        return status
+
+    return run
+
+
+def _echo(args, cwd):
+    """echo [-n] word... (no backslash escapes)"""
+    newline = True
+    if args and args[0] == "-n":
+        newline, args = False, args[1:]
+    if any("\\" in arg or arg.startswith("-") for arg in args):
+        raise _Unsupported("escapes")  # /bin/sh's echo interprets these
+    text = " ".join(args) + ("\n" if newline else "")
+
+    def run(out, err):
+        out.write(text.encode(errors="surrogateescape"))
+        return 0
+
+    return run
+
+
+_BUILTINS = {
+    "ls": _ls,
+    "cat": _cat,
+    "head": _head,
+    "wc": _wc,
+    "mkdir": _mkdir,
+    "touch": _touch,
+    "echo": _echo,
+}
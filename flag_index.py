@@ -0,0 +1,198 @@
+"""
+Flag completion from an index of each program's --help output and man page.
+
+The first time a program is run, a worker reads its man page and keeps the
+flags it finds with their descriptions. Running `program --help` would run the
+program a second time, and a script or a tool that ignores its arguments would
+repeat what it did, so that is only done, when the man page lists no flags,
+for the well-known programs in HELP_COMMANDS, or for any program with
+FLAG_COMPLETION_RUN_HELP set in config.py. Even then it is never done for a
+program given by path (./build.sh) or installed under the home directory.
+Each program's index is saved under ~/.magicshell/flags together with the
+inode, size and mtime of the binary, and rebuilt when the binary changes.
+Completion only reads memory: an index is loaded from disk in the background
+the first time its program is completed, so the first keystrokes may not have
+flags yet.
+
+Only programs the user has run are indexed, and only the program itself, not
+subcommands such as `git commit`.
+"""
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+
+INDEX_DIR = os.path.join(os.path.expanduser("~"), ".magicshell", "flags")
+INDEX_VERSION = 1
+HELP_TIMEOUT = 5        # seconds `program --help` or man may take
+MAX_FLAGS = 500         # flags kept per program
+MAX_HELP_CHARS = 512 * 1024
+# programs whose --help only prints help, so it may be run to find their flags
+HELP_COMMANDS = frozenset({
+    "apt", "cargo", "cat", "cp", "curl", "df", "docker", "du", "find", "gcc", "git", "go", "grep", "head",
+    "kubectl", "ls", "make", "mkdir", "mv", "node", "npm", "pip", "pip3", "python", "python3", "rm", "rsync",
+    "sed", "sort", "ssh", "tail", "tar", "wc", "wget",
+})
+
+_OVERSTRIKE = re.compile(r".\x08")                  # bold and underline in unformatted man output
+_ANSI = re.compile(r"\x1b\[[0-9;]*m")
+_FLAG = re.compile(r"(?:^|(?<=[\s,/\[]))(--?[A-Za-z0-9?][\w.-]*)")
+
+
+def parse_help(text):
+    """[(flag, description)] from --help or man page text, first description of a flag wins"""
+    text = _ANSI.sub("", _OVERSTRIKE.sub("", text))
+    flags = {}
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped.startswith("-") or stripped.startswith("---"):
+            continue
+        # "  -a, --all     do not ignore entries" or a man page's flag line followed by an indented description
+        parts = re.split(r"\t+|\s{2,}", stripped, maxsplit=1)
+        spec = parts[0]
+        description = parts[1].strip().lstrip(":").strip() if len(parts) > 1 else ""
+        if not description and i + 1 < len(lines):
+            following = lines[i + 1].strip()
+            if following and not following.startswith("-"):
+                description = following
+        for flag in _FLAG.findall(spec):
+            flag = flag.rstrip(".,")
+            if flag not in ("-", "--") and flag not in flags:
+                flags[flag] = description
+    return list(flags.items())[:MAX_FLAGS]
+
+
+def from_config(config, submit=None):
+    """The flag index configured in config.py"""
+    return FlagIndex(submit=submit, run_help=getattr(config, "FLAG_COMPLETION_RUN_HELP", False))
+
+
+def _fingerprint(path):
+    st = os.stat(path)
+    return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+
+def _is_user_program(program, path):
+    """True for a program given by path or installed under the home directory, which may be any script"""
+    home = os.path.realpath(os.path.expanduser("~"))
+    return os.sep in program or os.path.realpath(path).startswith(home + os.sep)
+
+
+def _read_help(program, path, run_help=False):
+    """Text of the man page of a program, or with run_help of its --help when the man page lists no flags"""
+    env = dict(os.environ, LC_ALL="C", MANPAGER="cat", PAGER="cat", MANWIDTH="120", COLUMNS="120")
+    runs = []
+    if shutil.which("man"):
+        runs.append(["man", program])
+    if run_help:
+        runs.append([path, "--help"])
+    text = ""
+    for argv in runs:
+        try:
+            proc = subprocess.run(argv, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                  env=env, timeout=HELP_TIMEOUT, start_new_session=True)
+        except (OSError, subprocess.SubprocessError):
+            continue
+        text = proc.stdout[:MAX_HELP_CHARS].decode("utf-8", errors="replace")
+        if parse_help(text):
+            break
+    return text
+
+
+class FlagIndex:
+    """Flags of the programs the user runs; complete() never blocks"""
+
+    def __init__(self, directory=None, submit=None, help_commands=HELP_COMMANDS, run_help=False):
+        self.directory = directory or INDEX_DIR
+        self.help_commands = help_commands  # programs whose --help may be run
+        self.run_help = run_help            # run --help of any program not given by path or under home
+        # runs fn(*args) on a worker; the default is a small pool of its own
+        self._submit = submit or concurrent.futures.ThreadPoolExecutor(2, thread_name_prefix="magicshell-flags").submit
+        self._flags = {}       # program -> [(flag, description)]
+        self._pending = set()  # programs being loaded or built
+        self._lock = threading.Lock()
+
+    def learn(self, command):
+        """Note that a command line was run: index its program in the background unless that is current"""
+        words = command.split()
+        if words:
+            self._request(words[0], build=True)
+
+    def complete(self, program, prefix):
+        """[(flag, description)] of a program starting with prefix; starts loading its index if needed"""
+        with self._lock:
+            flags = self._flags.get(program)
+        if flags is None:
+            self._request(program, build=False)
+            return []
+        return [(flag, description) for flag, description in flags if flag.startswith(prefix)]
+
+    def _request(self, program, build):
+        with self._lock:
+            if program in self._pending or (not build and program in self._flags):
+                return
+            self._pending.add(program)
+        try:
+            self._submit(self._load, program, build)
+        except RuntimeError:  # the pool is shutting down
+            with self._lock:
+                self._pending.discard(program)
+
+    def _load(self, program, build):
+        # worker: use the saved index if the binary is unchanged, else rebuild it for programs that were used
+        flags = []  # also remembered for programs without an index, so they are not looked up on every key
+        try:
+            path = shutil.which(program)
+            if path is None:
+                return
+            fingerprint = _fingerprint(path)
+            index_file = self._index_file(program)
+            saved = self._read(index_file)
+            if saved is not None and saved.get("path") == path and saved.get("fingerprint") == fingerprint:
+                flags = [tuple(item) for item in saved.get("flags", [])]
+            elif build or saved is not None:
+                flags = parse_help(_read_help(program, path, self._may_run_help(program, path)))
+                self._write(index_file, {"version": INDEX_VERSION, "path": path, "fingerprint": fingerprint,
+                                         "flags": flags})
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._flags[program] = flags
+                self._pending.discard(program)
+
+    def _may_run_help(self, program, path):
+        return (program in self.help_commands or self.run_help) and not _is_user_program(program, path)
+
+    def _index_file(self, program):
+        name = re.sub(r"[^\w.-]", "_", os.path.basename(program))[:64]
+        digest = hashlib.sha1(program.encode("utf-8", errors="replace")).hexdigest()[:10]
+        return os.path.join(self.directory, f"{name}-{digest}.json")
+
+    def _read(self, index_file):
+        try:
+            with open(index_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+            return None
+        return data
+
+    def _write(self, index_file, data):
+        tmp = f"{index_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, index_file)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
@@ -0,0 +1,226 @@
+"""
+Frecency ranking of commands: how often they were run, decayed by how long ago.
+
+Every run adds 1 to a command's score, and scores halve every HALF_LIFE
+seconds, so a command run 200 times today outranks one run 500 times last
+year. Only (score, time of the last run) is kept per entry, which makes an
+update O(1). Both the full command line and its program name are scored.
+
+On disk the model is a journal of "time<TAB>weight<TAB>entry" lines, each a
+run of that weight (1 for a run, an entry's whole score once the journal is
+rewritten); loading adds up the decayed weights of every line of an entry.
+The journal is rewritten with one line per entry once it grows to twice the
+number of entries.
+
+The CLI and every GUI window append to the same journal. Appends and rewrites
+hold an flock on a ".lock" file next to it, and each one first reads the lines
+other processes appended since the last one, so every process counts every
+run, whichever window it was made in.
+"""
+import contextlib
+import heapq
+import math
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no lock, a rewrite may drop another window's latest runs
+    fcntl = None
+
+from prefix_index import PrefixIndex
+
+HALF_LIFE = 3 * 24 * 3600   # seconds for a score to halve
+MAX_ENTRIES = 5000          # entries kept when the journal is rewritten
+MIN_SCORE = 0.01            # entries decayed below this are dropped when rewriting
+
+
+def frecency_path(history_file):
+    """The frecency journal that belongs to a history file"""
+    return history_file + ".frecency"
+
+
+class Frecency:
+    def __init__(self, path=None, half_life=HALF_LIFE):
+        self.path = path
+        self.half_life = half_life
+        self.entries = {}   # entry -> (score, time of the last run)
+        self.index = PrefixIndex()
+        self._journal_lines = 0
+        self._journal = None  # (device, inode) of the journal file read so far
+        self._offset = 0      # bytes of it read so far
+        if path:
+            self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def load(self):
+        self.entries = {}
+        self.index = PrefixIndex()
+        self._journal, self._offset, self._journal_lines = None, 0, 0
+        try:
+            with self._locked():
+                self._read_journal()
+        except OSError:
+            pass
+
+    def _read_journal(self):
+        # caller holds the lock: add the runs appended since the last read, all of them if the file was rewritten
+        try:
+            with open(self.path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                if (stat.st_dev, stat.st_ino) != self._journal or stat.st_size < self._offset:
+                    self.entries = {}
+                    self.index = PrefixIndex()
+                    self._journal, self._offset, self._journal_lines = (stat.st_dev, stat.st_ino), 0, 0
+                f.seek(self._offset)
+                data = f.read()
+        except OSError:
+            return
+        self._offset += len(data)
+        for line in data.decode("utf-8", errors="replace").splitlines():
+            self._journal_lines += 1
+            parts = line.split("\t", 2)
+            try:
+                self._add(parts[2], float(parts[1]), float(parts[0]))
+            except (IndexError, ValueError):
+                continue
+
+    @contextlib.contextmanager
+    def _locked(self):
+        # the journal itself is replaced by compact(), so the lock is a file of its own
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def score(self, entry, now=None):
+        """The decayed score of an entry at time `now` (0 if it was never run)"""
+        state = self.entries.get(entry)
+        if state is None:
+            return 0.0
+        score, last = state
+        now = time.time() if now is None else now
+        return score * math.pow(0.5, max(0.0, now - last) / self.half_life)
+
+    def visit(self, command, now=None):
+        """Record a run of a command line: bump the line and its program name"""
+        now = time.time() if now is None else now
+        if not self.path:
+            self._bump(command, now)
+            return
+        try:
+            with self._locked():
+                self._read_journal()
+                touched = self._bump(command, now)
+                if touched:
+                    self._append(touched, now)
+        except OSError:
+            pass
+        if self._journal_lines > 2 * len(self.entries) + 256:
+            self.compact()
+
+    def seed(self, commands, now=None):
+        """Score a history without timestamps, oldest first, as if run a second apart up to now"""
+        now = time.time() if now is None else now
+        commands = [c for c in commands if c.strip()]
+        if not self.path:
+            self._seed(commands, now)
+            self._prune()
+            return
+        try:
+            with self._locked():
+                self._read_journal()
+                if not self.entries:  # not seeded by another window meanwhile
+                    self._seed(commands, now)
+                    self._rewrite()
+        except OSError:
+            self._prune()
+
+    def _seed(self, commands, now):
+        for i, command in enumerate(commands):
+            self._bump(command, now - (len(commands) - i))
+
+    def search(self, prefix, limit=None):
+        """Entries starting with prefix (ignoring case), highest score first"""
+        matches = self.index.search(prefix)
+        now = time.time()
+        if limit is None:
+            return sorted(matches, key=lambda entry: -self.score(entry, now))
+        return heapq.nlargest(limit, matches, key=lambda entry: self.score(entry, now))
+
+    def rank(self, entries):
+        """Stable sort of entries by score, highest first; entries never run keep their order at the end"""
+        now = time.time()
+        return sorted(entries, key=lambda entry: -self.score(entry, now))
+
+    def _bump(self, command, now):
+        command = command.strip().replace("\n", " ")
+        if not command:
+            return []
+        touched = list(dict.fromkeys([command, command.split()[0]]))
+        for entry in touched:
+            self._add(entry, 1.0, now)
+        return touched
+
+    def _add(self, entry, weight, when):
+        # a run of `weight` at time `when`: scores decay from the later of it and the entry's last run
+        state = self.entries.get(entry)
+        if state is None:
+            self.entries[entry] = (weight, when)
+            self.index.add(entry)
+            return
+        score, last = state
+        if when >= last:
+            self.entries[entry] = (score * math.pow(0.5, (when - last) / self.half_life) + weight, when)
+        else:
+            self.entries[entry] = (score + weight * math.pow(0.5, (last - when) / self.half_life), last)
+
+    def _append(self, entries, now):
+        # caller holds the lock and has read the journal to its end
+        lines = "".join(f"{now:.3f}\t1\t{e}\n" for e in entries).encode("utf-8")
+        with open(self.path, "ab") as f:
+            f.write(lines)
+            self._offset = f.tell()
+            stat = os.fstat(f.fileno())
+        self._journal = (stat.st_dev, stat.st_ino)
+        self._journal_lines += len(entries)
+
+    def compact(self):
+        """Rewrite the journal with one line per entry, dropping entries that decayed away"""
+        if not self.path:
+            self._prune()
+            return
+        try:
+            with self._locked():
+                self._read_journal()
+                self._rewrite()
+        except OSError:
+            self._prune()
+
+    def _rewrite(self):
+        # caller holds the lock and has read the journal to its end
+        self._prune()
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        data = "".join(f"{last:.3f}\t{score:.4f}\t{e}\n" for e, (score, last) in self.entries.items()).encode("utf-8")
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+                stat = os.fstat(f.fileno())
+            os.replace(tmp, self.path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        self._journal, self._offset, self._journal_lines = (stat.st_dev, stat.st_ino), len(data), len(self.entries)
+
+    def _prune(self):
+        now = time.time()
+        keep = [(self.score(e, now), e) for e in self.entries]
+        keep = heapq.nlargest(MAX_ENTRIES, (item for item in keep if item[0] >= MIN_SCORE))
+        self.entries = {e: self.entries[e] for _, e in keep}
+        self.index = PrefixIndex(self.entries)
@@ -0,0 +1,223 @@
+"""
+fzf-style fuzzy matching of suggestions.
+
+A query matches a candidate when its characters appear in it in order, case
+ignored: "gst" matches "git status". FuzzyIndex packs the lowercased
+candidates into one newline-separated string and compiles the query into a
+regular expression that only matches lines containing it as a subsequence, so
+the filter over all candidates is a single pass in C. Only the survivors are
+scored in Python, at most max_scored of them in candidate order (the caller
+puts the best candidates first, in one batch with promote()), and the top
+`limit` are picked with a heap. The MAX_FRESH candidates added last with add()
+are searched before the others, so a line just run is scored even when many
+older candidates match.
+When every survivor was seen, they are packed again and the next, longer
+query only searches those. bench_fuzzy.py times a search per keystroke.
+
+Scoring follows fzf: every matched character scores, characters at the start
+of a word and runs of consecutive characters get a bonus, gaps cost, and a tie
+keeps the caller's order. Matches carry the positions of the matched
+characters for highlighting.
+"""
+import bisect
+import heapq
+import itertools
+import re
+from collections import namedtuple
+
+SCORE_MATCH = 16
+BONUS_BOUNDARY = 8        # character at the start of the line or after a separator
+BONUS_CONSECUTIVE = 6     # character right after the previous matched one
+BONUS_FIRST_CHAR = 2      # multiplier of the bonus of the first query character
+PENALTY_GAP_START = 3
+PENALTY_GAP_EXTENSION = 1
+SEPARATORS = frozenset(" /\\-_.:=,;|@")
+MAX_SCORED = 300          # survivors scored per search
+MAX_FRESH = 64            # candidates added last that are searched before the rest
+
+Match = namedtuple("Match", ["text", "score", "positions"])
+
+
+def _align(query, text):
+    """Positions of the shortest match of query in text (both lowercased), or None"""
+    pos = -1
+    for ch in query:
+        pos = text.find(ch, pos + 1)
+        if pos < 0:
+            return None
+    end = pos + 1
+    # walk back from the end to the latest start, then forward again for the positions
+    start = end
+    for ch in reversed(query):
+        start = text.rfind(ch, 0, start)
+    positions = []
+    pos = start - 1
+    for ch in query:
+        pos = text.find(ch, pos + 1)
+        positions.append(pos)
+    return positions
+
+
+def _score(text, positions):
+    # BONUS_BOUNDARY > BONUS_CONSECUTIVE, so a boundary character never needs the max() of the two
+    first = positions[0]
+    score = SCORE_MATCH * len(positions)
+    if first == 0 or text[first - 1] in SEPARATORS:
+        score += BONUS_BOUNDARY * BONUS_FIRST_CHAR
+    previous = first
+    for pos in positions[1:]:
+        gap = pos - previous - 1
+        if text[pos - 1] in SEPARATORS:
+            score += BONUS_BOUNDARY
+        elif not gap:
+            score += BONUS_CONSECUTIVE
+        if gap:
+            score -= PENALTY_GAP_START + PENALTY_GAP_EXTENSION * (gap - 1)
+        previous = pos
+    return score
+
+
+def score(query, candidate):
+    """(score, positions) of query in candidate, or None when it does not match"""
+    lowered = candidate.lower()
+    if len(lowered) != len(candidate):
+        lowered = candidate  # lowercasing changed the length (e.g. "İ"); positions must line up
+    positions = _align(query.lower(), lowered)
+    if positions is None:
+        return None
+    return _score(lowered, positions), positions
+
+
+def _pattern(query):
+    # "(a)[^\nb]*(b)[^\nc]*(c)": each class stops at the first occurrence of the next character, so there is no
+    # backtracking, the leading literal lets the regex engine skip ahead, and the groups are the matched positions
+    parts = [f"({re.escape(query[0])})"]
+    for ch in query[1:]:
+        esc = re.escape(ch)
+        parts.append(f"[^\\n{esc}]*({esc})")
+    return re.compile("".join(parts))
+
+
+def fragments(text, positions):
+    """prompt_toolkit formatted text of a candidate with the matched characters styled"""
+    matched = set(positions)
+    return [("class:fuzzymatch.inside.character" if i in matched else "class:fuzzymatch.outside", ch)
+            for i, ch in enumerate(text)]
+
+
+class FuzzyIndex:
+    """Candidates packed for fuzzy search; safe to search while another thread adds"""
+
+    def __init__(self, candidates=()):
+        self.update(candidates)
+
+    def update(self, candidates):
+        """Replace the candidates; their order breaks ties between equal scores"""
+        originals, lowered, starts, offset = [], [], [], 0
+        seen = set()
+        for candidate in candidates:
+            candidate = candidate.replace("\n", " ")
+            if candidate in seen:
+                continue
+            seen.add(candidate)
+            low = candidate.lower()
+            originals.append(candidate)
+            lowered.append(low if len(low) == len(candidate) else candidate)
+            starts.append(offset)
+            offset += len(lowered[-1]) + 1
+        self._seen = seen
+        # swapped as one tuple so a search never sees the lists of one version and the string of another;
+        # the last item is the first of the fresh candidates
+        self._state = (originals, lowered, starts, "\n".join(lowered), len(originals))
+        self._narrowed = None
+
+    def add(self, candidate):
+        """Append a candidate (last in tie order, searched first while fresh) unless it is already there"""
+        candidate = candidate.replace("\n", " ")
+        if candidate in self._seen:
+            return
+        self._seen.add(candidate)
+        originals, lowered, starts, packed, fresh = self._state
+        low = candidate.lower()
+        low = low if len(low) == len(candidate) else candidate
+        starts_at = len(packed) + 1 if originals else 0
+        self._state = (originals + [candidate], lowered + [low], starts + [starts_at],
+                       packed + "\n" + low if originals else low, max(fresh, len(originals) + 1 - MAX_FRESH))
+        self._narrowed = None
+
+    def promote(self, candidates):
+        """Move candidates to the front in their order, adding those not there yet; the cut-off scores the front first"""
+        originals, lowered = self._state[:2]
+        front = list(dict.fromkeys(candidate.replace("\n", " ") for candidate in candidates))
+        moved = set(front)
+        front_lowered = []
+        for candidate in front:
+            low = candidate.lower()
+            front_lowered.append(low if len(low) == len(candidate) else candidate)
+        rest = [(o, low) for o, low in zip(originals, lowered) if o not in moved]
+        originals = front + [o for o, _ in rest]
+        lowered = front_lowered + [low for _, low in rest]
+        starts, offset = [], 0
+        for low in lowered:
+            starts.append(offset)
+            offset += len(low) + 1
+        self._seen = self._seen | moved
+        self._state = (originals, lowered, starts, "\n".join(lowered), len(originals))
+        self._narrowed = None
+
+    def __len__(self):
+        return len(self._state[0])
+
+    def search(self, query, limit=50, max_scored=MAX_SCORED):
+        """The best `limit` Matches of query, best first; ties go to the earlier candidate"""
+        state = self._state
+        originals = state[0]
+        query = query.lower()
+        if not query:
+            return [Match(c, 0, []) for c in originals[:limit]]
+        # typing one more character can only drop candidates: search the survivors of the last query instead
+        narrowed = self._narrowed
+        pattern = _pattern(query)
+        if narrowed is not None and narrowed[0] is state and query.startswith(narrowed[1]):
+            ids, lowered, starts, packed = narrowed[2]
+            found_all = pattern.finditer(packed)  # packed fresh candidates first already
+        else:
+            ids, (_, lowered, starts, packed, fresh) = None, state
+            if fresh < len(lowered):
+                found_all = itertools.chain(pattern.finditer(packed, starts[fresh]),
+                                            pattern.finditer(packed, 0, starts[fresh]))
+            else:
+                found_all = pattern.finditer(packed)
+        # first pass: score the leftmost match the regex found, which needs no Python scan of the line
+        scored = []
+        last = -1
+        groups = range(1, len(query) + 1)
+        complete = True
+        for found in found_all:
+            j = bisect.bisect_right(starts, found.start()) - 1
+            if j == last:
+                continue  # a second match on the same line
+            last = j
+            if len(scored) >= max_scored:
+                complete = False  # early cut-off: the best candidates come first
+                break
+            offset = starts[j]
+            positions = [found.start(g) - offset for g in groups]
+            scored.append((_score(lowered[j], positions), -(j if ids is None else ids[j]), j))
+        if complete:
+            # every survivor of this query was seen: pack them for the next keystroke
+            sub_ids, sub_lowered, sub_starts, offset = [], [], [], 0
+            for _, _, j in scored:
+                sub_ids.append(j if ids is None else ids[j])
+                sub_lowered.append(lowered[j])
+                sub_starts.append(offset)
+                offset += len(lowered[j]) + 1
+            self._narrowed = (state, query, (sub_ids, sub_lowered, sub_starts, "\n".join(sub_lowered)))
+        # second pass: the top matches are aligned on their shortest match and ranked again
+        all_lowered = state[1]
+        best = []
+        for _, i, _ in heapq.nlargest(limit, scored):
+            positions = _align(query, all_lowered[-i])
+            best.append((_score(all_lowered[-i], positions), i, positions))
+        best = heapq.nlargest(limit, best, key=lambda item: item[:2])
+        return [Match(originals[-i], s, positions) for s, i, positions in best]
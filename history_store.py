@@ -0,0 +1,212 @@
+"""
+Command history of every shell window in one SQLite database.
+
+Each command line is a row with the directory it ran in, its exit code, wall
+time, CPU time, peak RSS and start time, in ~/.magicshell/history.db by
+default. The database is
+in WAL mode, so the CLI and any number of GUI windows write to it while others
+read. Rows are kept in the order they were added (the id); the directory and
+the start time are indexed, and substring search goes through an FTS5 index
+with the trigram tokenizer, so lookups stay fast with millions of rows. Where
+SQLite has no FTS5 or trigram tokenizer (before 3.34), and for queries under
+three characters, search falls back to LIKE over the rows. Results come a
+page at a time, newest first, each page starting below the id the last one
+ended at, so the newest page and every older one cost the same at any size.
+
+The per-directory .magicshell_history files of older versions are imported
+once with import_file().
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+HISTORY_DB = os.path.join(os.path.expanduser("~"), ".magicshell", "history.db")
+LEGACY_FILE = ".magicshell_history"   # the per-directory history of older versions
+SEARCH_LIMIT = 100
+BUSY_TIMEOUT = 5.0                    # seconds a write waits for another window's write
+_SQLITE_MAGIC = b"SQLite format 3\x00"
+
+# exit_code and the usage (duration is the wall time, max_rss in KiB) are None until the command finishes,
+# and stay None for shell builtins; the CPU time and RSS also where they were not measured
+Entry = namedtuple("Entry", ["id", "command", "cwd", "exit_code", "duration", "started",
+                             "user_cpu", "sys_cpu", "max_rss"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY,
+    command TEXT NOT NULL,
+    cwd TEXT,
+    exit_code INTEGER,
+    duration REAL,
+    started REAL NOT NULL,
+    user_cpu REAL,
+    sys_cpu REAL,
+    max_rss INTEGER
+);
+CREATE INDEX IF NOT EXISTS history_cwd ON history(cwd);
+CREATE INDEX IF NOT EXISTS history_started ON history(started);
+CREATE TABLE IF NOT EXISTS imports (path TEXT PRIMARY KEY, imported REAL NOT NULL);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(command, content='history', content_rowid='id',
+                                                          tokenize='trigram');
+CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN
+    INSERT INTO history_fts(rowid, command) VALUES (new.id, new.command);
+END;
+CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history BEGIN
+    INSERT INTO history_fts(history_fts, rowid, command) VALUES ('delete', old.id, old.command);
+END;
+"""
+
+
+def from_config(config):
+    """The history store configured in config.py"""
+    return HistoryStore(os.path.expanduser(getattr(config, "HISTORY_DB", None) or HISTORY_DB))
+
+
+def is_store(path):
+    """True when path is an SQLite database rather than a plain history file"""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(_SQLITE_MAGIC)) == _SQLITE_MAGIC
+    except OSError:
+        return False
+
+
+def read_commands(path, limit=None):
+    """The last `limit` command lines of a HistoryStore database, oldest first ([] if there is none)"""
+    if not is_store(path):
+        return []
+    store = HistoryStore(path)
+    try:
+        return [entry.command for entry in reversed(store.search(limit=limit))]
+    finally:
+        store.close()
+
+
+def _like(text):
+    return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+class HistoryStore:
+    """The history database; safe to use from any thread"""
+
+    def __init__(self, path=HISTORY_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")  # WAL stays consistent; a power cut may lose the last rows
+            self._db.executescript(_SCHEMA)
+            try:
+                indexed = self._db.execute("SELECT 1 FROM sqlite_master WHERE name = 'history_fts'").fetchone()
+                self._db.executescript(_FTS_SCHEMA)
+                if not indexed:  # rows written by a SQLite without FTS5
+                    self._db.execute("INSERT INTO history_fts(history_fts) VALUES ('rebuild')")
+                self.fts = True
+            except sqlite3.OperationalError:  # no FTS5 or no trigram tokenizer
+                self.fts = False
+
+    def add(self, command, cwd=None, exit_code=None, duration=None, started=None):
+        """Record a command line; returns its id for finish()"""
+        command = command.strip().replace("\n", " ")
+        started = time.time() if started is None else started
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO history (command, cwd, exit_code, duration, started) VALUES (?, ?, ?, ?, ?)",
+                (command, cwd, exit_code, duration, started))
+            return cursor.lastrowid
+
+    def finish(self, entry_id, exit_code, usage):
+        """Fill in the exit code and exec_core.ResourceUsage (or None) of a command added when it started"""
+        if usage is None:
+            values = (None, None, None, None)
+        else:
+            values = (usage.wall, usage.user, usage.system, usage.max_rss)
+        with self._lock:
+            self._db.execute("UPDATE history SET exit_code = ?, duration = ?, user_cpu = ?, sys_cpu = ?, max_rss = ? "
+                             "WHERE id = ?", (exit_code, *values, entry_id))
+
+    def search(self, text=None, cwd=None, since=None, until=None, limit=SEARCH_LIMIT, before=None):
+        """
+        Entries containing text (ignoring case), run in cwd, started in [since, until); newest first.
+        Pass the id of the last entry of a page as `before` for the next, older page.
+        """
+        where, args = [], []
+        table, order = "history h", "h.id"
+        if text and self.fts and len(text) >= 3:
+            # FTS5 yields rowids newest first itself, so LIMIT stops the scan early instead of sorting every match
+            table, order = "history_fts f JOIN history h ON h.id = f.rowid", "f.rowid"
+            where.append("history_fts MATCH ?")
+            args.append('"' + text.replace('"', '""') + '"')
+        elif text:
+            where.append("h.command LIKE ? ESCAPE '\\'")
+            args.append(_like(text))
+        if cwd is not None:
+            where.append("h.cwd = ?")
+            args.append(cwd)
+        if since is not None:
+            where.append("h.started >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("h.started < ?")
+            args.append(until)
+        if before is not None:
+            # a page starts where the last one ended in the id order, so it costs the same at any depth
+            where.append(f"{order} < ?")
+            args.append(before)
+        sql = (f"SELECT h.id, h.command, h.cwd, h.exit_code, h.duration, h.started, h.user_cpu, h.sys_cpu, h.max_rss "
+               f"FROM {table}")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order} DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit)
+        with self._lock:
+            return [Entry(*row) for row in self._db.execute(sql, args)]
+
+    def recent(self, limit=SEARCH_LIMIT, before=None):
+        """The last `limit` entries (before the entry with id `before`), newest first"""
+        return self.search(limit=limit, before=before)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT count(*) FROM history").fetchone()[0]
+
+    def import_file(self, path):
+        """Add the lines of a plain history file once; returns how many were added"""
+        path = os.path.abspath(path)
+        with self._lock:
+            if self._db.execute("SELECT 1 FROM imports WHERE path = ?", (path,)).fetchone():
+                return 0
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                lines = [line.strip() for line in f if line.strip()]
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return 0
+        cwd = os.path.dirname(path)
+        rows = [(line, cwd, None, None, mtime) for line in lines]
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if self._db.execute("SELECT 1 FROM imports WHERE path = ?", (path,)).fetchone():
+                    rows = []  # another window imported it meanwhile
+                self._db.executemany(
+                    "INSERT INTO history (command, cwd, exit_code, duration, started) VALUES (?, ?, ?, ?, ?)", rows)
+                self._db.execute("INSERT OR IGNORE INTO imports (path, imported) VALUES (?, ?)", (path, time.time()))
+                self._db.execute("COMMIT")
+            except sqlite3.Error:
+                self._db.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,148 @@
+"""
+Per-command wall-clock timeouts and resource limits.
+
+ResourceLimits holds a timeout and the CPU, address-space and open-file limits
+that are set with setrlimit() in the child before it execs. Defaults come
+from config.py. A single command can override them with a prefix:
+
+    /limit timeout=30 cpu=10 mem=512M files=256 make test
+
+A value of 0 removes that limit for the command.
+"""
+import math
+import signal
+
+try:
+    import resource
+except ImportError:  # Windows: only the timeout applies
+    resource = None
+
+PREFIX = "/limit"
+
+_KEYS = {
+    "timeout": "timeout", "t": "timeout",
+    "cpu": "cpu",
+    "mem": "memory", "memory": "memory", "as": "memory",
+    "files": "open_files", "nofile": "open_files",
+}
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+_TIME_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600}
+
+
+class ResourceLimits:
+    """Limits for one command; None means unlimited"""
+
+    def __init__(self, timeout=None, cpu=None, memory=None, open_files=None):
+        self.timeout = timeout        # wall-clock seconds, then SIGTERM and SIGKILL
+        self.cpu = cpu                # CPU seconds (RLIMIT_CPU, the child gets SIGXCPU)
+        self.memory = memory          # bytes of address space (RLIMIT_AS)
+        self.open_files = open_files  # file descriptors (RLIMIT_NOFILE)
+
+    def override(self, **values):
+        """A copy with some limits replaced; 0 removes a limit"""
+        merged = dict(self.__dict__)
+        merged.update({key: value or None for key, value in values.items()})
+        return ResourceLimits(**merged)
+
+    def rlimits(self):
+        """[(resource, (soft, hard)), ...] to set in the child, never above our own hard limits"""
+        if resource is None:
+            return []
+        wanted = [
+            (resource.RLIMIT_CPU, self.cpu, 1),  # hard limit a second later: SIGXCPU, then SIGKILL
+            (resource.RLIMIT_AS, self.memory, 0),
+            (resource.RLIMIT_NOFILE, self.open_files, 0),
+        ]
+        result = []
+        for res, value, grace in wanted:
+            if value is None:
+                continue
+            value = math.ceil(value)
+            _, hard = resource.getrlimit(res)
+            if hard != resource.RLIM_INFINITY:
+                value = min(value, hard)
+                result.append((res, (value, min(value + grace, hard))))
+            else:
+                result.append((res, (value, value + grace)))
+        return result
+
+    def describe(self):
+        parts = []
+        if self.timeout:
+            parts.append(f"timeout {self.timeout:g}s")
+        if self.cpu:
+            parts.append(f"cpu {self.cpu:g}s")
+        if self.memory:
+            parts.append(f"mem {self.memory // 1024 ** 2}M")
+        if self.open_files:
+            parts.append(f"files {self.open_files}")
+        return ", ".join(parts) or "no limits"
+
+    def __repr__(self):
+        return f"ResourceLimits({self.describe()})"
+
+
+def from_config(config):
+    """Default limits from the COMMAND_* settings in config.py"""
+    memory = config.COMMAND_MEMORY_LIMIT
+    return ResourceLimits(
+        timeout=config.COMMAND_TIMEOUT,
+        cpu=config.COMMAND_CPU_LIMIT,
+        memory=_parse_size(str(memory)) if memory else None,
+        open_files=config.COMMAND_OPEN_FILES_LIMIT,
+    )
+
+
+def split_prefix(command, defaults):
+    """
+    Strip a leading "/limit key=value ..." from a command line.
+    Returns (limits, command); raises ValueError for a malformed prefix.
+    """
+    words = command.split(None, 1)
+    if not words or words[0] != PREFIX:
+        return defaults, command
+    rest = words[1] if len(words) > 1 else ""
+    values = {}
+    while rest:
+        option, *tail = rest.split(None, 1)
+        if "=" not in option:
+            break
+        rest = tail[0] if tail else ""
+        key, _, value = option.partition("=")
+        if key not in _KEYS:
+            raise ValueError(f"unknown limit '{key}' (use timeout, cpu, mem or files)")
+        name = _KEYS[key]
+        values[name] = _parse_size(value) if name == "memory" else _parse_number(value, name)
+    if not values:
+        raise ValueError("usage: /limit timeout=30 cpu=10 mem=512M files=256 <command>")
+    if not rest:
+        raise ValueError("no command given after the limits")
+    return defaults.override(**values), rest
+
+
+def limit_message(result, limits):
+    """Explain how a limit stopped a command, or return None"""
+    if result.timed_out:
+        return f"magicshell: command timed out after {limits.timeout:g}s"
+    # killed by SIGXCPU, directly or as reported by /bin/sh
+    if limits.cpu and hasattr(signal, "SIGXCPU") and result.returncode in (-signal.SIGXCPU, 128 + signal.SIGXCPU):
+        return f"magicshell: CPU time limit of {limits.cpu:g}s exceeded"
+    return None
+
+
+def _parse_number(value, name):
+    unit = value[-1:] if value[-1:] in _TIME_UNITS and name != "open_files" else ""
+    try:
+        number = float(value[:len(value) - len(unit)])
+    except ValueError:
+        raise ValueError(f"invalid {name} limit '{value}'")
+    number *= _TIME_UNITS[unit]
+    return int(number) if name == "open_files" else number
+
+
+def _parse_size(value):
+    unit = value[-1:].upper() if value[-1:].upper() in _SIZE_UNITS else ""
+    try:
+        return int(float(value[:len(value) - len(unit)]) * _SIZE_UNITS[unit])
+    except ValueError:
+        raise ValueError(f"invalid memory limit '{value}'")
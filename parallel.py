@@ -0,0 +1,326 @@
+"""
+Run one command template over many inputs at once: the /par builtin.
+
+    /par [-j N] TEMPLATE ::: ARG...     the arguments, with globs expanded
+    /par [-j N] TEMPLATE :::: FILE      one input per line of FILE
+    PRODUCER | /par [-j N] TEMPLATE     one input per output line of PRODUCER
+
+In the template {} is the input, {.} the input without its extension, {/} its
+basename, {//} its directory and {/.} the basename without extension. Inputs
+are shell-quoted; a template without placeholders gets the input appended.
+Up to N commands (default: one per CPU) run at once on the execution core.
+Every output line is prefixed with its input, failed inputs are reported with
+their exit status, and the fan-out as a whole exits with the number of failed
+inputs (capped at 101, like GNU parallel).
+"""
+import concurrent.futures
+import glob
+import os
+import re
+import shlex
+import signal
+import threading
+import time
+from collections import deque
+
+from exec_core import CommandResult, ResourceUsage
+
+PREFIX = "/par"
+MAX_STATUS = 101
+
+_PAR_WORD = re.compile(r"\s*/par(?:\s|$)")
+_SEPARATOR = re.compile(r"\s(:::|::::)(?:\s|$)")
+_JOBS = re.compile(r"(?:-j\s*|--jobs[=\s]\s*)(\d+)\s+")
+_PLACEHOLDER = re.compile(r"\{(\.|/|//|/\.)?\}")
+_GLOB_CHARS = set("*?[")
+# signals that pause or resume the running items without ending the fan-out
+_JOB_CONTROL = {getattr(signal, name) for name in ("SIGSTOP", "SIGTSTP", "SIGCONT") if hasattr(signal, name)}
+
+
+def _operators(command):
+    """(operator, start, end) of every |, ||, && and ; outside quotes"""
+    ops = []
+    quote = None
+    i, n = 0, len(command)
+    while i < n:
+        ch = command[i]
+        if quote is not None:
+            if ch == quote:
+                quote = None
+            elif ch == "\\" and quote == '"':
+                i += 1
+        elif ch in "'\"":
+            quote = ch
+        elif ch == "\\":
+            i += 1
+        elif command.startswith(("&&", "||"), i):
+            ops.append((command[i:i + 2], i, i + 2))
+            i += 1
+        elif ch in "|;":
+            ops.append((ch, i, i + 1))
+        i += 1
+    return ops
+
+
+def _split(command):
+    """
+    (producer or None, the arguments of /par) of a /par line, else None. /par is
+    the first word of the line, or the first word of the last stage of a plain
+    pipeline (no &&, || or ;), and never inside quotes.
+    """
+    match = _PAR_WORD.match(command)
+    if match is not None:
+        return None, command[match.end():]
+    ops = _operators(command)
+    if ops and all(op == "|" for op, _, _ in ops):
+        _, start, end = ops[-1]
+        match = _PAR_WORD.match(command, end)
+        if match is not None:
+            return command[:start].strip() or None, command[match.end():]
+    return None
+
+
+def is_fanout(command):
+    """True for a line that uses /par, alone or at the end of a pipeline"""
+    return _split(command) is not None
+
+
+def parse(command, cwd):
+    """
+    Build a FanOut from a /par line. Globs and input files are resolved
+    against cwd here; a producer command runs later, in FanOut.run().
+    Raises ValueError for a malformed line.
+    """
+    split = _split(command)
+    if split is None:
+        raise ValueError(f"not a {PREFIX} command")
+    producer, rest = split
+    rest = rest.strip()
+    jobs = None
+    option = _JOBS.match(rest + " ")
+    if option:
+        jobs = int(option.group(1))
+        rest = (rest + " ")[option.end():].strip()
+        if jobs < 1:
+            raise ValueError("-j needs at least 1 job")
+
+    separator = _SEPARATOR.search(" " + rest)
+    if separator is None:
+        template, inputs = rest, None
+    else:
+        template = rest[:separator.start()].strip()
+        words = rest[separator.end() - 1:].strip()
+        try:
+            words = shlex.split(words)
+        except ValueError as e:
+            raise ValueError(f"bad input list: {e}")
+        if separator.group(1) == ":::":
+            inputs = _expand_globs(words, cwd)
+        elif len(words) == 1:
+            inputs = _read_lines(os.path.join(cwd, words[0]))
+        else:
+            raise ValueError(":::: takes exactly one input file")
+    if template[:1] in ("'", '"'):
+        # '/par "convert {} {.}.png" ::: *.jpg' quotes the whole template
+        try:
+            words = shlex.split(template)
+        except ValueError as e:
+            raise ValueError(f"bad template: {e}")
+        if len(words) == 1:
+            template = words[0]
+    if not template:
+        raise ValueError(f"usage: {PREFIX} [-j N] TEMPLATE ::: ARG... | :::: FILE, or PRODUCER | {PREFIX} TEMPLATE")
+    if (inputs is None) == (producer is None):
+        raise ValueError("give the inputs either after ::: / :::: or by piping a command into /par")
+    return FanOut(template, inputs=inputs, producer=producer, jobs=jobs)
+
+
+def _expand_globs(words, cwd):
+    inputs = []
+    for word in words:
+        matches = sorted(glob.glob(word, root_dir=cwd)) if _GLOB_CHARS & set(word) else []
+        # like the shell, a pattern that matches nothing is passed on as it is
+        inputs.extend(matches or [word])
+    return inputs
+
+
+def _read_lines(path):
+    try:
+        with open(path, "r", encoding="utf-8", errors="surrogateescape") as f:
+            return [line.rstrip("\r\n") for line in f if line.strip()]
+    except OSError as e:
+        raise ValueError(f"{path}: {e.strerror}")
+
+
+class _LinePrefixer:
+    """Splits one item's output into lines and hands them on with the item's prefix"""
+
+    def __init__(self, prefix, emit):
+        self.prefix = prefix
+        self.emit = emit
+        self.partial = {}
+
+    def feed(self, chunk):
+        lines = (self.partial.get(chunk.stream, "") + chunk.text).split("\n")
+        self.partial[chunk.stream] = lines.pop()
+        for line in lines:
+            self.emit(chunk.stream, self.prefix + line.rstrip("\r"))
+
+    def flush(self):
+        for stream, rest in self.partial.items():
+            if rest:
+                self.emit(stream, self.prefix + rest)
+        self.partial = {}
+
+
+class FanOut:
+    """A template and its inputs, run on a bounded number of concurrent commands"""
+
+    def __init__(self, template, inputs=None, producer=None, jobs=None):
+        self.template = template
+        self.inputs = inputs        # list of input strings, or None to read them from `producer`
+        self.producer = producer    # command whose output lines are the inputs
+        self.jobs = jobs or os.cpu_count() or 1
+        self.failed = []            # (input, CommandResult) of every failed item, in completion order
+        self._lock = threading.Lock()
+        self._handles = []
+        self._cancelled = False
+
+    def expand(self, item):
+        """The command line for one input"""
+        def replace(match):
+            kind = match.group(1)
+            if kind == ".":
+                value = os.path.splitext(item)[0]
+            elif kind == "/":
+                value = os.path.basename(item)
+            elif kind == "//":
+                value = os.path.dirname(item) or "."
+            elif kind == "/.":
+                value = os.path.splitext(os.path.basename(item))[0]
+            else:
+                value = item
+            return shlex.quote(value)
+
+        if not _PLACEHOLDER.search(self.template):
+            return f"{self.template} {shlex.quote(item)}"
+        return _PLACEHOLDER.sub(replace, self.template)
+
+    def run(self, core, emit, cwd=None, timeout=None, rlimits=None, builtins=False, detach=True):
+        """
+        Run every input and block until all are done; returns a CommandResult
+        whose usage adds up the CPU time of all items. emit(stream, line) gets
+        each prefixed output line; it may be called from several threads, but
+        never concurrently. timeout and rlimits apply to each item separately.
+        """
+        started = time.monotonic()
+        lock = threading.Lock()
+
+        def locked_emit(stream, line):
+            with lock:
+                emit(stream, line)
+
+        usages = []
+        inputs = self.inputs
+        if inputs is None:
+            inputs, produced = self._produce(core, locked_emit, cwd, builtins, detach)
+            usages.append(produced.usage)
+            if produced.returncode != 0 and not inputs:
+                produced.usage = ResourceUsage.combined(time.monotonic() - started, usages)
+                return produced
+
+        pending = deque(inputs)
+        running = {}  # future -> (input, handle, prefixer)
+        try:
+            while pending or running:
+                while pending and len(running) < self.jobs and not self._cancelled:
+                    item = pending.popleft()
+                    prefixer = _LinePrefixer(f"[{item}] ", locked_emit)
+                    handle = core.submit(self.expand(item), cwd=cwd, on_output=prefixer.feed, timeout=timeout,
+                                         detach=detach, builtins=builtins, rlimits=rlimits)
+                    with self._lock:
+                        self._handles.append(handle)
+                    running[handle.future] = (item, handle, prefixer)
+                if not running:
+                    break
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    item, handle, prefixer = running.pop(future)
+                    with self._lock:
+                        self._handles.remove(handle)
+                    prefixer.flush()
+                    result = future.result()
+                    usages.append(result.usage)
+                    if result.returncode != 0 or result.timed_out:
+                        self.failed.append((item, result))
+                        locked_emit("stderr", f"[{item}] {_describe(result, timeout)}")
+        except KeyboardInterrupt:
+            self.cancel()
+            concurrent.futures.wait(running)
+            raise
+
+        skipped = len(pending)
+        total = len(inputs)
+        ok = total - skipped - len(self.failed)
+        summary = f"{PREFIX}: {ok}/{total} succeeded"
+        if self.failed:
+            summary += f", {len(self.failed)} failed"
+        if skipped:
+            summary += f", {skipped} not started"
+        locked_emit("stderr" if ok < total else "stdout", summary)
+        return CommandResult(
+            min(len(self.failed) + skipped, MAX_STATUS),
+            cancelled=self._cancelled,
+            usage=ResourceUsage.combined(time.monotonic() - started, usages),
+        )
+
+    def _produce(self, core, emit, cwd, builtins, detach):
+        """Run the producer command; returns its non-empty output lines and its CommandResult"""
+        lines = []
+
+        def collect(stream, line):
+            if stream == "stdout":
+                lines.append(line)
+            else:
+                emit(stream, line)
+
+        splitter = _LinePrefixer("", collect)
+        handle = core.submit(self.producer, cwd=cwd, on_output=splitter.feed, detach=detach, builtins=builtins)
+        with self._lock:
+            self._handles.append(handle)
+        try:
+            result = handle.result()
+        except KeyboardInterrupt:
+            handle.cancel()
+            handle.result()
+            raise
+        finally:
+            with self._lock:
+                self._handles.remove(handle)
+        splitter.flush()
+        return [line for line in lines if line.strip()], result
+
+    def send_signal(self, sig):
+        """Signal every running item; returns False if none is running"""
+        if sig not in _JOB_CONTROL:
+            self._cancelled = True  # like a process group, the fan-out stops as a whole
+        with self._lock:
+            handles = list(self._handles)
+        return any([handle.send_signal(sig) for handle in handles])
+
+    def cancel(self):
+        """Stop the running items and start no more"""
+        self._cancelled = True
+        with self._lock:
+            handles = list(self._handles)
+        for handle in handles:
+            handle.cancel()
+        return True
+
+
+def _describe(result, timeout):
+    if result.timed_out:
+        return f"timed out after {timeout:g}s"
+    if result.cancelled:
+        return "cancelled"
+    return f"exited with code {result.returncode}"
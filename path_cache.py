@@ -0,0 +1,215 @@
+"""
+Path completion from cached directory listings.
+
+prompt_toolkit's PathCompleter lists the directory again on every keystroke,
+which stalls on network filesystems and directories with hundreds of thousands
+of entries. DirectoryCache keeps the sorted listing of recently completed
+directories and reuses it while the directory's mtime is unchanged. The mtime
+is checked at most every REVALIDATE_INTERVAL seconds per directory, so typing
+a long name costs one stat(), not one per key.
+
+On Linux an inotify watch is added to each cached directory, which drops its
+listing the moment an entry is created, removed or renamed. inotify does not
+see changes made by other NFS clients; those are picked up by the mtime check.
+A dropped listing gives up its watch, which comes back with the next lookup, so
+watches never outnumber the cached listings.
+
+A scan stops after max_entries names; completion in such a directory only
+offers names from the part that was read.
+"""
+import bisect
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+MAX_SCAN_ENTRIES = 50000      # names read from one directory
+MAX_DIRECTORIES = 64          # listings kept, least recently used dropped first
+MAX_COMPLETIONS = 200         # completions offered for one prefix
+REVALIDATE_INTERVAL = 2.0     # seconds a listing is used without checking the mtime
+RACY_WINDOW = 1.0             # seconds; a listing taken this soon after a change is rescanned
+
+# names: sorted names; dirs: the names that are directories; truncated: the scan hit max_entries
+Listing = namedtuple("Listing", ["mtime_ns", "names", "dirs", "truncated", "checked"])
+
+
+def from_config(config):
+    """The DirectoryCache configured in config.py"""
+    return DirectoryCache(max_entries=config.PATH_COMPLETION_MAX_ENTRIES, watch=config.PATH_COMPLETION_INOTIFY)
+
+
+def scan(directory, max_entries=MAX_SCAN_ENTRIES):
+    """(sorted names, set of directory names, truncated) of one directory"""
+    names, dirs = [], set()
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if len(names) >= max_entries:
+                return sorted(names), dirs, True
+            names.append(entry.name)
+            try:
+                # the dirent type answers this without a stat() except for symlinks
+                if entry.is_dir():
+                    dirs.add(entry.name)
+            except OSError:
+                pass
+    return sorted(names), dirs, False
+
+
+class DirectoryCache:
+    """Listings of recently completed directories; safe to use from any thread"""
+
+    def __init__(self, max_entries=MAX_SCAN_ENTRIES, max_directories=MAX_DIRECTORIES, watch=True):
+        self.max_entries = max_entries
+        self.max_directories = max_directories
+        self._listings = OrderedDict()  # absolute directory -> Listing
+        self._lock = threading.Lock()
+        self._invalidations = 0  # bumped by invalidate(), to notice changes during a scan
+        self._watcher = _Inotify.create(self.invalidate) if watch else None
+
+    def listing(self, directory):
+        """The Listing of a directory, or None when it cannot be read"""
+        directory = os.path.abspath(directory)
+        now = time.time()
+        with self._lock:
+            cached = self._listings.get(directory)
+            if cached is not None:
+                self._listings.move_to_end(directory)
+                if now - cached.checked < REVALIDATE_INTERVAL:
+                    return cached
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            self.invalidate(directory)
+            return None
+        if self._watcher is not None:
+            self._watcher.watch(directory)
+        # a listing taken in the same mtime tick as a change may miss it, so it is only trusted once the tick has passed
+        racy = now - mtime_ns / 1e9 < RACY_WINDOW
+        if cached is not None and cached.mtime_ns == mtime_ns and not racy:
+            cached = cached._replace(checked=now)
+        else:
+            invalidations = self._invalidations
+            try:
+                names, dirs, truncated = scan(directory, self.max_entries)
+            except OSError:
+                self.invalidate(directory)
+                return None
+            # a racy listing, or one that changed while it was read, is checked again on the next lookup
+            stale = racy or invalidations != self._invalidations
+            cached = Listing(mtime_ns, names, dirs, truncated, 0.0 if stale else now)
+        with self._lock:
+            self._listings[directory] = cached
+            self._listings.move_to_end(directory)
+            while len(self._listings) > self.max_directories:
+                old, _ = self._listings.popitem(last=False)
+                if self._watcher is not None:
+                    self._watcher.unwatch(old)
+        return cached
+
+    def complete(self, directory, prefix, limit=MAX_COMPLETIONS):
+        """Names in a directory starting with prefix, directories with a trailing slash; hidden names need a "." prefix"""
+        listing = self.listing(directory)
+        if listing is None:
+            return []
+        names = listing.names
+        matches = []
+        for i in range(bisect.bisect_left(names, prefix), len(names)):
+            name = names[i]
+            if not name.startswith(prefix) or len(matches) >= limit:
+                break
+            if name.startswith(".") and not prefix.startswith("."):
+                continue
+            matches.append(name + "/" if name in listing.dirs else name)
+        return matches
+
+    def invalidate(self, directory):
+        """Drop a directory's listing and its inotify watch; the next lookup scans and watches it again"""
+        with self._lock:
+            self._invalidations += 1
+            self._listings.pop(directory, None)
+        if self._watcher is not None:
+            self._watcher.unwatch(directory)
+
+    def clear(self):
+        with self._lock:
+            directories = list(self._listings)
+            self._listings.clear()
+        if self._watcher is not None:
+            for directory in directories:
+                self._watcher.unwatch(directory)
+
+
+class _Inotify:
+    """Calls on_change(directory) when an entry of a watched directory is created, removed or renamed (Linux)"""
+
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    # IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+    MASK = 0x004 | 0x040 | 0x080 | 0x100 | 0x200 | 0x400 | 0x800
+    IN_IGNORED = 0x8000
+
+    @classmethod
+    def create(cls, on_change):
+        """An _Inotify, or None where inotify is not available"""
+        try:
+            import ctypes
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(cls.IN_NONBLOCK | cls.IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        return cls(libc, fd, on_change)
+
+    def __init__(self, libc, fd, on_change):
+        self._libc = libc
+        self._fd = fd
+        self._on_change = on_change
+        self._wds = {}    # watch descriptor -> directory
+        self._dirs = {}   # directory -> watch descriptor
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name="magicshell-inotify", daemon=True).start()
+
+    def watch(self, directory):
+        with self._lock:
+            if directory in self._dirs:
+                return
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), self.MASK)
+        if wd >= 0:
+            with self._lock:
+                self._wds[wd] = directory
+                self._dirs[directory] = wd
+
+    def unwatch(self, directory):
+        with self._lock:
+            wd = self._dirs.pop(directory, None)
+        if wd is not None:
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def _run(self):
+        import select
+        import struct
+        while True:
+            try:
+                select.select([self._fd], [], [])
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            except OSError:
+                return
+            offset = 0
+            while offset + 16 <= len(data):
+                wd, mask, _cookie, length = struct.unpack_from("iIII", data, offset)
+                offset += 16 + length
+                with self._lock:
+                    directory = self._wds.get(wd)
+                    if mask & self.IN_IGNORED:
+                        # the watch is gone: the directory was removed, or unwatch() already dropped its listing
+                        self._wds.pop(wd, None)
+                        if directory is not None and self._dirs.get(directory) == wd:
+                            del self._dirs[directory]
+                        else:
+                            directory = None
+                if directory is not None:
+                    self._on_change(directory)
@@ -0,0 +1,196 @@
+"""
+Native parsing of simple shell command lines.
+
+Covers the common subset: pipes, the >, >> and < redirections, the &&, ||
+and ; separators, and quoting. A line in this subset can be run by
+connecting processes with OS pipes directly, without starting /bin/sh.
+parse() returns None for anything outside the subset, such as variables,
+globs, subshells, background jobs, fd redirections, shell keywords or
+builtins, so the caller can fall back to the shell.
+"""
+import os
+import shutil
+
+# characters that need a real shell when they appear unquoted
+_SHELL_SPECIAL = set("$`*?[]{}()!#~&\n")
+# words that are shell syntax or must run inside the shell itself
+_SHELL_WORDS = {
+    "if", "then", "else", "elif", "fi", "for", "while", "until", "do", "done",
+    "case", "esac", "function", "select", "time", "[[", "]]", "!",
+    "cd", "export", "unset", "alias", "source", ".", "exec", "exit", "set",
+    "eval", "read", "ulimit", "umask", "wait", "trap", "shift", "return",
+}
+_OPERATORS = ("&&", "||", ">>", "|", ";", ">", "<")
+# builtins that /bin/sh runs without starting a process; a line made only of
+# these is cheaper in the shell than as native processes
+_SH_BUILTINS = {"echo", "printf", "true", "false", "test", "[", "pwd", ":"}
+
+_which_cache = {}
+
+
+class Redirect:
+    """A redirection of stdin (<) or stdout (>, >>) to a file"""
+
+    def __init__(self, op, target):
+        self.op = op
+        self.target = target
+
+    def __repr__(self):
+        return f"Redirect({self.op!r}, {self.target!r})"
+
+
+class SimpleCommand:
+    """One stage of a pipeline: an argv and its redirections"""
+
+    def __init__(self, argv, redirects, path=None):
+        self.argv = argv
+        self.redirects = redirects
+        self.path = path  # resolved executable, set by parse()
+
+    def __repr__(self):
+        return f"SimpleCommand({self.argv!r}, {self.redirects!r})"
+
+
+def tokenize(line):
+    """
+    Split a command line into ("word", text) and ("op", operator) tokens.
+    Returns None when the line uses syntax outside the supported subset.
+    """
+    tokens = []
+    word = []
+    in_word = False
+    i, n = 0, len(line)
+    while i < n:
+        ch = line[i]
+        if ch in " \t":
+            if in_word:
+                tokens.append(("word", "".join(word)))
+                word, in_word = [], False
+            i += 1
+        elif ch == "'":
+            end = line.find("'", i + 1)
+            if end < 0:
+                return None
+            word.append(line[i + 1:end])
+            in_word = True
+            i = end + 1
+        elif ch == '"':
+            i += 1
+            while i < n and line[i] != '"':
+                if line[i] in "$`":
+                    return None  # expansion inside double quotes
+                if line[i] == "\\" and i + 1 < n and line[i + 1] in '"\\$`':
+                    i += 1
+                word.append(line[i])
+                i += 1
+            if i >= n:
+                return None
+            in_word = True
+            i += 1
+        elif ch == "\\":
+            if i + 1 >= n or line[i + 1] == "\n":
+                return None
+            word.append(line[i + 1])
+            in_word = True
+            i += 2
+        elif line.startswith(_OPERATORS, i):
+            op = next(o for o in _OPERATORS if line.startswith(o, i))
+            if op in (">", ">>", "<"):
+                # "2>file", "<<" and ">|" need the shell
+                if in_word and "".join(word).isdigit():
+                    return None
+                if line.startswith(("<<", "<>", ">|", ">&", "<&"), i):
+                    return None
+            if in_word:
+                tokens.append(("word", "".join(word)))
+                word, in_word = [], False
+            tokens.append(("op", op))
+            i += len(op)
+        elif ch in _SHELL_SPECIAL:
+            return None
+        else:
+            word.append(ch)
+            in_word = True
+            i += 1
+    if in_word:
+        tokens.append(("word", "".join(word)))
+    return tokens
+
+
+def parse(line):
+    """
+    Parse a command line into [(connector, [SimpleCommand, ...]), ...] where the
+    connector (None, "&&", "||" or ";") says how a pipeline follows the previous one.
+    Returns None if the line needs /bin/sh.
+    """
+    sequence = split(line)
+    if sequence is None:
+        return None
+    commands = [stage for _, pipeline in sequence for stage in pipeline]
+    if all(stage.argv[0] in _SH_BUILTINS for stage in commands):
+        return None
+    for stage in commands:
+        name = stage.argv[0]
+        if name in _SHELL_WORDS or "=" in name:
+            return None  # shell syntax, a builtin or VAR=value
+        if "/" in name and not os.path.isabs(name):
+            return None  # relative to the command's cwd, which we don't resolve here
+        path = _which(name)
+        if path is None:
+            return None  # let sh report "command not found"
+        stage.path = path
+    return sequence
+
+
+def _which(name):
+    """shutil.which() with the result remembered per PATH"""
+    key = (name, os.environ.get("PATH"))
+    path = _which_cache.get(key)
+    if path is None or not os.access(path, os.X_OK):
+        path = _which_cache[key] = shutil.which(name)
+    return path
+
+
+def stages(line):
+    """Return the argv of every simple command in the line, or [] if it cannot be split"""
+    sequence = split(line)
+    return [stage.argv for _, pipeline in sequence or [] for stage in pipeline]
+
+
+def split(line):
+    """Like parse(), but without resolving the commands or preferring the shell for builtins"""
+    return _split(tokenize(line))
+
+
+def _split(tokens):
+    if not tokens:
+        return None
+
+    sequence = []
+    pipeline = []
+    argv, redirects = [], []
+    connector = None
+    it = iter(tokens)
+    for kind, value in it:
+        if kind == "word":
+            argv.append(value)
+        elif value in (">", ">>", "<"):
+            target = next(it, None)
+            if target is None or target[0] != "word":
+                return None
+            redirects.append(Redirect(value, target[1]))
+        else:
+            if not argv:
+                return None  # empty stage, let the shell report the syntax error
+            pipeline.append(SimpleCommand(argv, redirects))
+            argv, redirects = [], []
+            if value != "|":
+                sequence.append((connector, pipeline))
+                pipeline, connector = [], value
+    if argv:
+        pipeline.append(SimpleCommand(argv, redirects))
+    elif pipeline or connector != ";":
+        return None  # dangling "|", "&&" or "||"
+    if pipeline:
+        sequence.append((connector, pipeline))
+    return sequence
@@ -0,0 +1,63 @@
+"""
+Sorted prefix index for command completion.
+
+Entries are kept in one list sorted by their lower-cased text, so all entries
+starting with a prefix sit next to each other: a search is a binary search
+followed by a scan of the matches only, and its cost does not grow with the
+number of entries that don't match. Adding one entry is a bisect.insort().
+"""
+import bisect
+
+
+class PrefixIndex:
+    """Case-insensitive set of strings searchable by prefix"""
+
+    def __init__(self, entries=()):
+        self._items = []  # (entry.lower(), entry), sorted
+        self.update(entries)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, entry):
+        item = (entry.lower(), entry)
+        i = bisect.bisect_left(self._items, item)
+        return i < len(self._items) and self._items[i] == item
+
+    def __iter__(self):
+        return (entry for _, entry in self._items)
+
+    def update(self, entries):
+        """Add many entries at once; cheaper than add() for large batches"""
+        items = set(self._items)
+        items.update((entry.lower(), entry) for entry in entries if entry)
+        self._items = sorted(items)
+
+    def add(self, entry):
+        """Add one entry; returns False if it was already there"""
+        if not entry:
+            return False
+        item = (entry.lower(), entry)
+        i = bisect.bisect_left(self._items, item)
+        if i < len(self._items) and self._items[i] == item:
+            return False
+        self._items.insert(i, item)
+        return True
+
+    def discard(self, entry):
+        item = (entry.lower(), entry)
+        i = bisect.bisect_left(self._items, item)
+        if i < len(self._items) and self._items[i] == item:
+            del self._items[i]
+
+    def search(self, prefix, limit=None):
+        """Entries starting with prefix, ignoring case, in sorted order; at most `limit` of them"""
+        key = prefix.lower()
+        items = self._items
+        i = bisect.bisect_left(items, (key,))
+        end = len(items) if limit is None else min(len(items), i + limit)
+        matches = []
+        while i < end and items[i][0].startswith(key):
+            matches.append(items[i][1])
+            i += 1
+        return matches
@@ -0,0 +1,199 @@
+"""
+Opt-in cache for the output of read-only commands.
+
+Commands on an allow-list (RESULT_CACHE_COMMANDS in config.py) are keyed on
+the command line, working directory and environment. Each entry also keeps a
+fingerprint of the files the command looks at: the inode, size, mtime and
+ctime of every path in its scope, taken just before it ran. A later run with
+the same key is answered from the cache only while that fingerprint is
+unchanged, so a hit costs some stat() calls instead of a fork and exec.
+
+The scope of a command is one of:
+    "entries"  its path arguments (or the cwd) and the entries of those that are directories
+    "tree"     everything below its path arguments (or the cwd)
+    "repo"     the work tree of the enclosing git repository, with its index, HEAD and refs
+
+Prefix a command with /nocache to run it for real.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from pipeline import split
+
+BYPASS_PREFIX = "/nocache"
+MAX_ENTRIES = 64                  # cached results, least recently used dropped first
+MAX_OUTPUT_CHARS = 256 * 1024     # larger outputs are not cached
+MAX_FINGERPRINT_PATHS = 20000     # commands whose scope is larger are not cached
+RACY_WINDOW = 1.0                 # seconds; see ResultCache.prepare()
+SCOPES = ("entries", "tree", "repo")
+
+# what prepare() found out about a command: the cache key and the fingerprint of its scope
+Lookup = namedtuple("Lookup", ["key", "fingerprint", "storable"])
+Entry = namedtuple("Entry", ["fingerprint", "chunks", "returncode"])
+
+
+def split_bypass(command):
+    """Strip a leading /nocache; returns (bypass, command)"""
+    words = command.split(None, 1)
+    if words and words[0] == BYPASS_PREFIX:
+        return True, words[1] if len(words) > 1 else ""
+    return False, command
+
+
+def from_config(config):
+    """The ResultCache configured in config.py, or None when it is off"""
+    if not config.RESULT_CACHE:
+        return None
+    return ResultCache(config.RESULT_CACHE_COMMANDS)
+
+
+class ResultCache:
+    """Saved output of allow-listed commands; safe to use from any thread"""
+
+    def __init__(self, commands, max_entries=MAX_ENTRIES):
+        # command prefix -> scope, longest prefixes first so "git status" wins over "git"
+        self.commands = sorted(((tuple(prefix.split()), scope) for prefix, scope in commands.items()),
+                               key=lambda item: -len(item[0]))
+        for prefix, scope in self.commands:
+            if scope not in SCOPES:
+                raise ValueError(f"unknown result cache scope '{scope}' for '{' '.join(prefix)}'")
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def prepare(self, command, cwd, env=None):
+        """
+        Return a Lookup for an allow-listed command, or None if it can't be cached.
+        Does filesystem I/O, so call it off the event loop. A command whose scope
+        was modified within RACY_WINDOW seconds can still be answered from the
+        cache but is not stored, because a change made right after it ran could
+        leave the same timestamps behind.
+        """
+        sequence = split(command)
+        if not sequence or len(sequence) != 1 or len(sequence[0][1]) != 1:
+            return None
+        stage = sequence[0][1][0]
+        if stage.redirects:
+            return None
+        scope, args = self._scope(stage.argv)
+        if scope is None:
+            return None
+        environment = os.environ if env is None else env
+        key = (command, cwd, hash(frozenset(environment.items())))
+        taken = time.time()
+        stats = _SCANNERS[scope](cwd, [arg for arg in args if not arg.startswith("-")])
+        if stats is None:
+            return None
+        newest = max((max(st[3], st[4]) for st in stats), default=0) / 1e9
+        return Lookup(key, hash(tuple(stats)), newest < taken - RACY_WINDOW)
+
+    def get(self, lookup):
+        """The cached Entry for a Lookup whose fingerprint still matches, or None"""
+        with self._lock:
+            entry = self._entries.get(lookup.key)
+            if entry is None or entry.fingerprint != lookup.fingerprint:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(lookup.key)
+            self.hits += 1
+            return entry
+
+    def put(self, lookup, chunks, returncode):
+        """Save the (stream, text) output chunks of a command that ran after `lookup`"""
+        if not lookup.storable or sum(len(text) for _, text in chunks) > MAX_OUTPUT_CHARS:
+            return
+        with self._lock:
+            self._entries[lookup.key] = Entry(lookup.fingerprint, list(chunks), returncode)
+            self._entries.move_to_end(lookup.key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _scope(self, argv):
+        for prefix, scope in self.commands:
+            if tuple(argv[:len(prefix)]) == prefix:
+                return scope, argv[len(prefix):]
+        return None, []
+
+
+def _stat(path):
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return (path, None, None, 0, 0)
+    return (path, st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+
+
+def _operands(cwd, paths):
+    """Path arguments that exist, or the cwd; words that aren't paths (patterns, revisions) are skipped"""
+    found = [os.path.join(cwd, path) for path in paths if os.path.lexists(os.path.join(cwd, path))]
+    return found or [cwd]
+
+
+def _scan_entries(cwd, paths):
+    stats = []
+    for path in _operands(cwd, paths):
+        stats.append(_stat(path))
+        if os.path.isdir(path):
+            try:
+                names = sorted(os.listdir(path))
+            except OSError:
+                continue
+            if len(names) > MAX_FINGERPRINT_PATHS:
+                return None
+            stats.extend(_stat(os.path.join(path, name)) for name in names)
+    return stats
+
+
+def _walk(top, stats, skip=()):
+    """Append the stats of everything below top; False once there are too many"""
+    stats.append(_stat(top))
+    pending = [top]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.name in skip:
+                continue
+            stats.append(_stat(entry.path))
+            if len(stats) > MAX_FINGERPRINT_PATHS:
+                return False
+            if entry.is_dir(follow_symlinks=False):
+                pending.append(entry.path)
+    return True
+
+
+def _scan_tree(cwd, paths):
+    stats = []
+    for path in _operands(cwd, paths):
+        if not _walk(path, stats):
+            return None
+    return stats
+
+
+def _scan_repo(cwd, paths):
+    root = cwd
+    while not os.path.isdir(os.path.join(root, ".git")):
+        parent = os.path.dirname(root)
+        if parent == root:
+            return None  # not in a repository (or a worktree with a .git file)
+        root = parent
+    stats = []
+    git_dir = os.path.join(root, ".git")
+    if not _walk(root, stats, skip={".git"}) or not _walk(os.path.join(git_dir, "refs"), stats):
+        return None
+    stats.extend(_stat(os.path.join(git_dir, name)) for name in ("HEAD", "index", "packed-refs", "config"))
+    return stats
+
+
+_SCANNERS = {"entries": _scan_entries, "tree": _scan_tree, "repo": _scan_repo}
@@ -1,18 +1,65 @@
 # import subprocess
 import os
 import platform
-import subprocess
 import shutil
+import time
+from collections import deque
 from safety import is_dangerous_command
+from exec_core import CommandResult, ResourceUsage, get_core
+from limits import ResourceLimits, limit_message, split_prefix
+import parallel
+import result_cache
+from shell_session import PersistentShell
+
+# Streaming mode keeps only this many trailing characters of output in memory
+STREAM_TAIL_CHARS = 64 * 1024
+
+class _OutputTail:
+    """Keeps the last `limit` characters written to it"""
+    def __init__(self, limit):
+        self.limit = limit
+        self.chunks = deque()
+        self.size = 0
+
+    def write(self, text):
+        self.chunks.append(text)
+        self.size += len(text)
+        # drop whole chunks that fall entirely outside the tail window
+        while self.size - len(self.chunks[0]) >= self.limit:
+            self.size -= len(self.chunks.popleft())
+
+    def getvalue(self):
+        return "".join(self.chunks)[-self.limit:]
 
 class ShellCommandExecutor:
-    def __init__(self):
+    def __init__(self, persistent=False, fast_builtins=False, limits=None, cache=None):
         self.current_dir = os.getcwd()
+        self.last_streamed = False  # True when the last command wrote its output to a stream
+        self.last_usage = None  # ResourceUsage of the last system command
+        self.last_returncode = None  # exit code of the last system command
+        self.last_cached = False  # True when the last command's output came from the result cache
+        self.limits = limits or ResourceLimits()  # default timeout and rlimits for system commands
+        self.core = get_core()  # asyncio execution core shared with the GUI
+        self.fast_builtins = fast_builtins  # run simple ls/cat/wc/... lines in-process
+        self.cache = cache  # result_cache.ResultCache for read-only commands, or None
+        # optional long-lived bash session that runs every system command
+        self.session = PersistentShell(self.current_dir) if persistent and PersistentShell.available() else None
 
-    def execute(self, command):
+    def execute(self, command, stream=None):
+        self.last_streamed = False
+        self.last_usage = None
+        self.last_returncode = None
+        self.last_cached = False
         command = command.strip()
         if not command:
             return ""
+        bypass, command = result_cache.split_bypass(command)
+        try:
+            limits, command = split_prefix(command, self.limits)
+        except ValueError as e:
+            return f"magicshell: {e}"
+        if parallel.is_fanout(command):
+            return self.run_fanout(command, stream=stream, limits=limits)
 
         parts = command.split()
         cmd = parts[0]
@@ -33,7 +80,7 @@ class ShellCommandExecutor:
             return self.clear_screen()
 
         # Safe wrapper for standard shell commands
-        return self.run_system_command(command)
+        return self.run_system_command(command, stream=stream, limits=limits, use_cache=not bypass)
 
     def change_directory(self, args):
         if not args:
@@ -54,14 +101,135 @@ class ShellCommandExecutor:
         os.system("cls" if platform.system() == "Windows" else "clear")
         return ""
 
-    def run_system_command(self, command):
+    def run_system_command(self, command, stream=None, limits=None, use_cache=True):
+        limits = limits or self.limits
+        cache = self.cache if use_cache else None
+        # the session's bash can't take rlimits for one command, so those run in a fresh process
+        if self.session is not None and not limits.rlimits():
+            return self.run_session_command(command, stream, limits=limits)
+        if stream is not None:
+            return self.stream_system_command(command, stream, limits=limits, cache=cache)
+        output = {"stdout": [], "stderr": []}
         try:
-            result = subprocess.run(
-                command, shell=True, capture_output=True, text=True, cwd=self.current_dir
+            # detach=False hands the command the terminal, so Ctrl-C reaches it
+            result = self.core.run(
+                command, cwd=self.current_dir, detach=False, builtins=self.fast_builtins,
+                timeout=limits.timeout, rlimits=limits.rlimits(), cache=cache,
+                on_output=lambda chunk: output[chunk.stream].append(chunk.text),
             )
-            return result.stdout + result.stderr
         except Exception as e:
             return str(e)
+        self.last_cached = result.cached
+        self.record_usage(result.returncode, result.usage)
+        note = limit_message(result, limits)
+        if note:
+            output["stderr"].append(note + "\n")
+        return "".join(output["stdout"]) + "".join(output["stderr"])
+
+    def stream_system_command(self, command, stream, tail_chars=STREAM_TAIL_CHARS, limits=None, cache=None):
+        """
+        Run a command and write its output to `stream` as it arrives.
+        Only the last `tail_chars` characters are kept and returned.
+        """
+        tail = _OutputTail(tail_chars)
+
+        def on_output(chunk):
+            stream.write(chunk.text)
+            stream.flush()
+            tail.write(chunk.text)
+
+        limits = limits or self.limits
+        self.last_streamed = True
+        try:
+            result = self.core.run(command, cwd=self.current_dir, detach=False, builtins=self.fast_builtins,
+                                   timeout=limits.timeout, rlimits=limits.rlimits(), cache=cache,
+                                   on_output=on_output)
+        except Exception as e:
+            self.last_streamed = False
+            return str(e)
+        self.last_cached = result.cached
+        self.record_usage(result.returncode, result.usage)
+        note = limit_message(result, limits)
+        if note:
+            stream.write(note + "\n")
+            tail.write(note + "\n")
+        return tail.getvalue()
+
+    def run_session_command(self, command, stream=None, tail_chars=STREAM_TAIL_CHARS, limits=None):
+        """
+        Run a command in the persistent bash session. With a stream the output is
+        written as it arrives and only the tail is returned, as in stream_system_command.
+        Only the timeout of `limits` applies here.
+        """
+        timeout = (limits or self.limits).timeout
+        started = time.monotonic()
+        try:
+            if stream is None:
+                output, rc, timed_out = self.session.run(command, cwd=self.current_dir, timeout=timeout)
+            else:
+                self.last_streamed = True
+                tail = _OutputTail(tail_chars)
+
+                def on_output(text):
+                    stream.write(text)
+                    stream.flush()
+                    tail.write(text)
+
+                _, rc, timed_out = self.session.run(command, on_output=on_output, cwd=self.current_dir, timeout=timeout)
+                output = tail.getvalue()
+        except OSError as e:
+            return str(e)
+        # the session's bash is long-lived, so only the wall time is per command
+        elapsed = time.monotonic() - started
+        self.record_usage(rc, ResourceUsage(elapsed))
+        if timed_out:
+            note = limit_message(CommandResult(rc, timed_out=True), limits or self.limits) + "\n"
+            if stream is not None:
+                stream.write(note)
+            output += note
+
+        # the command may have changed directory (e.g. `cd src && make`)
+        if self.session.cwd != self.current_dir and os.path.isdir(self.session.cwd):
+            os.chdir(self.session.cwd)
+            self.current_dir = self.session.cwd
+        return output
+
+    def run_fanout(self, command, stream=None, tail_chars=STREAM_TAIL_CHARS, limits=None):
+        """
+        Run a /par line: the template once per input, several at a time, with
+        each output line prefixed by its input. The limits apply to every item.
+        """
+        try:
+            fanout = parallel.parse(command, self.current_dir)
+        except ValueError as e:
+            return f"magicshell: {e}"
+        if is_dangerous_command(fanout.template):
+            if not self.confirm(f"You are about to run '{fanout.template}' on many inputs. Proceed? (Y/N)"):
+                return "Aborted by user"
+        limits = limits or self.limits
+        output = {"stdout": [], "stderr": []}
+        tail = _OutputTail(tail_chars)
+
+        def emit(name, line):
+            if stream is None:
+                output[name].append(line + "\n")
+                return
+            stream.write(line + "\n")
+            stream.flush()
+            tail.write(line + "\n")
+
+        self.last_streamed = stream is not None
+        # the items run detached, so Ctrl-C interrupts fanout.run() itself, which cancels them all
+        result = fanout.run(self.core, emit, cwd=self.current_dir, timeout=limits.timeout,
+                            rlimits=limits.rlimits(), builtins=self.fast_builtins)
+        self.record_usage(result.returncode, result.usage)
+        if stream is not None:
+            return tail.getvalue()
+        return "".join(output["stdout"]) + "".join(output["stderr"])
+
+    def record_usage(self, returncode, usage):
+        self.last_usage = usage
+        self.last_returncode = returncode
 
     def confirm(self, prompt_text):
         while True:
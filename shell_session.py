@@ -0,0 +1,220 @@
+"""
+Persistent shell backend for MagicShell.
+
+Keeps one bash process alive per session on a pseudo-terminal, so exports,
+aliases, functions and the working directory survive between commands and
+short commands skip the cost of starting a new shell. Every command is
+followed by a sentinel line, printed from PROMPT_COMMAND whenever bash is
+ready for input again, which carries the exit code and the shell's $PWD and
+marks where the command's output ends.
+
+A command that runs past its timeout gets SIGINT, then SIGTERM, then SIGKILL,
+INTERRUPT_GRACE seconds apart; if bash is still not back at its prompt after
+that, the session is killed and a new one starts with the next command.
+"""
+import codecs
+import locale
+import os
+import select
+import shlex
+import shutil
+import signal
+import struct
+import subprocess
+import threading
+import uuid
+from collections import namedtuple
+
+READ_SIZE = 64 * 1024
+INTERRUPT_GRACE = 2.0  # seconds between the signals that stop a command, and before the session is killed
+_ESCALATION = (signal.SIGINT, signal.SIGTERM, signal.SIGKILL)
+
+# What run() returns; timed_out is True when the command had to be stopped at its timeout
+SessionResult = namedtuple("SessionResult", ["output", "returncode", "timed_out"])
+
+
+def set_controlling_tty():
+    """preexec_fn for children started on a pty slave with start_new_session=True"""
+    import fcntl
+    import termios
+    # runs after setsid(): take the pty as controlling terminal so job control works
+    fcntl.ioctl(0, termios.TIOCSCTTY, 0)
+
+
+def set_winsize(fd, rows, cols):
+    """Set the window size of a pty; the kernel sends SIGWINCH to its foreground group"""
+    import fcntl
+    import termios
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack("HHHH", rows, cols, 0, 0))
+
+
+class PersistentShell:
+    def __init__(self, cwd=None, shell=None):
+        self.cwd = cwd or os.getcwd()
+        self.shell = shell or shutil.which("bash")
+        self.size = (24, 80)  # rows, cols
+        self.proc = None
+        self.master_fd = None
+        self.lock = threading.Lock()  # one command at a time per session
+        self._marker = f"__MAGICSHELL_{uuid.uuid4().hex}__"
+
+    @staticmethod
+    def available():
+        return os.name == "posix" and shutil.which("bash") is not None
+
+    @property
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    @property
+    def busy(self):
+        return self.lock.locked()
+
+    def start(self):
+        import pty
+        import termios
+
+        master, slave = pty.openpty()
+        attrs = termios.tcgetattr(slave)
+        attrs[1] &= ~termios.ONLCR  # keep "\n" as "\n"
+        attrs[3] &= ~termios.ECHO   # don't echo the commands we send
+        termios.tcsetattr(slave, termios.TCSANOW, attrs)
+        set_winsize(master, *self.size)
+
+        # the sentinel is printed before every prompt, even when a command is interrupted
+        sentinel_cmd = f"printf '\\n{self._marker}%s:%s\\n' \"$?\" \"$PWD\""
+        env = dict(os.environ, PS1="", PS2="", PROMPT_COMMAND=sentinel_cmd, TERM="dumb")
+        self.proc = subprocess.Popen(
+            [self.shell, "--noprofile", "--norc", "--noediting", "-i"],
+            stdin=slave, stdout=slave, stderr=slave,
+            cwd=self.cwd, env=env,
+            start_new_session=True,
+            preexec_fn=set_controlling_tty,
+        )
+        os.close(slave)
+        self.master_fd = master
+        # wait for the first prompt, dropping anything bash printed on startup
+        self._read_response(None, None)
+        self._run_locked("unset HISTFILE; set +o history", None, None, None)
+
+    def run(self, command, on_output=None, cwd=None, timeout=None):
+        """
+        Run a command in the session. Output is passed to on_output(text) as it
+        arrives; without a callback it is collected and returned.
+        Returns a SessionResult (output, returncode, timed_out).
+        """
+        with self.lock:
+            if not self.alive:
+                self.start()
+            try:
+                return self._run_locked(command, on_output, cwd or self.cwd, timeout)
+            except KeyboardInterrupt:
+                # keep the session in sync: stop the command and consume its sentinel
+                if self.alive:
+                    self.interrupt()
+                    self._read_response(None, INTERRUPT_GRACE)
+                raise
+
+    def _run_locked(self, command, on_output, cwd, timeout):
+        line = ""
+        if cwd:
+            line += f"cd -- {shlex.quote(cwd)} 2>/dev/null; "
+        line += f"eval {shlex.quote(command)}\n"
+        os.write(self.master_fd, line.encode())
+        return self._read_response(on_output, timeout)
+
+    def _read_response(self, on_output, timeout):
+        """Read output up to the next sentinel; returns a SessionResult"""
+        decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors="replace")
+        collected = []
+        emit = on_output or collected.append
+        sentinel = "\n" + self._marker
+        buf = ""
+        wait = timeout
+        sent = 0  # how many of the _ESCALATION signals were sent
+
+        while True:
+            ready, _, _ = select.select([self.master_fd], [], [], wait)
+            if not ready:
+                if sent == len(_ESCALATION):
+                    # not even SIGKILL brought bash back to its prompt; give up on this session
+                    self.close()
+                    return SessionResult("".join(collected), -signal.SIGKILL, True)
+                self.signal_foreground(_ESCALATION[sent])
+                sent, wait = sent + 1, INTERRUPT_GRACE
+                continue
+            try:
+                data = os.read(self.master_fd, READ_SIZE)
+            except OSError:
+                data = b""
+            if not data:
+                # the shell exited (e.g. `exit`); a new one starts on the next command
+                if buf:
+                    emit(buf)
+                rc = self.proc.wait()
+                self.close()
+                return SessionResult("".join(collected), rc, sent > 0)
+
+            buf += decoder.decode(data)
+            idx = buf.find(sentinel)
+            if idx >= 0:
+                end = buf.find("\n", idx + len(sentinel))
+                if end < 0:
+                    continue  # wait for the rest of the sentinel line
+                if idx:
+                    emit(buf[:idx])
+                status, _, pwd = buf[idx + len(sentinel):end].partition(":")
+                if pwd:
+                    self.cwd = pwd
+                try:
+                    rc = int(status)
+                except ValueError:
+                    rc = -1
+                return SessionResult("".join(collected), rc, sent > 0)
+
+            # hold back a trailing piece that may be the start of the sentinel
+            nl = buf.rfind("\n")
+            if nl >= 0 and self._marker.startswith(buf[nl + 1:]):
+                ready_text, buf = buf[:nl], buf[nl:]
+            else:
+                ready_text, buf = buf, ""
+            if ready_text:
+                emit(ready_text)
+
+    def send_input(self, text):
+        """Forward input to the command currently running in the session"""
+        if self.alive:
+            os.write(self.master_fd, text.encode())
+
+    def resize(self, rows, cols):
+        self.size = (rows, cols)
+        if self.alive:
+            set_winsize(self.master_fd, rows, cols)
+
+    def interrupt(self):
+        """Send Ctrl-C to the foreground process group of the session"""
+        return self.signal_foreground(signal.SIGINT)
+
+    def signal_foreground(self, sig):
+        if not self.alive:
+            return False
+        try:
+            os.killpg(os.tcgetpgrp(self.master_fd), sig)
+            return True
+        except OSError:
+            return False
+
+    def close(self):
+        if self.proc is not None and self.proc.poll() is None:
+            try:
+                os.killpg(self.proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+            self.proc.wait()
+        if self.master_fd is not None:
+            try:
+                os.close(self.master_fd)
+            except OSError:
+                pass
+        self.proc = None
+        self.master_fd = None
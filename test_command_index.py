@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Test script for the MagicShell persistent command index
+"""
+
+import sys
+import os
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+import command_index
+from command_index import CommandIndex
+
+def make_tool(directory, name, mode=0o755):
+    path = os.path.join(directory, name)
+    with open(path, "w") as f:
+        f.write("#!/bin/sh\n")
+    os.chmod(path, mode)
+
+def test_command_index():
+    """Test scanning, persistence and rescanning only changed directories"""
+    print("📇 Testing MagicShell Command Index")
+    print("=" * 40)
+
+    scanned = []
+    scan_directory = command_index.scan_directory
+    old_path = os.environ.get("PATH", "")
+    with tempfile.TemporaryDirectory() as tmp:
+        bin_a, bin_b = os.path.join(tmp, "a"), os.path.join(tmp, "b")
+        os.mkdir(bin_a)
+        os.mkdir(bin_b)
+        make_tool(bin_a, "alpha")
+        make_tool(bin_a, "notes.txt", mode=0o644)
+        os.mkdir(os.path.join(bin_a, "subdir"))
+        make_tool(bin_b, "beta")
+        os.environ["PATH"] = os.pathsep.join([bin_a, bin_b, bin_a])
+        command_index.scan_directory = lambda d: scanned.append(d) or scan_directory(d)
+        try:
+            index_file = os.path.join(tmp, "index.json")
+            index = CommandIndex(path=index_file, include_compgen=False)
+            assert index.load() == []
+            assert index.refresh() == (["alpha", "beta"], True)
+            assert sorted(scanned) == [bin_a, bin_b]
+            print("✅ Executables on PATH indexed")
+
+            reloaded = CommandIndex(path=index_file, include_compgen=False)
+            assert reloaded.load() == ["alpha", "beta"]
+            scanned.clear()
+            assert reloaded.refresh() == (["alpha", "beta"], False) and scanned == []
+            print("✅ Saved index loaded without rescanning")
+
+            make_tool(bin_b, "gamma")
+            os.utime(bin_b, ns=(0, os.stat(bin_b).st_mtime_ns + 1000))
+            assert reloaded.refresh() == (["alpha", "beta", "gamma"], True) and scanned == [bin_b]
+            os.environ["PATH"] = bin_b
+            assert reloaded.commands() == ["beta", "gamma"]
+            print("✅ Only changed directories rescanned")
+        finally:
+            command_index.scan_directory = scan_directory
+            os.environ["PATH"] = old_path
+
+if __name__ == "__main__":
+    test_command_index()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Test script for the MagicShell completion service
+"""
+
+import sys
+import os
+import tempfile
+import threading
+import types
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from command_index import CommandIndex
+import completion_service
+from completion_service import CompletionClient, CompletionServer, CompletionService
+from flag_index import FlagIndex
+from history_store import HistoryStore
+from path_cache import DirectoryCache
+
+def run_now(fn, *args):
+    fn(*args)
+
+def make_service(tmp):
+    return CompletionService(command_index=CommandIndex(path=os.path.join(tmp, "index.json"), include_compgen=False),
+                             directory_cache=DirectoryCache(watch=False),
+                             flag_index=FlagIndex(directory=os.path.join(tmp, "flags"), submit=run_now,
+                                                  help_commands={"frobnicate", "frobulate"}),
+                             submit=run_now)
+
+def write_history(path, lines, cwd):
+    store = HistoryStore(path)
+    for line in lines:
+        store.add(line, cwd)
+    store.close()
+
+def texts(suggestions):
+    return [s.text for s in suggestions]
+
+def test_completion_service():
+    """Test commands, ranking, paths and flags locally and over the socket"""
+    print("🧩 Testing MagicShell Completion Service")
+    print("=" * 40)
+
+    old_path = os.environ.get("PATH", "")
+    with tempfile.TemporaryDirectory() as tmp:
+        bin_dir = os.path.join(tmp, "bin")
+        os.mkdir(bin_dir)
+        for name in ("frobnicate", "frobulate"):
+            with open(os.path.join(bin_dir, name), "w") as f:
+                f.write("#!/bin/sh\necho '  -q, --quiet    say nothing'\n")
+            os.chmod(os.path.join(bin_dir, name), 0o755)
+        work = os.path.join(tmp, "work")
+        os.mkdir(work)
+        open(os.path.join(work, "notes.txt"), "w").close()
+        history = os.path.join(tmp, "history.db")
+        write_history(history, ["frobulate --all", "frobulate --all"], work)
+        os.environ["PATH"] = os.pathsep.join([bin_dir, old_path])
+        try:
+            service = make_service(tmp)
+            service.warm()
+            assert texts(service.complete("frob", work)) == ["frobnicate", "frobulate"]
+            found = service.complete("frob", work, history)
+            assert texts(found) == ["frobulate", "frobulate --all", "frobnicate"] and found[0].start_position == -4
+            assert "frobnicate" in texts(service.complete("fnct", work))
+            print("✅ Commands from PATH, ranked by the history, then fuzzy")
+
+            for _ in range(3):
+                service.record("frobnicate -q x", history)
+            assert texts(service.complete("frob", work, history))[0] == "frobnicate"
+            assert texts(service.complete("frobnicate --q", work)) == ["--quiet"]
+            assert service.complete("frobnicate --q", work)[0].meta == "say nothing"
+            assert "notes.txt" in texts(service.complete("cat no", work))
+            assert texts(service.complete(f"cat {work}/no", "/")) == ["notes.txt"]
+            print("✅ Recorded lines, flags and paths")
+
+            socket_path = os.path.join(tmp, "completion.sock")
+            server = CompletionServer(socket_path, service=service)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            try:
+                client = CompletionClient.connect(socket_path)
+                other = CompletionClient.connect(socket_path)
+                assert texts(client.complete("frob", work, history)) == texts(service.complete("frob", work, history))
+                client.record("frobulate --fast", history)
+                assert "frobulate --fast" in texts(other.complete("frobu", work, history))
+                assert client.complete("cat no", work)[0].positions == [0, 1]
+                print("✅ Windows share one service over the socket")
+            finally:
+                server.shutdown()
+                server.server_close()
+            assert CompletionClient.connect(os.path.join(tmp, "missing.sock")) is None
+            client.close()
+            client.path = os.path.join(tmp, "missing.sock")
+            assert client.complete("frob", work) == []
+            print("✅ No suggestions, and no hang, without a server")
+
+            settings = types.SimpleNamespace(PATH_COMPLETION_MAX_ENTRIES=7, PATH_COMPLETION_INOTIFY=False,
+                                             FLAG_COMPLETION_RUN_HELP=True)
+            configured = completion_service.service_from_config(settings, submit=run_now)
+            assert configured.path_cache.max_entries == 7 and configured.path_cache._watcher is None
+            assert configured.flags.run_help
+            print("✅ Path and flag settings apply to a server's service too")
+        finally:
+            os.environ["PATH"] = old_path
+
+def test_recent_lines_first():
+    """Test that a line just run is scored by fuzzy search ahead of a long history of loose matches"""
+    print("🕘 Testing MagicShell Completion Order")
+    print("=" * 40)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        history = os.path.join(tmp, "history.db")
+        write_history(history, [f"grep -c pattern{i} main{i}.c" for i in range(1000)], tmp)
+        queued = []
+        service = make_service(tmp)
+        service._submit = lambda fn, *args: queued.append((fn, args))
+        service.warm(history)
+        assert [fn for fn, _ in queued][:1] == [service._build_ranking]
+        assert service._ranking_soon(history) is None and len(queued) == 2  # not built twice
+        assert texts(service.complete("grep -c pattern99", tmp, history)) == []  # no wait for the ranking
+        for fn, args in queued:
+            fn(*args)
+        assert "grep -c pattern999 main999.c" in texts(service.complete("grep -c pattern999", tmp, history))
+        print("✅ Ranking built in the background by warm(), not on the first keystroke")
+        assert "git commit -m wip" not in texts(service.complete("gcm", tmp, history))
+        service.record("git commit -m wip", history)
+        assert texts(service.complete("gcm", tmp, history))[0] == "git commit -m wip"
+        assert texts(service.complete("gcm", tmp))[0] == "git commit -m wip"
+        print("✅ Lines just run come before 1000 older loose matches")
+
+if __name__ == "__main__":
+    test_completion_service()
+    test_recent_lines_first()
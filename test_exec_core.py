@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Test script for the MagicShell asyncio execution core
+"""
+
+import sys
+import os
+import signal
+import threading
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+import exec_core
+from exec_core import ExecutionCore, get_core
+
+def test_exec_core():
+    """Test streaming, timeouts and cancellation"""
+    print("⚙️ Testing MagicShell Execution Core")
+    print("=" * 40)
+
+    core = get_core()
+
+    chunks = []
+    result = core.run("echo out; echo err >&2; exit 3", on_output=chunks.append)
+    streams = {c.stream: c.text for c in chunks}
+    assert result.returncode == 3
+    assert streams == {"stdout": "out\n", "stderr": "err\n"}, streams
+    assert [c.timestamp for c in chunks] == sorted(c.timestamp for c in chunks)
+    print("✅ stdout and stderr streamed with exit code")
+
+    # more than a pipe buffer on stderr must not stall stdout
+    result = core.run("head -c 300000 /dev/zero >&2; echo done", on_output=chunks.append)
+    assert result.returncode == 0
+    print("✅ Large stderr output drained concurrently")
+
+    start = time.monotonic()
+    result = core.run("sleep 5", timeout=0.2)
+    assert result.timed_out and time.monotonic() - start < 3
+    print("✅ Timeout stops the command")
+
+    handle = core.submit("sleep 5")
+    time.sleep(0.1)
+    handle.cancel()
+    result = handle.result(timeout=5)
+    assert result.cancelled and result.returncode != 0
+    print("✅ Cancellation stops the command")
+
+def test_resource_usage():
+    """Test wall time, CPU time and peak RSS accounting"""
+    core = get_core()
+    script = "x = bytearray(200 * 1024 * 1024); sum(range(2000000))"
+    result = core.run(f"{sys.executable} -c '{script}'")
+    usage = result.usage
+    assert usage.wall > 0 and usage.user + usage.system > 0
+    assert usage.max_rss > 200 * 1024, usage
+    print(f"✅ Usage measured: {usage.summary()}")
+
+def test_child_watcher():
+    """Test that without pidfds children are reaped on SIGCHLD, not by a thread each"""
+    print("👶 Testing MagicShell Child Watcher")
+    print("=" * 40)
+
+    if not hasattr(signal, "SIGCHLD"):
+        print("⚠️ No SIGCHLD here, skipped")
+        return
+    pidfd_open, handler = getattr(os, "pidfd_open", None), signal.getsignal(signal.SIGCHLD)
+    if pidfd_open is not None:
+        del os.pidfd_open
+    try:
+        core = ExecutionCore()
+    finally:
+        if pidfd_open is not None:
+            os.pidfd_open = pidfd_open
+    try:
+        assert isinstance(core._children, exec_core._ChildWatcher)
+        threads = threading.active_count()
+        handles = [core.submit(f"sleep 0.3; exit {i}") for i in range(5)]
+        time.sleep(0.1)
+        assert threading.active_count() == threads
+        results = [handle.result(timeout=5) for handle in handles]
+        assert [r.returncode for r in results] == list(range(5))
+        assert all(r.usage.user is not None for r in results)
+        assert core.run("sh -c 'kill -9 $$'").returncode == -9
+        print("✅ Exit codes and usage of 5 children with no thread started")
+    finally:
+        core.loop.call_soon_threadsafe(core.loop.stop)
+        signal.signal(signal.SIGCHLD, handler)
+
+if __name__ == "__main__":
+    test_exec_core()
+    test_resource_usage()
+    test_child_watcher()
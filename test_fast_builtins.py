@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test script for the MagicShell in-process fast builtins
+"""
+
+import sys
+import locale
+import os
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+import fast_builtins
+from exec_core import get_core
+from fast_builtins import Stopped, compile_line
+
+def compiled(line, cwd):
+    prepare = compile_line(line, cwd)
+    return prepare and prepare()
+
+def run_fast(line, cwd):
+    chunks = []
+    result = get_core().run(line, cwd=cwd, builtins=True, on_output=chunks.append)
+    return result.returncode, "".join(c.text for c in chunks if c.stream == "stdout")
+
+def run_real(line, cwd):
+    proc = subprocess.run(line, shell=True, cwd=cwd, capture_output=True, text=True)
+    return proc.returncode, proc.stdout
+
+def test_fast_builtins():
+    """Test that fast builtins match the real programs and fall back when needed"""
+    print("⚡ Testing MagicShell Fast Builtins")
+    print("=" * 40)
+    try:
+        locale.setlocale(locale.LC_COLLATE, "")  # as app.py does at startup, so ls can sort like the real one
+    except locale.Error:
+        pass
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.mkdir(os.path.join(tmp, "sub"))
+        with open(os.path.join(tmp, "notes.txt"), "w") as f:
+            f.write("one two\nthree\n" * 20)
+        with open(os.path.join(tmp, ".hidden"), "w") as f:
+            f.write("x")
+
+        for line in ["ls", "ls -a", "ls -A sub .", "cat notes.txt .hidden", "head -n 3 notes.txt",
+                     "head -2 notes.txt .hidden", "wc notes.txt", "wc -l notes.txt .hidden", "echo -n hi there"]:
+            if line.startswith("ls") and fast_builtins._collate_key() is None:
+                assert compiled(line, tmp) is None, line  # a locale this process could not load
+                continue
+            assert compiled(line, tmp) is not None, line
+            assert run_fast(line, tmp) == run_real(line, tmp), line
+        print("✅ Output matches the real programs")
+
+        assert run_fast("mkdir -p a/b && touch a/b/f", tmp) == (0, "")
+        assert os.path.isfile(os.path.join(tmp, "a", "b", "f"))
+        assert run_fast("cat notes.txt > copy.txt", tmp) == (0, "")
+        with open(os.path.join(tmp, "copy.txt")) as f:
+            assert f.read() == "one two\nthree\n" * 20
+        print("✅ Files and directories created in-process")
+
+        for line in ["ls -l", "cat missing.txt", "cat", "echo 'a\\tb'", "ls | wc -l", "wc -m notes.txt", "mkdir sub",
+                     "cat notes.txt > notes.txt", "cat .hidden copy.txt >> ./copy.txt", "wc notes.txt > sub/../notes.txt"]:
+            assert compiled(line, tmp) is None, line
+        assert compile_line("cat missing.txt", tmp) is not None  # only the worker-side prepare() looks at files
+        size = os.path.getsize(os.path.join(tmp, "copy.txt"))
+        assert run_fast("cat copy.txt >> copy.txt", tmp) == (1, "")  # "cat: copy.txt: input file is output file"
+        assert os.path.getsize(os.path.join(tmp, "copy.txt")) == size
+        print("✅ Unsupported options and error cases use the real programs")
+
+def test_builtins_stop():
+    """Test that a running builtin stops on its stop event, a timeout and a signal"""
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "big.log"), "wb") as f:
+            f.write(b"x" * (100 * fast_builtins.READ_SIZE))
+        stop = threading.Event()
+        blocks = []
+
+        def slow_write(stream, data):
+            blocks.append(data)
+            time.sleep(0.01)
+
+        threading.Timer(0.1, stop.set).start()
+        try:
+            compiled("cat big.log", tmp)(slow_write, stop)
+            raise AssertionError("cat was not stopped")
+        except Stopped:
+            pass
+        assert len(blocks) < 50
+        print("✅ A builtin stops at its next block once its stop event is set")
+
+    # a builtin that only ends when stopped, run through the execution core
+    def endless(write, stop):
+        while not stop.wait(0.01):
+            pass
+        raise Stopped()
+
+    compile = fast_builtins.compile_line
+    fast_builtins.compile_line = lambda line, cwd: lambda: endless
+    try:
+        start = time.monotonic()
+        result = get_core().run("cat big.log", builtins=True, timeout=0.2)
+        assert result.timed_out and result.returncode == -signal.SIGTERM and time.monotonic() - start < 2
+        handle = get_core().submit("cat big.log", builtins=True)
+        time.sleep(0.1)
+        assert not handle.send_signal(signal.SIGSTOP)
+        assert handle.send_signal(signal.SIGTERM)
+        assert handle.result(timeout=2).returncode == -signal.SIGTERM
+        handle = get_core().submit("cat big.log", builtins=True)
+        time.sleep(0.1)
+        handle.cancel()
+        assert handle.result(timeout=2).cancelled
+    finally:
+        fast_builtins.compile_line = compile
+    print("✅ Timeouts, signals and cancel() stop builtins run by the execution core")
+
+if __name__ == "__main__":
+    test_fast_builtins()
+    test_builtins_stop()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Test script for MagicShell flag completion
+"""
+
+import sys
+import os
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from flag_index import FlagIndex, parse_help
+
+HELP = """Usage: frob [OPTION]... FILE
+  -a, --all             frob every file
+  -n, --dry-run         show what would be frobbed
+      --color[=WHEN]    colorize the output
+  -o FILE               write to FILE
+"""
+
+MAN = """OPTIONS
+       -v, --verbose
+              Print each file as it is frobbed.
+"""
+
+def test_flag_index():
+    """Test parsing help text, building in the background and reusing the saved index"""
+    print("🚩 Testing MagicShell Flag Index")
+    print("=" * 40)
+
+    flags = dict(parse_help(HELP))
+    assert list(flags) == ["-a", "--all", "-n", "--dry-run", "--color", "-o"]
+    assert flags["--dry-run"] == "show what would be frobbed"
+    assert dict(parse_help(MAN))["--verbose"] == "Print each file as it is frobbed."
+    print("✅ Flags and descriptions parsed from --help and man page text")
+
+    old_path = os.environ.get("PATH", "")
+    with tempfile.TemporaryDirectory() as tmp:
+        bin_dir = os.path.join(tmp, "bin")
+        os.mkdir(bin_dir)
+        tool = os.path.join(bin_dir, "frob")
+        runs = os.path.join(tmp, "runs")
+        with open(tool, "w") as f:
+            f.write(f"#!/bin/sh\necho run >> {runs}\ncat <<'END'\n{HELP}END\n")
+        os.chmod(tool, 0o755)
+        os.environ["PATH"] = os.pathsep.join([bin_dir, old_path])
+        try:
+            queued = []
+            index = FlagIndex(directory=os.path.join(tmp, "flags"), submit=lambda fn, *args: queued.append((fn, args)),
+                              help_commands={"frob"})
+            assert index.complete("frob", "--") == []
+            for fn, args in queued:
+                fn(*args)
+            assert index.complete("frob", "--") == []
+            print("✅ Programs never run are not asked for --help")
+
+            index.learn("frob --all x")
+            for fn, args in queued[1:]:
+                fn(*args)
+            assert [flag for flag, _ in index.complete("frob", "--d")] == ["--dry-run"]
+            assert [flag for flag, _ in index.complete("frob", "--c")] == ["--color"]
+            print("✅ Index built in the background on first use")
+
+            fresh = FlagIndex(directory=os.path.join(tmp, "flags"), submit=lambda fn, *args: fn(*args),
+                              help_commands={"frob"})
+            fresh.complete("frob", "-")
+            assert len(fresh.complete("frob", "-")) == 6
+            with open(runs) as f:
+                assert f.read().count("run") == 1
+            print("✅ Saved index loaded without running the program")
+
+            with open(tool, "a") as f:
+                f.write("# changed\n")
+            fresh = FlagIndex(directory=os.path.join(tmp, "flags"), submit=lambda fn, *args: fn(*args),
+                              help_commands={"frob"})
+            fresh.complete("frob", "-")
+            with open(runs) as f:
+                assert f.read().count("run") == 2
+            print("✅ Index rebuilt when the binary changed")
+
+            def help_runs(index, command):
+                index.learn(command)
+                with open(runs) as f:
+                    return f.read().count("run")
+            strict = FlagIndex(directory=os.path.join(tmp, "strict"), submit=lambda fn, *args: fn(*args))
+            assert help_runs(strict, "frob") == 2 and strict.complete("frob", "-") == []
+            assert help_runs(FlagIndex(directory=os.path.join(tmp, "by-path"), submit=lambda fn, *args: fn(*args),
+                                       run_help=True), f"{tool} -a") == 2
+            old_home = os.environ.get("HOME")
+            os.environ["HOME"] = tmp
+            try:
+                assert help_runs(FlagIndex(directory=os.path.join(tmp, "home"), submit=lambda fn, *args: fn(*args),
+                                           help_commands={"frob"}), "frob") == 2
+            finally:
+                if old_home is None:
+                    del os.environ["HOME"]
+                else:
+                    os.environ["HOME"] = old_home
+            assert help_runs(FlagIndex(directory=os.path.join(tmp, "any"), submit=lambda fn, *args: fn(*args),
+                                       run_help=True), "frob") == 3
+            print("✅ --help only run for allowed programs, never for paths or scripts under home")
+        finally:
+            os.environ["PATH"] = old_path
+
+if __name__ == "__main__":
+    test_flag_index()
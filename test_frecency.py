@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test script for MagicShell frecency ranking
+"""
+
+import sys
+import os
+import tempfile
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from frecency import Frecency, HALF_LIFE
+
+def test_frecency():
+    """Test decay, ranking, search and the on-disk journal"""
+    print("📈 Testing MagicShell Frecency")
+    print("=" * 40)
+
+    now = time.time()
+    model = Frecency()
+    for _ in range(8):
+        model.visit("git log", now=now - 4 * HALF_LIFE)
+    model.visit("git status", now=now)
+    assert abs(model.score("git log", now) - 0.5) < 1e-9
+    assert model.score("git status", now) == 1.0
+    assert model.score("git", now) > model.score("git status", now)
+    assert model.score("never run", now) == 0.0
+    print("✅ Old runs decay below a recent one")
+
+    model.visit("git status", now=now)
+    ranked = model.search("GIT S")
+    assert ranked == ["git status"]
+    assert model.search("git", limit=2) == ["git", "git status"]
+    assert model.rank(["ls", "git log", "git status"]) == ["git status", "git log", "ls"]
+    print("✅ Search returns the best matches first")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sub", "history.frecency")
+        saved = Frecency(path)
+        saved.seed(["ls", "make", "ls"])
+        assert saved.search("")[0] == "ls"
+        for _ in range(3):
+            saved.visit("make test")
+        reloaded = Frecency(path)
+        assert reloaded.entries.keys() == saved.entries.keys()
+        assert all(abs(reloaded.score(e) - saved.score(e)) < 0.01 for e in saved.entries)
+        assert reloaded.search("ma") == ["make", "make test"]
+        print("✅ Journal reloads to the same scores")
+
+        for _ in range(400):
+            saved.visit("make test")
+        with open(path) as f:
+            lines = f.read().splitlines()
+        assert len(lines) < 2 * len(saved) + 256 + 2
+        assert Frecency(path).entries.keys() == saved.entries.keys()
+        print(f"✅ Journal compacted to {len(lines)} line(s)")
+
+        # two windows sharing the journal count each other's runs instead of overwriting them
+        shared = os.path.join(tmp, "shared.frecency")
+        first, second = Frecency(shared), Frecency(shared)
+        for _ in range(10):
+            first.visit("cargo build")
+        second.visit("cargo build")
+        assert abs(second.score("cargo build") - 11) < 0.01
+        first.visit("ls")
+        assert abs(first.score("cargo build") - 11) < 0.01
+        assert abs(Frecency(shared).score("cargo build") - 11) < 0.01
+        for _ in range(400):
+            first.visit("make test")
+        second.visit("cargo build")
+        assert abs(second.score("make test") - 400) < 0.1 and abs(second.score("cargo build") - 12) < 0.01
+        assert abs(Frecency(shared).score("cargo build") - 12) < 0.01
+        print("✅ Runs in other windows add up, before and after compaction")
+
+if __name__ == "__main__":
+    test_frecency()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Test script for MagicShell fuzzy matching
+"""
+
+import sys
+import os
+import random
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+import fuzzy
+from fuzzy import FuzzyIndex
+
+def test_fuzzy():
+    """Test matching, scoring, highlighting and narrowing while typing"""
+    print("🔎 Testing MagicShell Fuzzy Matching")
+    print("=" * 40)
+
+    assert fuzzy.score("gst", "git status")[1] == [0, 4, 5]
+    assert fuzzy.score("xyz", "git status") is None
+    assert fuzzy.score("GS", "git status") is not None
+    # word starts and consecutive characters beat scattered ones
+    assert fuzzy.score("gs", "git status")[0] > fuzzy.score("gs", "dragons")[0]
+    assert fuzzy.score("stat", "git status")[0] > fuzzy.score("stat", "s-t-a-t")[0]
+    # the shortest alignment is used for highlighting
+    assert fuzzy.score("ab", "a a ab")[1] == [4, 5]
+    print("✅ Characters matched in order, word starts and runs scored higher")
+
+    index = FuzzyIndex(["git status", "git stash", "grep -rn status", "ls -la", "git status"])
+    assert len(index) == 4
+    found = index.search("gst")
+    assert [m.text for m in found][:2] == ["git status", "git stash"]
+    assert index.search("[a") == [] and index.search("zz") == []
+    assert [m.text for m in index.search("")] == ["git status", "git stash", "grep -rn status", "ls -la"]
+    index.add("docker compose up")
+    assert [m.text for m in index.search("dcu")] == ["docker compose up"]
+    index.promote(["ls -la", "make test"])
+    assert [m.text for m in index.search("")][:3] == ["ls -la", "make test", "git status"] and len(index) == 6
+    assert [m.text for m in index.search("s", max_scored=2)] == ["ls -la", "make test"]
+    loose = FuzzyIndex([f"grep -c pattern{i} main{i}.c" for i in range(1000)])
+    loose.add("git commit -m wip")
+    assert loose.search("gcm", limit=5, max_scored=10)[0].text == "git commit -m wip"
+    assert fuzzy.fragments("ls", [1]) == [("class:fuzzymatch.outside", "l"), ("class:fuzzymatch.inside.character", "s")]
+    print("✅ Index search, add, promote and highlighting")
+
+    rng = random.Random(7)
+    words = ["git", "status", "docker", "compose", "up", "-la", "pytest", "src", "build", "Make"]
+    candidates = [" ".join(rng.choice(words) for _ in range(rng.randint(1, 4))) for _ in range(3000)]
+    typing = FuzzyIndex(candidates)
+    for query in ["docker compose up", "git status", "pytest src", "make build"]:
+        for end in range(1, len(query) + 1):
+            fresh = FuzzyIndex(candidates).search(query[:end], limit=20, max_scored=10 ** 6)
+            assert typing.search(query[:end], limit=20, max_scored=10 ** 6) == fresh, query[:end]
+    print("✅ Narrowed searches while typing equal fresh searches")
+
+if __name__ == "__main__":
+    test_fuzzy()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Test script for the MagicShell history store
+"""
+
+import sys
+import os
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+import history_store
+from history_store import HistoryStore
+from exec_core import ResourceUsage
+
+def test_history_store():
+    """Test recording, search by text, directory and time, and importing old history files"""
+    print("🗄️ Testing MagicShell History Store")
+    print("=" * 40)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "history.db")
+        store = HistoryStore(path)
+        first = store.add("git status", "/repo", 0, 0.25, started=1000.0)
+        store.add("make test", "/repo", 2, 12.5, started=2000.0)
+        store.add("ls -la", "/tmp", 0, 0.01, started=3000.0)
+        running = store.add("kubectl get pods", "/repo", started=4000.0)
+        assert len(store) == 4
+        assert [e.command for e in store.recent(2)] == ["kubectl get pods", "ls -la"]
+        assert store.recent(1)[0].exit_code is None
+        store.finish(running, 1, ResourceUsage(3.0, user=1.5, system=0.25, max_rss=2048))
+        entry = store.recent(1)[0]
+        assert (entry.exit_code, entry.duration, entry.cwd) == (1, 3.0, "/repo")
+        assert (entry.user_cpu, entry.sys_cpu, entry.max_rss) == (1.5, 0.25, 2048)
+        store.finish(first, 0, ResourceUsage(0.5))
+        assert store.search("git status")[0][3:] == (0, 0.5, 1000.0, None, None, None)
+        assert store.search()[-1].id == first
+        print("✅ Commands recorded with directory, exit code, wall and CPU time and peak RSS")
+
+        assert [e.command for e in store.search("STATUS")] == ["git status"]
+        assert [e.command for e in store.search("ls")] == ["ls -la"]
+        assert [e.command for e in store.search("t", cwd="/repo")] == ["kubectl get pods", "make test", "git status"]
+        assert [e.command for e in store.search(since=2000.0, until=4000.0)] == ["ls -la", "make test"]
+        assert store.search("100%") == [] and store.search('"quoted') == []
+        print(f"✅ Search by substring ({'FTS5' if store.fts else 'LIKE'}), directory and time range")
+
+        # another window sees the same history
+        other = HistoryStore(path)
+        other.add("echo hi", "/tmp")
+        assert store.recent(1)[0].command == "echo hi"
+        other.close()
+        assert history_store.is_store(path)
+        assert history_store.read_commands(path, limit=2) == ["kubectl get pods", "echo hi"]
+        print("✅ Shared between windows")
+
+        work = os.path.join(tmp, "work")
+        os.mkdir(work)
+        legacy = os.path.join(work, ".magicshell_history")
+        with open(legacy, "w") as f:
+            f.write("make\ncd src\nmake\n")
+        assert history_store.read_commands(legacy) == []
+        assert store.import_file(legacy) == 3
+        assert store.import_file(legacy) == 0
+        imported = store.search(cwd=work)
+        assert [e.command for e in imported] == ["make", "cd src", "make"]
+        assert all(e.exit_code is None and e.started == os.path.getmtime(legacy) for e in imported)
+        print("✅ Old .magicshell_history files imported once")
+        store.close()
+
+def test_history_paging():
+    """Test paging back through the store, with and without a search"""
+    print("📜 Testing MagicShell History Paging")
+    print("=" * 40)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = HistoryStore(os.path.join(tmp, "history.db"))
+        for i in range(25):
+            store.add(f"echo {i}" if i % 2 else f"make step{i}", "/repo", started=1000.0 + i)
+        pages, before = [], None
+        while True:
+            page = store.recent(10, before=before)
+            if not page:
+                break
+            pages.append([e.command for e in page])
+            before = page[-1].id
+        assert [len(p) for p in pages] == [10, 10, 5]
+        assert pages[0][0] == "make step24" and pages[-1][-1] == "make step0"
+        matching = store.search("make", limit=5)
+        older = store.search("make", limit=5, before=matching[-1].id)
+        assert [e.command for e in matching + older] == [f"make step{i}" for i in range(24, 4, -2)]
+        store.close()
+        print("✅ Pages of the store, newest first, with and without a search")
+
+if __name__ == "__main__":
+    test_history_store()
+    test_history_paging()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Test script for MagicShell per-command timeouts and resource limits
+"""
+
+import sys
+import os
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from exec_core import get_core
+from limits import ResourceLimits, limit_message, split_prefix
+
+def run_limited(command, limits):
+    chunks = []
+    result = get_core().run(command, timeout=limits.timeout, rlimits=limits.rlimits(), on_output=chunks.append)
+    return result, "".join(c.text for c in chunks)
+
+def test_limit_prefix():
+    """Test parsing of the /limit prefix"""
+    print("⏳ Testing MagicShell Resource Limits")
+    print("=" * 40)
+
+    defaults = ResourceLimits(timeout=60)
+    assert split_prefix("make test", defaults) == (defaults, "make test")
+    limits, command = split_prefix("/limit t=2m cpu=5 mem=512M files=64 make  test", defaults)
+    assert command == "make  test"
+    assert (limits.timeout, limits.cpu, limits.memory, limits.open_files) == (120, 5, 512 * 1024 ** 2, 64)
+    limits, _ = split_prefix("/limit timeout=0 vim", defaults)
+    assert limits.timeout is None
+    for bad in ["/limit", "/limit cpu=5", "/limit speed=1 ls", "/limit mem=lots ls"]:
+        try:
+            split_prefix(bad, defaults)
+        except ValueError:
+            continue
+        raise AssertionError(bad)
+    print("✅ /limit prefix parsed and validated")
+
+def test_limits_enforced():
+    """Test that timeouts and rlimits stop runaway commands"""
+    limits = ResourceLimits(timeout=0.3)
+    start = time.monotonic()
+    result, _ = run_limited("sleep 5 | cat", limits)
+    assert result.timed_out and time.monotonic() - start < 3
+    assert limit_message(result, limits) == "magicshell: command timed out after 0.3s"
+    print("✅ Wall-clock timeout stops the pipeline")
+
+    limits = ResourceLimits(cpu=1)
+    result, _ = run_limited(f"{sys.executable} -c 'while True: pass'", limits)
+    assert "CPU time limit" in limit_message(result, limits), result
+    print("✅ CPU limit stops a busy loop")
+
+    result, output = run_limited(f"{sys.executable} -c 'bytearray(512 * 1024 * 1024)'", ResourceLimits(memory=256 * 1024 ** 2))
+    assert result.returncode != 0 and "MemoryError" in output
+    print("✅ Address-space limit stops a large allocation")
+
+def alive(pid):
+    """True while pid runs; a zombie left to an init that does not reap counts as gone"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+    except OSError:
+        pass
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+def test_timeout_kills_descendants():
+    """Test that a timeout stops what the command started, not only its shell"""
+    for detach in (False, True):
+        chunks = []
+        result = get_core().run("sleep 17 & echo $!; wait", timeout=0.3, detach=detach, on_output=chunks.append)
+        assert result.timed_out
+        pid = int("".join(c.text for c in chunks).split()[0])
+        deadline = time.monotonic() + 3
+        while alive(pid) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert not alive(pid), f"sleep survived the timeout (detach={detach})"
+    print("✅ Timeout stops every process the command started")
+
+if __name__ == "__main__":
+    test_limit_prefix()
+    test_limits_enforced()
+    test_timeout_kills_descendants()
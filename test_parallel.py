@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test script for the MagicShell /par fan-out
+"""
+
+import sys
+import os
+import tempfile
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from exec_core import get_core
+import parallel
+
+def run_fanout(line, cwd):
+    lines = []
+    result = parallel.parse(line, cwd).run(get_core(), lambda stream, text: lines.append(text), cwd=cwd)
+    return result, lines
+
+def test_parse():
+    """Test templates and the three kinds of input"""
+    print("🔀 Testing MagicShell Parallel Fan-out")
+    print("=" * 40)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ["b.jpg", "a.jpg", "notes.txt"]:
+            open(os.path.join(tmp, name), "w").close()
+        with open(os.path.join(tmp, "repos.txt"), "w") as f:
+            f.write("src/app\n\nlib\n")
+
+        fanout = parallel.parse("/par -j 3 'convert {} {.}.png' ::: *.jpg none*", tmp)
+        assert fanout.jobs == 3 and fanout.inputs == ["a.jpg", "b.jpg", "none*"]
+        assert fanout.expand("my pic.jpg") == "convert 'my pic.jpg' 'my pic'.png"
+        assert parallel.parse("/par git -C {} fetch :::: repos.txt", tmp).inputs == ["src/app", "lib"]
+        assert parallel.parse("/par gzip ::: x", tmp).expand("d/f.log") == "gzip d/f.log"
+        assert parallel.parse("/par echo {/} {//} {/.} ::: x", tmp).expand("d/f.log") == "echo f.log d f"
+        fanout = parallel.parse("find . -name '*.log' | /par --jobs=2 gzip", tmp)
+        assert fanout.producer == "find . -name '*.log'" and fanout.inputs is None and fanout.jobs == 2
+
+        for bad in ["/par", "/par echo", "/par echo :::: missing.txt", "ls | /par echo ::: x", "/par -j 0 echo ::: x"]:
+            try:
+                parallel.parse(bad, tmp)
+            except ValueError:
+                continue
+            raise AssertionError(bad)
+    assert parallel.is_fanout("ls|/par echo") and not parallel.is_fanout("echo /parse")
+    for line in ["a || /par echo ::: x", "a && b | /par echo", "echo '/par x'", "echo x | '/par' y", "echo \\/par"]:
+        assert not parallel.is_fanout(line), line
+    assert parallel.parse("echo 'a|b' | grep a | /par echo", ".").producer == "echo 'a|b' | grep a"
+    print("✅ Templates, globs, input files and producers parsed")
+
+def test_run():
+    """Test concurrency, prefixed output and exit codes"""
+    start = time.monotonic()
+    result, lines = run_fanout("/par -j 4 'sleep 0.5; echo done' ::: 1 2 3 4", ".")
+    assert time.monotonic() - start < 1.5
+    assert result.returncode == 0 and sorted(lines[:4]) == [f"[{i}] done {i}" for i in range(1, 5)]
+    assert lines[-1] == "/par: 4/4 succeeded"
+    print("✅ Items run concurrently with prefixed output")
+
+    result, lines = run_fanout("printf 'a\\nb\\nc\\n' | /par -j 1 'test {} != b'", ".")
+    assert result.returncode == 1 and "[b] exited with code 1" in lines
+    assert lines[-1] == "/par: 2/3 succeeded, 1 failed"
+    print("✅ Failed inputs reported with their exit codes")
+
+    fanout = parallel.parse("/par -j 1 sleep ::: 5 5 5", ".")
+    handle = get_core().submit_call(fanout.run, get_core(), lambda stream, text: None)
+    time.sleep(0.3)
+    fanout.cancel()
+    result = handle.result(timeout=5)
+    assert result.cancelled and result.returncode == 3
+    print("✅ Cancelling stops the running items and starts no more")
+
+if __name__ == "__main__":
+    test_parse()
+    test_run()
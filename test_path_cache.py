@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Test script for MagicShell cached path completion
+"""
+
+import sys
+import os
+import tempfile
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+import path_cache
+from path_cache import DirectoryCache
+
+def age(path, seconds=10):
+    """Move a directory's mtime into the past so its listing is not racy"""
+    old = time.time() - seconds
+    os.utime(path, (old, old))
+
+def test_path_cache():
+    """Test listing reuse, invalidation, the scan cap and completion of the last word"""
+    print("📁 Testing MagicShell Path Cache")
+    print("=" * 40)
+
+    scans = []
+    scan = path_cache.scan
+    path_cache.scan = lambda d, m: scans.append(d) or scan(d, m)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ("alpha.txt", "alps.txt", ".hidden", "beta.txt"):
+                open(os.path.join(tmp, name), "w").close()
+            os.mkdir(os.path.join(tmp, "album"))
+            age(tmp)
+
+            cache = DirectoryCache(watch=False)
+            assert cache.complete(tmp, "al") == ["album/", "alpha.txt", "alps.txt"]
+            assert cache.complete(tmp, "") == ["album/", "alpha.txt", "alps.txt", "beta.txt"]
+            assert cache.complete(tmp, ".") == [".hidden"]
+            assert len(scans) == 1
+            print("✅ One scan answers every prefix")
+
+            cached = cache.listing(tmp)
+            cache._listings[tmp] = cached._replace(checked=0.0)
+            cache.complete(tmp, "b")
+            assert len(scans) == 1
+            open(os.path.join(tmp, "bravo.txt"), "w").close()
+            age(tmp, 5)
+            cache._listings[tmp] = cache.listing(tmp)._replace(checked=0.0)
+            assert cache.complete(tmp, "b") == ["beta.txt", "bravo.txt"] and len(scans) == 2
+            print("✅ Listing rescanned only after the mtime changed")
+
+            capped = DirectoryCache(max_entries=3, watch=False)
+            listing = capped.listing(tmp)
+            assert listing.truncated and len(listing.names) == 3
+            print("✅ Scan stops at the entry cap")
+
+            watched = DirectoryCache()
+            if watched._watcher is not None:
+                assert watched.complete(tmp, "c") == []
+                open(os.path.join(tmp, "charlie.txt"), "w").close()
+                deadline = time.time() + 5
+                while tmp in watched._listings and time.time() < deadline:
+                    time.sleep(0.01)
+                assert watched.complete(tmp, "c") == ["charlie.txt"]
+                print("✅ inotify drops a listing when an entry is created")
+
+                for name in ("a", "b", "c"):
+                    os.mkdir(os.path.join(tmp, "dir_" + name))
+                    watched.complete(os.path.join(tmp, "dir_" + name), "")
+                assert {os.path.join(tmp, "dir_" + name) for name in "abc"} <= set(watched._watcher._dirs)
+                watched.invalidate(os.path.join(tmp, "dir_a"))
+                watched.clear()
+                assert watched._watcher._dirs == {}
+                assert watched.complete(tmp, "c") == ["charlie.txt"] and list(watched._watcher._dirs) == [tmp]
+                print("✅ Invalidated listings give up their inotify watch")
+
+    finally:
+        path_cache.scan = scan
+
+if __name__ == "__main__":
+    test_path_cache()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Test script for MagicShell native pipeline parsing and execution
+"""
+
+import sys
+import os
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from exec_core import get_core
+from pipeline import parse, stages
+
+def run(command, **kwargs):
+    chunks = []
+    result = get_core().run(command, on_output=chunks.append, **kwargs)
+    return result.returncode, "".join(c.text for c in chunks)
+
+def test_parse():
+    """Test which lines are parsed natively and which need /bin/sh"""
+    print("🔗 Testing MagicShell Pipeline Parser")
+    print("=" * 40)
+
+    plan = parse("cat < in.txt | sort -r >> 'out file' && echo ok || echo \"not ok\"; ls")
+    assert [connector for connector, _ in plan] == [None, "&&", "||", ";"]
+    first = plan[0][1]
+    assert [stage.argv for stage in first] == [["cat"], ["sort", "-r"]]
+    assert [(r.op, r.target) for r in first[0].redirects] == [("<", "in.txt")]
+    assert [(r.op, r.target) for r in first[1].redirects] == [(">>", "out file")]
+    assert plan[2][1][0].argv == ["echo", "not ok"]
+    print("✅ Pipes, redirections, separators and quotes parsed")
+
+    for line in ["echo $HOME", "ls *.py", "FOO=1 ls", "cd /tmp && ls", "ls 2>/dev/null",
+                 "sleep 1 &", "(ls)", "ls |", "cat <<EOF", "no-such-program-here", "ls >",
+                 "echo hi && true"]:
+        assert parse(line) is None, line
+    print("✅ Unsupported syntax falls back to the shell")
+
+    assert stages("ls|rm -rf x; sudo reboot") == [["ls"], ["rm", "-rf", "x"], ["sudo", "reboot"]]
+    print("✅ Stages split for safety checks")
+
+def test_native_execution():
+    """Test that parsed lines run correctly without /bin/sh"""
+    with tempfile.TemporaryDirectory() as tmp:
+        assert run("printf 'b\\na\\nb\\n' | sort | uniq -c > counts.txt", cwd=tmp) == (0, "")
+        assert run("echo more >> counts.txt; wc -l < counts.txt", cwd=tmp) == (0, "3\n")
+        print("✅ Pipes and file redirections work")
+
+        assert run("grep -q x /dev/null && echo no || echo yes") == (0, "yes\n")
+        assert run("ls / | grep -q no-such-entry")[0] == 1
+        print("✅ Exit status follows the last stage and connectors")
+
+        rc, output = run("cat < missing.txt", cwd=tmp)
+        assert rc == 1 and output == "magicshell: missing.txt: No such file or directory\n"
+        print("✅ Redirection errors reported")
+
+    result = get_core().run("sleep 5 | cat", timeout=0.2)
+    assert result.timed_out and result.returncode != 0
+    print("✅ Timeout stops every stage")
+
+if __name__ == "__main__":
+    test_parse()
+    test_native_execution()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Test script for the MagicShell completion prefix index
+"""
+
+import sys
+import os
+import random
+import string
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from prefix_index import PrefixIndex
+
+def test_prefix_index():
+    """Test prefix search, incremental updates and search time"""
+    print("🔤 Testing MagicShell Prefix Index")
+    print("=" * 40)
+
+    index = PrefixIndex(["git", "git status", "Git-lfs", "grep", "gzip", "git status"])
+    assert len(index) == 5
+    assert index.search("GIT") == ["git", "git status", "Git-lfs"]
+    assert index.search("git s") == ["git status"]
+    assert index.search("g", limit=2) == ["git", "git status"]
+    assert index.search("hg") == [] and index.search("zz") == []
+    print("✅ Case-insensitive prefix search in sorted order")
+
+    assert index.add("git stash") and not index.add("git stash")
+    assert index.search("git st") == ["git stash", "git status"]
+    index.discard("gzip")
+    assert "gzip" not in index and "grep" in index
+    print("✅ Entries added and removed incrementally")
+
+    rng = random.Random(7)
+    words = ["".join(rng.choice(string.ascii_lowercase + " -") for _ in range(rng.randint(2, 30)))
+             for _ in range(20000)]
+    index = PrefixIndex(words)
+    prefixes = [word[:rng.randint(1, 4)] for word in words[:1000]]
+    start = time.perf_counter()
+    for prefix in prefixes:
+        matches = index.search(prefix, limit=50)
+        assert matches and all(m.lower().startswith(prefix) for m in matches)
+    per_search_ms = (time.perf_counter() - start) * 1000 / len(prefixes)
+    assert per_search_ms < 1, per_search_ms
+    print(f"✅ {per_search_ms:.3f} ms per search over {len(index)} entries")
+
+if __name__ == "__main__":
+    test_prefix_index()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Test script for the MagicShell result cache
+"""
+
+import sys
+import os
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from exec_core import get_core
+import result_cache
+from result_cache import ResultCache, split_bypass
+
+def run(command, cwd, cache):
+    chunks = []
+    result = get_core().run(command, cwd=cwd, cache=cache, on_output=chunks.append)
+    return result.cached, "".join(c.text for c in chunks)
+
+def test_result_cache():
+    """Test hits, invalidation and what is never cached"""
+    print("🗄️ Testing MagicShell Result Cache")
+    print("=" * 40)
+
+    racy_window = result_cache.RACY_WINDOW
+    result_cache.RACY_WINDOW = 0  # files here are seconds old at most
+    try:
+        cache = ResultCache({"ls": "entries", "du": "tree"})
+        with tempfile.TemporaryDirectory() as tmp:
+            os.mkdir(os.path.join(tmp, "sub"))
+            with open(os.path.join(tmp, "sub", "f"), "w") as f:
+                f.write("x")
+
+            first = run("ls -l sub", tmp, cache)
+            assert first[0] is False
+            assert run("ls -l sub", tmp, cache) == (True, first[1])
+            assert run("ls -l", tmp, cache)[0] is False  # another command line is another key
+            print("✅ Repeated commands answered from the cache")
+
+            with open(os.path.join(tmp, "sub", "f"), "a") as f:
+                f.write("more")
+            cached, output = run("ls -l sub", tmp, cache)
+            assert not cached and output != first[1]
+            assert run("du -s .", tmp, cache)[0] is False and run("du -s .", tmp, cache)[0] is True
+            os.mkdir(os.path.join(tmp, "sub", "deeper"))
+            assert run("du -s .", tmp, cache)[0] is False
+            print("✅ Changed files invalidate cached output")
+
+            for command in ["ls sub | cat", "ls sub > out.txt", "ls missing", "cat sub/f"]:
+                run(command, tmp, cache)
+                assert run(command, tmp, cache)[0] is False, command
+            print("✅ Pipelines, redirections, failures and other commands run every time")
+
+        assert split_bypass("/nocache ls -l") == (True, "ls -l")
+        assert split_bypass("ls /nocache") == (False, "ls /nocache")
+        print("✅ /nocache bypasses the cache")
+    finally:
+        result_cache.RACY_WINDOW = racy_window
+
+if __name__ == "__main__":
+    test_result_cache()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Test script for the MagicShell persistent shell session
+"""
+
+import sys
+import os
+import signal
+import tempfile
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+import shell_session
+from shell_session import PersistentShell
+
+def test_shell_session():
+    """Test output up to the sentinel, exit codes, and state kept between commands"""
+    print("🐚 Testing MagicShell Persistent Shell")
+    print("=" * 40)
+
+    if not PersistentShell.available() or not hasattr(os, "openpty"):
+        print("⚠️ No bash or pty here, skipped")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = os.path.realpath(tmp)
+        os.mkdir(os.path.join(tmp, "sub"))
+        shell = PersistentShell(tmp)
+        try:
+            output, rc, timed_out = shell.run("echo hello; echo world")
+            assert (output, rc, timed_out) == ("hello\nworld\n", 0, False)
+            pid = shell.proc.pid
+            chunks = []
+            assert shell.run("printf 'no newline'", on_output=chunks.append) == ("", 0, False)
+            assert "".join(chunks) == "no newline"
+            assert shell._marker not in output + "".join(chunks)
+            print("✅ Output ends at the PROMPT_COMMAND sentinel")
+
+            assert shell.run("false")[1] == 1
+            assert shell.run("(exit 42)")[1] == 42
+            assert shell.run("ls /missing/dir >/dev/null 2>&1")[1] == 2
+            assert shell.run("true")[1] == 0
+            print("✅ Exit codes come from the sentinel")
+
+            shell.run("cd sub")
+            assert shell.cwd == os.path.join(tmp, "sub")
+            assert shell.run("pwd")[:2] == (os.path.join(tmp, "sub") + "\n", 0)
+            shell.run("export MAGICSHELL_TEST=kept; greet() { echo hi $1; }")
+            assert shell.run("echo $MAGICSHELL_TEST; greet there")[0] == "kept\nhi there\n"
+            assert shell.run("pwd", cwd=tmp)[0] == tmp + "\n"
+            assert shell.proc.pid == pid
+            print("✅ cd, exports and functions carry over in one bash")
+
+            start = time.monotonic()
+            output, rc, timed_out = shell.run("sleep 20", timeout=0.5)
+            assert rc == 130 and timed_out and time.monotonic() - start < 5
+            assert shell.run("echo after")[0] == "after\n" and shell.proc.pid == pid
+            assert shell.run("exit 3")[1] == 3 and not shell.alive
+            assert shell.run("echo again") == ("again\n", 0, False) and shell.proc.pid != pid
+            print("✅ Timeouts interrupt the command, exit starts a new session")
+
+            grace, shell_session.INTERRUPT_GRACE = shell_session.INTERRUPT_GRACE, 0.3
+            try:
+                pid = shell.proc.pid
+                result = shell.run("(trap '' INT; exec sleep 20)", timeout=0.3)
+                assert result[1:] == (128 + signal.SIGTERM, True) and shell.proc.pid == pid
+                result = shell.run("trap '' INT TERM; while :; do :; done", timeout=0.3)
+                assert result.returncode == -signal.SIGKILL and result.timed_out and not shell.alive
+                assert shell.run("echo back") == ("back\n", 0, False) and shell.proc.pid != pid
+            finally:
+                shell_session.INTERRUPT_GRACE = grace
+            print("✅ Commands that ignore SIGINT get SIGTERM, then SIGKILL and a new session")
+        finally:
+            shell.close()
+
+if __name__ == "__main__":
+    test_shell_session()